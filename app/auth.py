@@ -6,15 +6,22 @@ from hashlib import sha256
 from math import ceil
 from . import db
 from .models import TempToken, AuthToken
+from .services.metrics_service import auth_checks, http_request_duration
+from werkzeug.exceptions import HTTPException
 import jwt
+import logging
 import os
 import qrcode
 import io
 import base64
 import secrets
 import string
+import time
 from . import get_current_time
 
+# Hot path: per-request lines are DEBUG and rate limited (see logging_setup)
+logger = logging.getLogger('app.auth')
+
 # JWT Configuration
 SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key')
 
@@ -141,19 +148,19 @@ def check_and_renew_token(token):
         exp_date = datetime.fromtimestamp(payload['exp'])
         remaining_days = (exp_date - datetime.utcnow()).days
 
-        current_app.logger.info(f"[AUTH-TOKEN] Checking token expiration: {remaining_days} days remaining")
+        logger.debug("[AUTH-TOKEN] Checking token expiration: %s days remaining", remaining_days)
 
         if remaining_days < 30:
             # Verify token before renewal
             verified_payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
             auth_result = renew_auth_token(token, verified_payload)
-            current_app.logger.info(f"[AUTH-TOKEN] Renewed token with {remaining_days} days remaining")
+            logger.info("[AUTH-TOKEN] Renewed token with %s days remaining", remaining_days)
             return auth_result
 
         return None
         
     except jwt.InvalidTokenError:
-        current_app.logger.error("[AUTH-TOKEN] Invalid token during renewal check")
+        logger.error("[AUTH-TOKEN] Invalid token during renewal check")
         return None
     except Exception as e:
         current_app.logger.error(f"[AUTH-TOKEN] Error during renewal check: {str(e)}")
@@ -202,10 +209,28 @@ def invalidate_all_tokens_for_bus(walking_bus_id, reason="Password changed"):
     db.session.commit()
 
 
+def timed_view(f, started, *args, **kwargs):
+    """Run the view and record its latency (including the auth check) per endpoint and status"""
+    status = 500
+    try:
+        response = current_app.make_response(f(*args, **kwargs))
+        status = response.status_code
+        return response
+    except HTTPException as e:
+        status = e.code
+        raise
+    finally:
+        http_request_duration.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint, method=request.method, status=status
+        )
+
+
 def require_auth(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        current_app.logger.info("[AUTH] Starting authentication check")
+        logger.debug("[AUTH] Starting authentication check for %s", request.endpoint)
+        started = time.perf_counter()
         
         # 1. Check cookie first (new primary method)
         token = request.cookies.get('auth_token')
@@ -217,21 +242,23 @@ def require_auth(f):
         # 3. Check session as fallback (legacy support, temporary solution for smooth transition from v1.02b)
         if not token and 'auth_token' in session:
             token = session['auth_token']
-            current_app.logger.info("[AUTH] Using legacy token from session")
+            logger.debug("[AUTH] Using legacy token from session")
             
         if not token:
-            current_app.logger.warning("[AUTH] No token found in cookies or headers")
+            logger.warning("[AUTH] No token found in cookies or headers")
+            auth_checks.inc(result='missing')
             return jsonify({"error": "No token provided", "redirect": True}), 401
 
         try:
-            current_app.logger.debug(f"[AUTH] Verifying token: {token[:10]}...")
+            logger.debug("[AUTH] Verifying token: %s...", token[:10])
             payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            current_app.logger.info("[AUTH] Token signature verified successfully")
+            logger.debug("[AUTH] Token signature verified successfully")
 
             # Database verification
             token_record = AuthToken.query.get(token)
             if not token_record or not token_record.is_active:
-                current_app.logger.warning(f"[AUTH] Token invalid or inactive. Record exists: {bool(token_record)}")
+                logger.warning("[AUTH] Token invalid or inactive. Record exists: %s", bool(token_record))
+                auth_checks.inc(result='revoked')
                 return jsonify({"error": "Token invalid or revoked", "redirect": True}), 401
 
             # Walking bus verification
@@ -239,10 +266,10 @@ def require_auth(f):
             token_identifier = payload.get('token_identifier')
             buses_env = os.environ.get('WALKING_BUSES', '').strip()
             
-            current_app.logger.info(f"[AUTH] Processing walking bus ID: {walking_bus_id}")
+            logger.debug("[AUTH] Processing walking bus ID: %s", walking_bus_id)
 
             if buses_env:
-                current_app.logger.debug("[AUTH] Multi-bus mode detected")
+                logger.debug("[AUTH] Multi-bus mode detected")
                 bus_configs = dict(
                     (int(b.split(':')[0]), get_consistent_hash(b.split(':')[2]))
                     for b in buses_env.split(',')
@@ -250,13 +277,15 @@ def require_auth(f):
                 )
 
                 if walking_bus_id not in bus_configs:
-                    current_app.logger.error(f"[AUTH] Invalid bus ID: {walking_bus_id}")
+                    logger.error("[AUTH] Invalid bus ID: %s", walking_bus_id)
                     invalidate_all_tokens_for_bus(walking_bus_id, "Invalid bus ID")
+                    auth_checks.inc(result='invalid_bus')
                     return jsonify({"error": "Invalid bus ID", "redirect": True}), 401
 
                 if payload.get('bus_password_hash') != bus_configs[walking_bus_id]:
-                    current_app.logger.warning("[AUTH] Password hash mismatch detected")
+                    logger.warning("[AUTH] Password hash mismatch detected")
                     invalidate_all_tokens_for_bus(walking_bus_id, "Password changed")
+                    auth_checks.inc(result='password_changed')
                     return jsonify({
                         "error": "Password changed",
                         "code": "PASSWORD_CHANGED",
@@ -264,13 +293,14 @@ def require_auth(f):
                     }), 401
 
                 if token_identifier != token_record.token_identifier:
-                    current_app.logger.warning("[AUTH] Token identifier mismatch")
+                    logger.warning("[AUTH] Token identifier mismatch")
                     token_record.invalidate("Token identifier mismatch")
                     db.session.commit()
+                    auth_checks.inc(result='identifier_mismatch')
                     return jsonify({"error": "Invalid token", "redirect": True}), 401
 
             # Update session and token usage
-            current_app.logger.info("[AUTH] Updating session and token information")
+            logger.debug("[AUTH] Updating session and token information")
             token_record.last_used = datetime.now()
             session.update({
                 'auth_token': token,
@@ -281,26 +311,30 @@ def require_auth(f):
             })
             
             db.session.commit()
-            current_app.logger.info("[AUTH] Authentication successful")
-            return f(*args, **kwargs)
+            logger.debug("[AUTH] Authentication successful")
+            auth_checks.inc(result='ok')
+            return timed_view(f, started, *args, **kwargs)
 
         except jwt.ExpiredSignatureError:
-            current_app.logger.warning("[AUTH] Token expired")
+            logger.warning("[AUTH] Token expired")
             if token_record:
                 token_record.invalidate("Token expired")
                 db.session.commit()
+            auth_checks.inc(result='expired')
             return jsonify({"error": "Token expired", "redirect": True}), 401
 
         except jwt.InvalidTokenError:
-            current_app.logger.warning("[AUTH] Invalid token structure or signature")
+            logger.warning("[AUTH] Invalid token structure or signature")
             if token_record:
                 token_record.invalidate("Invalid token")
                 db.session.commit()
+            auth_checks.inc(result='invalid')
             return jsonify({"error": "Invalid token", "redirect": True}), 401
 
         except Exception as e:
-            current_app.logger.error(f"[AUTH] Unexpected error during authentication: {str(e)}", exc_info=True)
+            logger.error("[AUTH] Unexpected error during authentication: %s", e, exc_info=True)
             db.session.rollback()
+            auth_checks.inc(result='error')
             return jsonify({"error": "Authentication error", "redirect": True}), 401
 
     return decorated_function
@@ -0,0 +1,274 @@
+from flask.cli import AppGroup
+from datetime import datetime, timedelta, time
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from sqlalchemy import insert
+from .models import (
+    db, WalkingBus, Station, Participant, ParticipationRule,
+    CalendarStatus, WalkingBusSchedule, WalkingBusOverride,
+    DailyNote, AuthToken, PushSubscription,
+    WeatherCalculation, PushNotificationLog, PushDeliveryStats,
+    SchedulerJob, TempToken
+)
+from . import get_current_time, get_current_date, TIMEZONE
+import base64
+import click
+import random
+import secrets
+
+synth_cli = AppGroup('synth', help='Synthetische Testdaten für Benchmarks und lokale Entwicklung')
+
+SYNTH_BUS_PREFIX = 'Synth Bus'
+SCHOOL_DAYS_MASK = 0b0011111  # Montag bis Freitag
+
+FIRST_NAMES = [
+    'Emma', 'Mia', 'Hannah', 'Sophia', 'Lina', 'Ella', 'Clara', 'Lea', 'Marie', 'Leonie',
+    'Noah', 'Ben', 'Paul', 'Leon', 'Finn', 'Elias', 'Felix', 'Jonas', 'Luis', 'Emil',
+    'Mila', 'Frieda', 'Ida', 'Greta', 'Anton', 'Theo', 'Henry', 'Karl', 'Oskar', 'Jakob'
+]
+STREETS = [
+    'Schulstraße', 'Lindenweg', 'Am Markt', 'Bahnhofstraße', 'Kirchplatz', 'Gartenweg',
+    'Birkenallee', 'Mühlenweg', 'Rosenstraße', 'Parkstraße', 'Feldweg', 'Ahornring'
+]
+USER_AGENTS = [
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 Chrome/126.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/126.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15 Version/17.5 Safari/605.1.15'
+]
+PUSH_ORIGINS = [
+    'https://fcm.googleapis.com/fcm/send/',
+    'https://web.push.apple.com/',
+    'https://updates.push.services.mozilla.com/wpush/v2/'
+]
+WEATHER_ICONS = ['01d', '02d', '03d', '04d', '09d', '10d', '13d']
+
+# Tables of a walking bus in delete order (children first)
+BUS_TABLES = [
+    PushDeliveryStats, PushNotificationLog, PushSubscription, SchedulerJob,
+    WeatherCalculation, CalendarStatus, ParticipationRule, Participant, Station,
+    WalkingBusOverride, DailyNote, WalkingBusSchedule, TempToken
+]
+
+
+def synth_bus_ids():
+    return [bus.id for bus in WalkingBus.query.filter(WalkingBus.name.like(f'{SYNTH_BUS_PREFIX}%'))]
+
+
+def delete_buses(bus_ids):
+    """Remove walking buses with everything that references them"""
+    if not bus_ids:
+        return
+    for model in BUS_TABLES:
+        model.query.filter(model.walking_bus_id.in_(bus_ids)).delete(synchronize_session=False)
+    # Tokens last, subscriptions reference them
+    AuthToken.query.filter(AuthToken.walking_bus_id.in_(bus_ids)).delete(synchronize_session=False)
+    WalkingBus.query.filter(WalkingBus.id.in_(bus_ids)).delete(synchronize_session=False)
+
+
+def push_keys():
+    """A valid p256dh/auth pair, as a browser would send it"""
+    public_key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962,
+        serialization.PublicFormat.UncompressedPoint
+    )
+    auth = secrets.token_bytes(16)
+    return tuple(base64.urlsafe_b64encode(raw).rstrip(b'=').decode() for raw in (public_key, auth))
+
+
+def random_weekday_mask(rng):
+    # Most children walk every school day, some skip one or two days
+    mask = SCHOOL_DAYS_MASK
+    if rng.random() < 0.3:
+        for day in rng.sample(range(5), rng.randint(1, 2)):
+            mask &= ~(1 << day)
+    return mask
+
+
+def generate_bus(rng, bus_id, stations, participants, days, override_rate, subscriptions):
+    today = get_current_date()
+    history_start = today - timedelta(days=days)
+
+    bus = WalkingBus(id=bus_id, name=f'{SYNTH_BUS_PREFIX} {bus_id}', password=f'synth-{bus_id}')
+    db.session.add(bus)
+    db.session.add(WalkingBusSchedule(walking_bus_id=bus_id, weekday_mask=SCHOOL_DAYS_MASK))
+
+    station_rows = []
+    for position in range(stations):
+        arrival = datetime.combine(today, time(7, 20)) + timedelta(minutes=3 * position)
+        station_rows.append(Station(
+            walking_bus_id=bus_id,
+            name=f'{rng.choice(STREETS)} {rng.randint(1, 80)}',
+            position=position,
+            arrival_time=arrival.time()
+        ))
+    db.session.add_all(station_rows)
+    db.session.flush()
+
+    participant_rows = []
+    for station in station_rows:
+        for position in range(participants):
+            participant_rows.append(Participant(
+                walking_bus_id=bus_id,
+                station_id=station.id,
+                name=f'{rng.choice(FIRST_NAMES)} {chr(65 + rng.randrange(26))}.',
+                position=position,
+                weekday_mask=random_weekday_mask(rng),
+                status_today=True,
+                status_initialized_date=get_current_time().replace(tzinfo=None)
+            ))
+    db.session.add_all(participant_rows)
+    db.session.flush()
+
+    # Weekly rules since the start of the history, some change their pattern midway
+    rules = []
+    for participant in participant_rows:
+        if rng.random() < 0.1:
+            switch = history_start + timedelta(days=rng.randint(1, max(days, 1)))
+            rules.append(dict(walking_bus_id=bus_id, participant_id=participant.id,
+                              weekday_mask=random_weekday_mask(rng),
+                              valid_from=history_start, valid_until=switch - timedelta(days=1)))
+            rules.append(dict(walking_bus_id=bus_id, participant_id=participant.id,
+                              weekday_mask=participant.weekday_mask, valid_from=switch, valid_until=None))
+        else:
+            rules.append(dict(walking_bus_id=bus_id, participant_id=participant.id,
+                              weekday_mask=participant.weekday_mask, valid_from=history_start, valid_until=None))
+    db.session.execute(insert(ParticipationRule), rules)
+
+    # Sparse overrides over the past and coming days, attendance for the past
+    entries = []
+    for offset in range(-days, days + 1):
+        day = today + timedelta(days=offset)
+        if not SCHOOL_DAYS_MASK >> day.weekday() & 1:
+            continue
+        for participant in participant_rows:
+            override = rng.random() < override_rate
+            status = (not participant.is_active_on(day)) if override else participant.is_active_on(day)
+            attended = offset < 0 and status and rng.random() < 0.95
+            if override or attended:
+                entries.append(dict(walking_bus_id=bus_id, participant_id=participant.id, date=day,
+                                    status=status, is_manual_override=override, attendance=attended))
+    if entries:
+        db.session.execute(insert(CalendarStatus), entries)
+
+    for offset in rng.sample(range(1, days + 1), min(2, days)):
+        db.session.add(WalkingBusOverride(walking_bus_id=bus_id, date=today + timedelta(days=offset),
+                                          is_active=False, reason='Wandertag'))
+    for offset in rng.sample(range(0, days + 1), min(3, days + 1)):
+        db.session.add(DailyNote(walking_bus_id=bus_id, date=today + timedelta(days=offset),
+                                 note='Bitte an Warnwesten denken'))
+
+    # Devices: one auth token per subscription, following one or two children
+    for _ in range(subscriptions):
+        token_identifier = secrets.token_hex(32)
+        user_agent = rng.choice(USER_AGENTS)
+        db.session.add(AuthToken(
+            id=f'synth-{token_identifier}',
+            walking_bus_id=bus_id,
+            token_identifier=token_identifier,
+            client_info=user_agent,
+            is_pwa_installed=rng.random() < 0.7
+        ))
+        p256dh, auth = push_keys()
+        children = rng.sample(participant_rows, min(rng.choice([1, 1, 2]), len(participant_rows)))
+        db.session.add(PushSubscription(
+            walking_bus_id=bus_id,
+            token_identifier=token_identifier,
+            endpoint=rng.choice(PUSH_ORIGINS) + secrets.token_urlsafe(48),
+            p256dh=p256dh,
+            auth=auth,
+            participant_ids=[child.id for child in children]
+        ))
+
+    for offset in range(7):
+        db.session.add(WeatherCalculation(
+            walking_bus_id=bus_id,
+            date=today + timedelta(days=offset),
+            icon=rng.choice(WEATHER_ICONS),
+            precipitation=round(max(rng.gauss(0.3, 0.8), 0), 2),
+            pop=round(rng.random(), 2),
+            calculation_type='hourly'
+        ))
+
+    return len(participant_rows), len(entries)
+
+
+def generate_weather(rng):
+    """One fetch worth of minutely, hourly and daily series for the configured location"""
+    from .services.weather_service import WeatherService
+
+    service = WeatherService()
+    fetched_at = get_current_time()
+    now = int(fetched_at.timestamp()) // 60 * 60
+    noon = datetime.combine(get_current_date(), time(12), tzinfo=TIMEZONE)
+
+    def entries(count, step, icons=True):
+        return [
+            (now + index * step, round(max(rng.gauss(0.2, 0.6), 0), 2), round(rng.random(), 2),
+             rng.choice(WEATHER_ICONS) if icons else None)
+            for index in range(count)
+        ]
+
+    daily = [
+        (int((noon + timedelta(days=index)).timestamp()), round(max(rng.gauss(1, 2), 0), 2),
+         round(rng.random(), 2), rng.choice(WEATHER_ICONS))
+        for index in range(8)
+    ]
+    for forecast_type, series_entries in (
+        ('minutely', entries(61, 60, icons=False)),
+        ('hourly', entries(48, 3600)),
+        ('daily', daily)
+    ):
+        db.session.add(service._build_series(forecast_type, fetched_at, series_entries))
+
+
+@synth_cli.command('generate')
+@click.option('--buses', default=3, show_default=True, help='Anzahl Walking Busse')
+@click.option('--stations', default=8, show_default=True, help='Haltestellen je Bus')
+@click.option('--participants', default=6, show_default=True, help='Teilnehmer je Haltestelle')
+@click.option('--days', default=60, show_default=True, help='Tage Historie und Vorschau im Kalender')
+@click.option('--override-rate', default=0.1, show_default=True, help='Anteil manueller Abweichungen je Tag')
+@click.option('--subscriptions', default=20, show_default=True, help='Push-Abonnements je Bus')
+@click.option('--weather/--no-weather', default=True, show_default=True, help='Wetterreihen erzeugen')
+@click.option('--first-bus-id', default=1000, show_default=True, help='ID des ersten Busses')
+@click.option('--seed', default=42, show_default=True, help='Zufallsstartwert für reproduzierbare Daten')
+@click.option('--reset', is_flag=True, help='Vorher alle synthetischen Busse löschen')
+def generate(buses, stations, participants, days, override_rate, subscriptions, weather, first_bus_id, seed, reset):
+    """Erzeugt realistische Walking-Bus-Daten in konfigurierbarer Größe"""
+    rng = random.Random(seed)
+
+    if reset:
+        delete_buses(synth_bus_ids())
+
+    bus_ids = list(range(first_bus_id, first_bus_id + buses))
+    existing = WalkingBus.query.filter(WalkingBus.id.in_(bus_ids)).count()
+    if existing:
+        raise click.ClickException(f'{existing} Bus-IDs ab {first_bus_id} sind bereits belegt (--reset oder --first-bus-id)')
+
+    totals = {'participants': 0, 'calendar': 0}
+    for bus_id in bus_ids:
+        participant_count, calendar_count = generate_bus(
+            rng, bus_id, stations, participants, days, override_rate, subscriptions
+        )
+        totals['participants'] += participant_count
+        totals['calendar'] += calendar_count
+        click.echo(f'Bus {bus_id}: {participant_count} Teilnehmer, {calendar_count} Kalendereinträge')
+
+    if weather:
+        generate_weather(rng)
+    db.session.commit()
+
+    click.echo(
+        f"{buses} Busse, {buses * stations} Haltestellen, {totals['participants']} Teilnehmer, "
+        f"{totals['calendar']} Kalendereinträge, {buses * subscriptions} Abonnements erzeugt"
+    )
+    click.echo('WALKING_BUSES=' + ','.join(f'{bus_id}:{SYNTH_BUS_PREFIX} {bus_id}:synth-{bus_id}' for bus_id in bus_ids))
+
+
+@synth_cli.command('clear')
+def clear():
+    """Löscht alle synthetischen Busse samt Daten"""
+    bus_ids = synth_bus_ids()
+    delete_buses(bus_ids)
+    db.session.commit()
+    click.echo(f'{len(bus_ids)} synthetische Busse gelöscht')
@@ -0,0 +1,93 @@
+from datetime import date, time
+from decimal import Decimal
+from flask.json.provider import JSONProvider
+from functools import lru_cache
+import dataclasses
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Dict keys may be ints (grouped by bus or participant id), as with the stdlib encoder
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+
+def _default(obj):
+    """Types neither encoder handles on its own; date/time only reach this with the stdlib encoder"""
+    if isinstance(obj, (date, time)):
+        # datetime is a date subclass; isoformat() matches orjson's output
+        return obj.isoformat()
+    if isinstance(obj, (Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, 'tolist'):
+        # numpy arrays and scalars
+        return obj.tolist()
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps_bytes(obj):
+    """Compact UTF-8 JSON; date, time and datetime become ISO 8601 strings"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def dumps(obj):
+    return dumps_bytes(obj).decode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def sse_event(payload, event=None):
+    """
+    Encode a Server-Sent Event once, so the same bytes can go to every
+    subscriber. payload is a JSON-serializable object or an already
+    encoded JSON document (bytes, e.g. straight from Redis pub/sub).
+    """
+    data = payload if isinstance(payload, bytes) else dumps_bytes(payload)
+    if event:
+        return b'event: ' + event.encode() + b'\ndata: ' + data + b'\n\n'
+    return b'data: ' + data + b'\n\n'
+
+
+@lru_cache(maxsize=4)
+def time_update_event(current_time):
+    """Minute tick of /stream, identical for all clients of a worker"""
+    return sse_event({'type': 'time_update', 'time': current_time})
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSON provider of the app: orjson if installed, else the stdlib encoder.
+    Unlike Flask's default provider, dates are ISO 8601 instead of HTTP
+    dates, time objects are supported and keys keep their insertion order.
+    """
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Explicit encoder options (indent, sort_keys, ...) only work with the stdlib
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('ensure_ascii', False)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
@@ -0,0 +1,190 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from datetime import datetime, timezone
+from flask.logging import default_handler
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+FILE_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# Subsystem loggers of the hot paths, levels via LOG_LEVELS="auth=WARNING,push=DEBUG"
+SUBSYSTEMS = {
+    'auth': 'app.auth',
+    'push': 'app.push',
+    'calendar': 'app.calendar',
+    'sql': 'app.sql'
+}
+# Records below WARNING of these subsystems are rate limited per message template
+RATE_LIMITED_SUBSYSTEMS = ('auth', 'push', 'calendar')
+
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line (LOG_FORMAT=json)"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `limit` records per message template and `interval` seconds
+    through; WARNING and above always pass. The number of dropped records is
+    attached to the next record that passes (record.suppressed).
+    """
+
+    def __init__(self, limit, interval=60.0):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.limit <= 0:
+            return True
+
+        # %-style messages: the template is the same for every call site
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, count = now, 0
+            if count >= self.limit:
+                self._windows[key] = (started, count, suppressed + 1)
+                return False
+            self._windows[key] = (started, count + 1, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f'{record.msg} (+{suppressed} ähnliche unterdrückt)' if isinstance(record.msg, str) else record.msg
+        return True
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    QueueHandler whose listener runs in the process that logs. With
+    gunicorn --preload the listener thread of the master does not survive
+    the fork, so every worker starts its own on the first record.
+    """
+
+    def __init__(self, handlers):
+        super().__init__(queue.SimpleQueue())
+        self.handlers = handlers
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.SimpleQueue()
+            self._listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        super().enqueue(record)
+
+    def stop(self):
+        # Drains the queue before returning
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+
+def parse_levels(value):
+    """'auth=WARNING,push=DEBUG' -> {'auth': logging.WARNING, 'push': logging.DEBUG}"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        name, _, level = item.partition('=')
+        level = logging.getLevelName(level.strip().upper())
+        if isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+
+def build_handlers(formatter):
+    handlers = []
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    handlers.append(console_handler)
+
+    log_file = os.getenv('LOG_FILE', 'logs/walking_bus.log')
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        file_handler = RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024)),
+            backupCount=int(os.getenv('LOG_FILE_BACKUPS', 10))
+        )
+        file_handler.setFormatter(formatter if isinstance(formatter, JsonFormatter) else logging.Formatter(FILE_FORMAT))
+        handlers.append(file_handler)
+
+    return handlers
+
+
+def configure_logging(app):
+    """
+    Route the app logger (and its app.* children) through a queue, console
+    and file output happen on a listener thread instead of the request.
+    Handlers are built once per process, create_app may run several times.
+
+    LOG_LEVEL          base level (INFO)
+    LOG_LEVELS         per subsystem, e.g. auth=WARNING,push=DEBUG,calendar=DEBUG
+    LOG_FORMAT         text or json
+    LOG_RATE_LIMIT     records per message template and minute for auth, push
+                       and calendar below WARNING (20, 0 = unlimited)
+    LOG_FILE           log file ('' = console only), rotated at LOG_FILE_MAX_BYTES
+    """
+    global _queue_handler
+
+    base_level = logging.getLevelName(os.getenv('LOG_LEVEL', 'INFO').upper())
+    if not isinstance(base_level, int):
+        base_level = logging.INFO
+
+    if _queue_handler is None:
+        formatter = JsonFormatter() if os.getenv('LOG_FORMAT', 'text').lower() == 'json' else logging.Formatter(TEXT_FORMAT)
+        _queue_handler = BackgroundQueueHandler(build_handlers(formatter))
+
+    # Flask's default stderr handler would write synchronously next to the queue
+    app.logger.removeHandler(default_handler)
+    if _queue_handler not in app.logger.handlers:
+        app.logger.addHandler(_queue_handler)
+    app.logger.setLevel(base_level)
+    app.logger.propagate = False
+
+    levels = parse_levels(os.getenv('LOG_LEVELS'))
+    rate_limit = int(os.getenv('LOG_RATE_LIMIT', 20))
+    for subsystem, logger_name in SUBSYSTEMS.items():
+        subsystem_logger = logging.getLogger(logger_name)
+        subsystem_logger.setLevel(levels.get(subsystem, logging.NOTSET))
+        if subsystem in RATE_LIMITED_SUBSYSTEMS and not any(
+                isinstance(f, RateLimitFilter) for f in subsystem_logger.filters):
+            subsystem_logger.addFilter(RateLimitFilter(rate_limit))
+
+    return _queue_handler
@@ -1,6 +1,38 @@
 from . import db
 from datetime import datetime, time, timedelta
-from . import get_current_time
+from sqlalchemy.dialects.postgresql import ARRAY, REAL
+from . import get_current_time, WEEKDAY_MAPPING
+
+
+class WeekdayMaskMixin:
+    """7-bit weekday mask (bit 0 = Montag ... bit 6 = Sonntag) with one boolean accessor per weekday"""
+    DEFAULT_WEEKDAY_MASK = 0
+
+    def _current_mask(self):
+        return self.weekday_mask if self.weekday_mask is not None else self.DEFAULT_WEEKDAY_MASK
+
+    def has_weekday(self, weekday):
+        """weekday: 0 = Montag ... 6 = Sonntag"""
+        return bool(self._current_mask() >> weekday & 1)
+
+    def set_weekday(self, weekday, active):
+        mask = self._current_mask()
+        self.weekday_mask = mask | (1 << weekday) if active else mask & ~(1 << weekday)
+
+    def is_active_on(self, day):
+        return self.has_weekday(day.weekday())
+
+
+def _weekday_flag(weekday):
+    return property(
+        lambda self: self.has_weekday(weekday),
+        lambda self, value: self.set_weekday(weekday, bool(value))
+    )
+
+
+# participant.monday, schedule.friday, ... keep working on top of the mask
+for _index, _name in WEEKDAY_MAPPING.items():
+    setattr(WeekdayMaskMixin, _name, _weekday_flag(_index))
 
 
 class WalkingBus(db.Model):
@@ -22,22 +54,20 @@ class Station(db.Model):
     name = db.Column(db.String(100), nullable=False)
     position = db.Column(db.Integer, nullable=False, default=0)  # Reihenfolge
     arrival_time = db.Column(db.Time, nullable=True) 
-    participants = db.relationship('Participant', backref='station', lazy=True, order_by='Participant.position')
+    # Lazy by default, listings use load_stations() (selectinload, two queries in total)
+    participants = db.relationship(
+        'Participant', backref='station', lazy=True, order_by='[Participant.position, Participant.id]'
+    )
 
 
-class Participant(db.Model):
+class Participant(WeekdayMaskMixin, db.Model):
     walking_bus_id = db.Column(db.Integer, db.ForeignKey('walking_bus.id'), nullable=False)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     position = db.Column(db.Integer, nullable=False, default=0)  # Reihenfolge innerhalb der Station
     station_id = db.Column(db.Integer, db.ForeignKey('station.id'), nullable=True)
-    monday = db.Column(db.Boolean, default=True)
-    tuesday = db.Column(db.Boolean, default=True)
-    wednesday = db.Column(db.Boolean, default=True)
-    thursday = db.Column(db.Boolean, default=True)
-    friday = db.Column(db.Boolean, default=True)
-    saturday = db.Column(db.Boolean, default=True)
-    sunday = db.Column(db.Boolean, default=True)
+    DEFAULT_WEEKDAY_MASK = 0b1111111  # Standard: nimmt an allen Tagen teil
+    weekday_mask = db.Column(db.SmallInteger, nullable=False, default=DEFAULT_WEEKDAY_MASK)
     status_today = db.Column(db.Boolean, default=True)  # True = gruen (nimmt teil)
     status_initialized_date = db.Column(db.DateTime)
 
@@ -53,8 +83,32 @@ class CalendarStatus(db.Model):
     
     participant = db.relationship('Participant', backref='calendar_entries')
 
+    __table_args__ = (
+        db.Index('ix_calendar_status_bus_date', 'walking_bus_id', 'date'),
+        # One row per participant and day, target of the set-based upserts
+        db.UniqueConstraint('participant_id', 'date', name='uq_calendar_status_participant_date'),
+    )
+
+
+class ParticipationRule(db.Model):
+    """Weekly participation pattern of a participant, valid for a date range"""
+    __tablename__ = 'participation_rule'
+    walking_bus_id = db.Column(db.Integer, db.ForeignKey('walking_bus.id'), nullable=False)
+    id = db.Column(db.Integer, primary_key=True)
+    participant_id = db.Column(db.Integer, db.ForeignKey('participant.id'), nullable=False)
+    weekday_mask = db.Column(db.SmallInteger, nullable=False)  # Bit 0 = Montag ... Bit 6 = Sonntag
+    valid_from = db.Column(db.Date, nullable=False)
+    valid_until = db.Column(db.Date, nullable=True)  # None = bis auf Weiteres
+
+    participant = db.relationship('Participant', backref='participation_rules')
+
+    __table_args__ = (
+        db.Index('ix_participation_rule_participant_from', 'participant_id', 'valid_from'),
+        db.Index('ix_participation_rule_bus', 'walking_bus_id'),
+    )
+
 
-class WalkingBusSchedule(db.Model):
+class WalkingBusSchedule(WeekdayMaskMixin, db.Model):
     walking_bus_id = db.Column(db.Integer, db.ForeignKey('walking_bus.id'), nullable=False)
     id = db.Column(db.Integer, primary_key=True)
     
@@ -62,34 +116,39 @@ class WalkingBusSchedule(db.Model):
     DEFAULT_START = time(7, 20)  # 07:20
     DEFAULT_END = time(8, 0)     # 08:00
 
-    monday = db.Column(db.Boolean, default=False)
+    weekday_mask = db.Column(db.SmallInteger, nullable=False, default=0)  # Aktive Wochentage
+
     monday_start = db.Column(db.Time, nullable=False, default=DEFAULT_START)
     monday_end = db.Column(db.Time, nullable=False, default=DEFAULT_END)
     
-    tuesday = db.Column(db.Boolean, default=False)
     tuesday_start = db.Column(db.Time, nullable=False, default=DEFAULT_START)
     tuesday_end = db.Column(db.Time, nullable=False, default=DEFAULT_END)
     
-    wednesday = db.Column(db.Boolean, default=False)
     wednesday_start = db.Column(db.Time, nullable=False, default=DEFAULT_START)
     wednesday_end = db.Column(db.Time, nullable=False, default=DEFAULT_END)
     
-    thursday = db.Column(db.Boolean, default=False)
     thursday_start = db.Column(db.Time, nullable=False, default=DEFAULT_START)
     thursday_end = db.Column(db.Time, nullable=False, default=DEFAULT_END)
     
-    friday = db.Column(db.Boolean, default=False)
     friday_start = db.Column(db.Time, nullable=False, default=DEFAULT_START)
     friday_end = db.Column(db.Time, nullable=False, default=DEFAULT_END)
     
-    saturday = db.Column(db.Boolean, default=False)
     saturday_start = db.Column(db.Time, nullable=False, default=DEFAULT_START)
     saturday_end = db.Column(db.Time, nullable=False, default=DEFAULT_END)
     
-    sunday = db.Column(db.Boolean, default=False)
     sunday_start = db.Column(db.Time, nullable=False, default=DEFAULT_START)
     sunday_end = db.Column(db.Time, nullable=False, default=DEFAULT_END)
 
+    def times_for(self, weekday):
+        """(start, end) of a weekday, 0 = Montag"""
+        name = WEEKDAY_MAPPING[weekday]
+        return getattr(self, f"{name}_start"), getattr(self, f"{name}_end")
+
+    def set_times(self, weekday, start, end):
+        name = WEEKDAY_MAPPING[weekday]
+        setattr(self, f"{name}_start", start)
+        setattr(self, f"{name}_end", end)
+
 
 class SchoolHoliday(db.Model):
     __tablename__ = 'school_holidays'
@@ -97,8 +156,13 @@ class SchoolHoliday(db.Model):
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
     name = db.Column(db.String(200), nullable=False)
+    subdivision = db.Column(db.String(10), nullable=False)
     last_update = db.Column(db.Date, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_school_holidays_subdivision_start', 'subdivision', 'start_date'),
+    )
+
 
 class WalkingBusOverride(db.Model):
     walking_bus_id = db.Column(db.Integer, db.ForeignKey('walking_bus.id'), nullable=False)
@@ -157,23 +221,29 @@ class AuthToken(db.Model):
         self.invalidated_at = datetime.now()
 
 
-class Weather(db.Model):
-    __tablename__ = 'weather'
-    
-    timestamp = db.Column(db.DateTime, primary_key=True)
-    forecast_type = db.Column(db.String(10), primary_key=True)
-    precipitation = db.Column(db.Float, default=0.0)
-    total_precipitation = db.Column(db.Float, nullable=True)
-    pop = db.Column(db.Float, nullable=True)
-    weather_icon = db.Column(db.String(50), nullable=True)
-    created_at = db.Column(db.DateTime, default=get_current_time)
+class WeatherSeries(db.Model):
+    """Kompakte Vorhersage: eine Zeile pro Standort, Abruf und Vorhersagetyp"""
+    __tablename__ = 'weather_series'
+
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(50), nullable=False)
+    fetched_at = db.Column(db.DateTime(timezone=True), nullable=False, default=get_current_time)
+    forecast_type = db.Column(db.String(10), nullable=False)  # 'minutely', 'hourly' or 'daily'
+    start_time = db.Column(db.DateTime(timezone=True), nullable=False)
+    end_time = db.Column(db.DateTime(timezone=True), nullable=False)
+    step_seconds = db.Column(db.Integer, nullable=False)
+    precipitation = db.Column(ARRAY(REAL), nullable=False)  # float4[], NaN = Lücke
+    pop = db.Column(ARRAY(REAL), nullable=False)
+    weather_icons = db.Column(ARRAY(db.String(50)), nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('location', 'forecast_type', 'fetched_at', name='uq_weather_series_fetch'),
+        db.Index('ix_weather_series_end_time', 'end_time'),
+    )
 
     def __repr__(self):
-        precipitation = (self.precipitation 
-                        if self.forecast_type == "minutely" 
-                        else self.total_precipitation)
-        return (f'<Weather {self.forecast_type} {self.timestamp}: '
-                f'{precipitation} mm/h>')
+        return (f'<WeatherSeries {self.forecast_type} {self.start_time} '
+                f'+{len(self.pop or [])}x{self.step_seconds}s>')
 
 
 class WeatherCalculation(db.Model):
@@ -225,20 +295,49 @@ class SchedulerJob(db.Model):
 
 
 class PushNotificationLog(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
+    """Append-only, range-partitioned by month on timestamp (see PushLogPartitionService)"""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     walking_bus_id = db.Column(db.Integer, db.ForeignKey('walking_bus.id'), nullable=False)
     subscription_id = db.Column(db.Integer, db.ForeignKey('push_subscription.id', ondelete='SET NULL'), nullable=True)
-    timestamp = db.Column(db.DateTime, default=get_current_time)
+    timestamp = db.Column(db.DateTime, primary_key=True, default=get_current_time)  # Partitionsschlüssel
     status_code = db.Column(db.Integer, nullable=True)
     error_message = db.Column(db.String(500), nullable=True)
     notification_type = db.Column(db.String(50))  # 'schedule', 'broadcast', etc.
     notification_data = db.Column(db.JSON)
     success = db.Column(db.Boolean, default=False)
     subscription_deleted_at = db.Column(db.DateTime, nullable=True)
+    fencing_token = db.Column(db.BigInteger, nullable=True)  # Lease-Token des sendenden Laufs
     
     # Relationships
     subscription = db.relationship('PushSubscription', backref='notification_logs')
 
+    __table_args__ = (
+        db.Index('ix_push_notification_log_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_push_notification_log_bus_timestamp', 'walking_bus_id', 'timestamp'),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+
+
+class PushDeliveryStats(db.Model):
+    """Daily delivery rollup, upserted together with the push log rows (see PushDeliveryRollup)"""
+    __tablename__ = 'push_delivery_stats'
+
+    walking_bus_id = db.Column(db.Integer, db.ForeignKey('walking_bus.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    notification_type = db.Column(db.String(50), primary_key=True)
+    platform = db.Column(db.String(20), primary_key=True)
+    status_code = db.Column(db.Integer, primary_key=True)  # 0 = kein Statuscode
+    sent = db.Column(db.Integer, nullable=False, default=0)
+    succeeded = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    paused = db.Column(db.Integer, nullable=False, default=0)
+    latency_sum_ms = db.Column(db.BigInteger, nullable=False, default=0)
+    latency_histogram = db.Column(ARRAY(db.Integer), nullable=False)  # Zähler je LATENCY_BUCKETS_MS
+
+    __table_args__ = (
+        db.Index('ix_push_delivery_stats_day', 'day'),
+    )
+
 
 class WalkingBusRoute(db.Model):
     """Walking Bus Routen für die Registrierungs-App"""
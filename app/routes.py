@@ -9,16 +9,25 @@ from flask import (
 from .models import (
     db, WalkingBus, Station, Participant, 
     CalendarStatus, WalkingBusSchedule, 
-    SchoolHoliday, WalkingBusOverride, 
+    WalkingBusOverride, 
     DailyNote, TempToken, AuthToken,
-    Weather, WeatherCalculation,
+    WeatherSeries, WeatherCalculation,
     PushSubscription, SchedulerJob,
-    PushNotificationLog
+    PushNotificationLog, ParticipationRule
 )
-from .services.holiday_service import HolidayService
+from .services.holiday_service import find_holiday
 from .services.weather_service import WeatherService
-from .services.push_service import PushService
-from . import get_current_time, get_current_date, TIMEZONE, WEEKDAY_MAPPING
+from .services.push_log_service import PushDeliveryStatsService
+from .services.scheduler_service import SchedulerMetricsService
+from .services.job_queue_service import DelayedJobQueue
+from .services.task_service import TaskService, FINAL_STATES
+from .services.query_stats_service import QueryStatsService
+from .services.metrics_service import metrics, sse_connections, pubsub_lag
+from .services.participation_service import ParticipationService
+from .services.batch_service import BatchService, BatchValidationError
+from .services.ordering_service import OrderingService, OrderValidationError
+from .services.change_event_service import emit_change
+from . import get_current_time, get_current_date, get_platform, TIMEZONE, WEEKDAY_MAPPING
 from . import get_git_revision
 from sqlalchemy.exc import SQLAlchemyError
 from .auth import (
@@ -33,11 +42,13 @@ from .auth import (
 )
 import jwt
 import json
+import logging
 import time
 import os
 from os import environ
 from .init_buses import init_walking_buses
 from . import redis_client
+from .json_provider import dumps_bytes, loads, sse_event, time_update_event
 from pywebpush import webpush, WebPushException
 from uuid import uuid4
 from urllib.parse import urlparse
@@ -45,6 +56,21 @@ from urllib.parse import urlparse
 # Create Blueprint
 bp = Blueprint("main", __name__)
 
+# Per-day lines of the calendar endpoints, DEBUG and rate limited (see logging_setup)
+calendar_logger = logging.getLogger('app.calendar')
+
+TEST_NOTIFICATION_DELAY = 120
+WEATHER_RECALCULATION_DELAY = 10
+PUSH_STATS_DEFAULT_DAYS = 30
+PUSH_STATS_MAX_DAYS = 730
+SUBSCRIPTION_LOG_PAGE_SIZE = 50
+SUBSCRIPTION_LOG_MAX_PAGE_SIZE = 200
+SUBSCRIPTION_LOG_BODY_PREVIEW = 300
+SUBSCRIPTION_LOG_OUTCOMES = ('sent', 'failed', 'skipped')
+SQL_STATS_ORDERS = ('avg_queries', 'max_queries', 'avg_db_ms', 'n_plus_one', 'requests')
+# Vacation mode (POST/DELETE /api/absences)
+ABSENCE_MAX_DAYS = 366
+
 @bp.route('/favicon.ico')
 def favicon():
     return send_from_directory('static/icons', 'favicon.ico')
@@ -78,7 +104,7 @@ def weather_database():
 @bp.route("/notifications")
 def notifications_view():
     walking_bus_id = get_current_walking_bus_id()
-    stations = Station.query.filter_by(walking_bus_id=walking_bus_id).order_by(Station.position).all()
+    stations = load_stations(walking_bus_id, Participant.id, Participant.name)
     
     # Add logging to verify data
     current_app.logger.info(f"[NOTIFICATIONS] Loading data for walking_bus_id: {walking_bus_id}")
@@ -86,153 +112,216 @@ def notifications_view():
     for station in stations:
         current_app.logger.info(f"[NOTIFICATIONS] Station {station.name} has {len(station.participants)} participants")
     
+    end_date = get_current_date()
+    delivery_stats = PushDeliveryStatsService(walking_bus_id).summary(
+        end_date - timedelta(days=PUSH_STATS_DEFAULT_DAYS - 1), end_date
+    )
+
     return render_template(
         "notifications.html",
-        stations=stations
+        stations=stations,
+        delivery_stats=delivery_stats
     )
 
-def get_platform(user_agent):
-    if not user_agent:
-        return 'Unknown'
-        
-    platforms = {
-        'Windows': 'Windows',
-        'Android': 'Android',
-        'iPhone': 'iOS',
-        'iPad': 'iOS',
-        'Macintosh': 'macOS',
-        'Linux': 'Linux'
-    }
-    
-    for key, value in platforms.items():
-        if key in user_agent:
-            return value
-    return 'Unknown'
+
+def parse_log_cursor(cursor):
+    """Keyset cursor '<iso timestamp>_<id>' of the last log row on the previous page"""
+    if not cursor:
+        return None
+    try:
+        timestamp, log_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except ValueError:
+        return None
+
+
+def get_subscription_log_page(walking_bus_id=None, notification_type=None, outcome=None,
+                              cursor=None, limit=SUBSCRIPTION_LOG_PAGE_SIZE):
+    """
+    One page of push logs, newest first, with subscription and auth token joined in.
+    Only the JSON fields the view shows are selected, the message body is truncated.
+    """
+    data = PushNotificationLog.notification_data
+    subscription_info = data['subscription_info']
+
+    query = db.session.query(
+        PushNotificationLog.id,
+        PushNotificationLog.walking_bus_id,
+        PushNotificationLog.timestamp,
+        PushNotificationLog.status_code,
+        PushNotificationLog.error_message,
+        PushNotificationLog.notification_type,
+        PushNotificationLog.success,
+        PushNotificationLog.subscription_deleted_at,
+        db.func.substr(data['body'].as_string(), 1, SUBSCRIPTION_LOG_BODY_PREVIEW).label('body'),
+        data['participant_id'].as_string().label('participant_id'),
+        data['attempted_send'].as_string().label('attempted_send'),
+        subscription_info['endpoint'].as_string().label('historical_endpoint'),
+        subscription_info['client_info'].as_string().label('historical_client_info'),
+        PushSubscription.token_identifier.label('subscription_token'),
+        PushSubscription.endpoint.label('subscription_endpoint'),
+        AuthToken.client_info.label('client_info')
+    ).outerjoin(
+        PushSubscription, PushSubscription.id == PushNotificationLog.subscription_id
+    ).outerjoin(
+        AuthToken, AuthToken.token_identifier == PushSubscription.token_identifier
+    )
+
+    if walking_bus_id:
+        query = query.filter(PushNotificationLog.walking_bus_id == walking_bus_id)
+    if notification_type:
+        query = query.filter(PushNotificationLog.notification_type == notification_type)
+    if outcome == 'sent':
+        query = query.filter(PushNotificationLog.success.is_(True), PushNotificationLog.status_code == 201)
+    elif outcome == 'failed':
+        query = query.filter(PushNotificationLog.success.is_(False))
+    elif outcome == 'skipped':
+        query = query.filter(PushNotificationLog.success.is_(True), PushNotificationLog.status_code != 201)
+    if cursor:
+        query = query.filter(
+            db.tuple_(PushNotificationLog.timestamp, PushNotificationLog.id) < db.tuple_(*cursor)
+        )
+
+    rows = query.order_by(
+        PushNotificationLog.timestamp.desc(),
+        PushNotificationLog.id.desc()
+    ).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = f"{rows[-1].timestamp.isoformat()}_{rows[-1].id}" if has_more and rows else None
+    return rows, next_cursor
+
 
 @bp.route("/subscriptions")
 def subscription_overview():
-    total_subs = PushSubscription.query.count()
-    current_app.logger.info(f"[SUBS][VIEW] Total subscriptions found: {total_subs}")
-    
-    walking_buses = WalkingBus.query.order_by(WalkingBus.id).all()
-    grouped_subscriptions = {}
-    all_participants = {}
-    all_auth_tokens = {}
-    grouped_logs = {}
-    
-    for bus in walking_buses:
-        # Get subscriptions for this bus
-        subscriptions = PushSubscription.query\
-            .filter_by(walking_bus_id=bus.id)\
-            .order_by(PushSubscription.created_at.desc())\
-            .all()
-        
-        # Get participants for this bus
-        participants = {
-            p.id: p.name 
-            for p in Participant.query.filter_by(walking_bus_id=bus.id)
-        }
-        all_participants.update(participants)
-        
-        # Get auth tokens for this bus
-        auth_tokens = {
-            t.token_identifier: t
-            for t in AuthToken.query.filter_by(walking_bus_id=bus.id)
-        }
-        all_auth_tokens.update(auth_tokens)
-        
-        # Process subscriptions
-        subscription_data = []
-        for sub in subscriptions:
-            token = all_auth_tokens.get(sub.token_identifier)
-            participant_names = [
-                all_participants.get(pid)
-                for pid in sub.participant_ids
-            ]
-            
-            subscription_data.append({
-                'id': sub.id,
-                'token_identifier': sub.token_identifier,
-                'endpoint': sub.endpoint,
-                'created_at': sub.created_at,
-                'last_used': token.last_used if token else None,
-                'platform': get_platform(token.client_info) if token else 'Unknown',
-                'participants': participant_names,
-                'is_active': sub.is_active,
-                'paused_at': sub.paused_at,
-                'pause_reason': sub.pause_reason,
-                'last_error_code': sub.last_error_code
-            })
-        
-        grouped_subscriptions[bus.id] = {
-            'bus_name': bus.name,
-            'subscriptions': subscription_data
-        }
+    cutoff_date = datetime.now() - timedelta(days=7)
 
-        # Get and process logs
-        cutoff_date = datetime.now() - timedelta(days=7)
-        logs = PushNotificationLog.query\
-            .filter_by(walking_bus_id=bus.id)\
-            .filter(PushNotificationLog.timestamp >= cutoff_date)\
-            .order_by(PushNotificationLog.timestamp.desc())\
-            .all()
-
-        current_app.logger.info(f"""
-            [LOGS][DEBUG] Processing logs for bus {bus.id}:
-            Total count: {len(logs)}
-            Data sample: {[log.notification_data for log in logs[:2]]}
-        """)
-
-        for log in logs:
-            # Set platform info
-            if log.subscription and log.subscription.auth_token:
-                client_info = log.subscription.auth_token.client_info
-                log.platform = get_platform(client_info)
-                log.historical_endpoint = log.subscription.endpoint
-                log.historical_client_info = get_platform(client_info)
-            elif log.notification_data and 'subscription_info' in log.notification_data:
-                subscription_info = log.notification_data['subscription_info']
-                client_info = subscription_info.get('client_info', {})
-                log.platform = get_platform(client_info)
-                log.historical_endpoint = subscription_info.get('endpoint', 'Unknown')
-                log.historical_client_info = get_platform(client_info)
-            else:
-                log.platform = 'Unknown'
-                log.historical_endpoint = 'Unknown'
-                log.historical_client_info = 'Unknown'
-
-            # Add participant name processing
-            participant_id = log.notification_data.get('participant_id')
-            log.participant_name = participants.get(participant_id, '-')
-
-            # Determine attempted_send status
-            log.attempted_send = any([
-                log.notification_data.get('attempted_send', False),
-                log.success,
-                log.status_code == 201
-            ])
-
-            current_app.logger.info(f"""
-                [LOG][DEBUG] Log entry {log.id}:
-                - Attempted: {log.attempted_send}
-                - Success: {log.success}
-                - Status: {log.status_code}
-                - Data: {log.notification_data}
-            """)
-
-        grouped_logs[bus.id] = {
-            'bus_name': bus.name,
-            'logs': logs
-        }
+    walking_buses = db.session.query(WalkingBus.id, WalkingBus.name).order_by(WalkingBus.id).all()
+    bus_names = dict(walking_buses)
+    participant_names = dict(db.session.query(Participant.id, Participant.name).all())
 
-    return render_template(
-        'subscriptions.html',
-        grouped_subscriptions=grouped_subscriptions,
-        grouped_logs=grouped_logs
+    # Subscriptions with their auth token in one query
+    subscriptions = PushSubscription.query\
+        .options(db.joinedload(PushSubscription.auth_token))\
+        .order_by(PushSubscription.walking_bus_id, PushSubscription.created_at.desc())\
+        .all()
+
+    grouped_subscriptions = {
+        bus_id: {'bus_name': name, 'subscriptions': [], 'active': 0, 'paused': 0}
+        for bus_id, name in walking_buses
+    }
+    for sub in subscriptions:
+        bus_data = grouped_subscriptions.get(sub.walking_bus_id)
+        if bus_data is None:
+            continue
+        token = sub.auth_token
+        bus_data['subscriptions'].append({
+            'id': sub.id,
+            'token_identifier': sub.token_identifier,
+            'endpoint': sub.endpoint,
+            'created_at': sub.created_at,
+            'last_used': token.last_used if token else None,
+            'platform': get_platform(token.client_info) if token else 'Unknown',
+            'participants': [participant_names.get(pid) for pid in sub.participant_ids],
+            'is_active': sub.is_active,
+            'paused_at': sub.paused_at,
+            'pause_reason': sub.pause_reason,
+            'last_error_code': sub.last_error_code
+        })
+        bus_data['active' if sub.is_active else 'paused'] += 1
+
+    # Delivery statistics of the last 7 days, aggregated in SQL
+    log_stats = {
+        bus_id: {'bus_name': name, 'total': 0, 'sent': 0, 'failed': 0, 'skipped': 0, 'errors': {}}
+        for bus_id, name in walking_buses
+    }
+    aggregates = db.session.query(
+        PushNotificationLog.walking_bus_id,
+        PushNotificationLog.success,
+        PushNotificationLog.status_code,
+        db.func.count(PushNotificationLog.id)
+    ).filter(
+        PushNotificationLog.timestamp >= cutoff_date
+    ).group_by(
+        PushNotificationLog.walking_bus_id,
+        PushNotificationLog.success,
+        PushNotificationLog.status_code
+    ).all()
+
+    for bus_id, success, status_code, count in aggregates:
+        stats = log_stats.get(bus_id)
+        if stats is None:
+            continue
+        stats['total'] += count
+        if not success:
+            stats['failed'] += count
+            key = status_code or 'Unbekannt'
+            stats['errors'][key] = stats['errors'].get(key, 0) + count
+        elif status_code == 201:
+            stats['sent'] += count
+        else:
+            stats['skipped'] += count
+
+    # Keyset-paginated log listing with filters
+    filters = {
+        'bus': request.args.get('bus', type=int),
+        'type': request.args.get('type') or None,
+        'outcome': request.args.get('outcome') if request.args.get('outcome') in SUBSCRIPTION_LOG_OUTCOMES else None
+    }
+    limit = min(request.args.get('limit', SUBSCRIPTION_LOG_PAGE_SIZE, type=int), SUBSCRIPTION_LOG_MAX_PAGE_SIZE)
+    rows, next_cursor = get_subscription_log_page(
+        walking_bus_id=filters['bus'],
+        notification_type=filters['type'],
+        outcome=filters['outcome'],
+        cursor=parse_log_cursor(request.args.get('before')),
+        limit=max(limit, 1)
     )
 
+    logs = []
+    for row in rows:
+        if row.subscription_token:
+            platform = get_platform(row.client_info)
+            endpoint = row.subscription_endpoint
+        else:
+            platform = get_platform(row.historical_client_info)
+            endpoint = row.historical_endpoint or 'Unknown'
+
+        participant_id = int(row.participant_id) if row.participant_id and row.participant_id.isdigit() else None
+        logs.append({
+            'id': row.id,
+            'bus_name': bus_names.get(row.walking_bus_id, row.walking_bus_id),
+            'timestamp': row.timestamp,
+            'participant_name': participant_names.get(participant_id) if participant_id else None,
+            'notification_type': row.notification_type,
+            'attempted_send': row.attempted_send == 'true' or row.status_code == 201 or row.success is False,
+            'success': row.success,
+            'status_code': row.status_code,
+            'error_message': row.error_message,
+            'body': row.body,
+            'subscription_token': row.subscription_token,
+            'subscription_deleted_at': row.subscription_deleted_at,
+            'platform': platform,
+            'historical_endpoint': endpoint
+        })
 
+    notification_types = [
+        t for (t,) in db.session.query(PushNotificationLog.notification_type)
+        .filter(PushNotificationLog.timestamp >= cutoff_date)
+        .distinct()
+        if t
+    ]
 
+    return render_template(
+        'subscriptions.html',
+        grouped_subscriptions=grouped_subscriptions,
+        log_stats=log_stats,
+        logs=logs,
+        filters=filters,
+        notification_types=sorted(notification_types),
+        next_cursor=next_cursor,
+        limit=limit
+    )
 
 
 @bp.route("/share")
@@ -286,10 +375,45 @@ def scheduler_view():
         
         # Sort jobs by day_order
         grouped_jobs[job.walking_bus_id]['jobs'].sort(key=lambda x: x['day_order'])
+
+    # Duration and queue lag of the last notification run per bus
+    try:
+        last_runs = SchedulerMetricsService().last_runs(grouped_jobs.keys())
+    except Exception as e:
+        current_app.logger.error(f"[SCHEDULER] Could not load run metrics: {str(e)}")
+        last_runs = {}
+    for bus_id, run in last_runs.items():
+        run['started'] = datetime.fromtimestamp(run['started_at'], TIMEZONE)
+        grouped_jobs[bus_id]['last_run'] = run
     
     return render_template('scheduler.html', grouped_jobs=grouped_jobs)
 
 
+@bp.route("/debug/sql")
+def sql_stats_view():
+    """Endpoints with the most queries, only while SQL_INSTRUMENTATION is on"""
+    if not current_app.config.get('SQL_INSTRUMENTATION'):
+        return "SQL instrumentation is disabled (SQL_INSTRUMENTATION=true)", 404
+
+    order = request.args.get('order', 'avg_queries')
+    if order not in SQL_STATS_ORDERS:
+        order = 'avg_queries'
+    endpoints = QueryStatsService().worst(order)
+    return render_template('sql_stats.html', endpoints=endpoints, order=order, orders=SQL_STATS_ORDERS)
+
+
+@bp.route("/api/debug/sql-stats", methods=["GET", "DELETE"])
+def sql_stats_api():
+    if not current_app.config.get('SQL_INSTRUMENTATION'):
+        return jsonify({'error': 'SQL instrumentation is disabled'}), 404
+
+    service = QueryStatsService()
+    if request.method == "DELETE":
+        return jsonify({'success': True, 'reset': service.reset()})
+    order = request.args.get('order', 'avg_queries')
+    return jsonify(service.worst(order if order in SQL_STATS_ORDERS else 'avg_queries'))
+
+
 @bp.route("/api/temp-tokens")
 @require_auth
 def get_active_temp_tokens_route():
@@ -468,32 +592,47 @@ def get_initial_load():
 
 def get_stations_data(walking_bus_id):
     """Helper function to get stations with participants"""
-    stations = (Station.query
-               .filter_by(walking_bus_id=walking_bus_id)
-               .order_by(Station.position)
-               .all())
+    stations = load_stations(walking_bus_id, Participant.id, Participant.name)
+    return [serialize_station(station, lambda p: {"id": p.id, "name": p.name}) for station in stations]
 
-    return [{
+
+def load_stations(walking_bus_id, *participant_columns):
+    """
+    Stations of a walking bus with their participants, both ordered by
+    position: one query for the stations and one selectinload for all
+    participants, independent of the number of stations.
+    participant_columns restricts the participant columns to what the
+    caller serializes (ids and foreign keys are always loaded).
+    """
+    participants = db.selectinload(Station.participants)
+    if participant_columns:
+        participants = participants.load_only(*participant_columns)
+    return (Station.query
+            .filter_by(walking_bus_id=walking_bus_id)
+            .options(participants)
+            .order_by(Station.position, Station.id)
+            .all())
+
+
+def serialize_station(station, serialize_participant):
+    """Shared shape of a station in the station listings"""
+    return {
         "id": station.id,
         "name": station.name,
         "position": station.position,
         "arrival_time": station.arrival_time.strftime("%H:%M") if station.arrival_time else None,
-        "participants": [{
-            "id": p.id,
-            "name": p.name
-        } for p in station.participants]
-    } for station in stations]
-
-
+        "participants": [serialize_participant(p) for p in station.participants]
+    }
 
 
 def get_week_overview_data(walking_bus_id):
     """Helper function to get week overview"""
     today = get_current_date()
     week_data = []
+    dates = [today + timedelta(days=i) for i in range(6)]
+    confirmed = calculate_confirmed_counts(walking_bus_id, dates)
     
-    for i in range(6):
-        current_date = today + timedelta(days=i)
+    for current_date in dates:
         is_active, reason, reason_type = check_walking_bus_day(
             current_date,
             include_reason=True,
@@ -505,7 +644,7 @@ def get_week_overview_data(walking_bus_id):
             'is_active': is_active,
             'reason': reason,
             'reason_type': reason_type,
-            'total_confirmed': calculate_total_confirmed(walking_bus_id, current_date, is_active)
+            'total_confirmed': confirmed[current_date] if is_active else 0
         })
     
     return week_data
@@ -530,31 +669,29 @@ def calculate_total_confirmed(walking_bus_id, target_date, is_active):
         Participant.station_id.isnot(None)
     ).all()
     
-    # Get calendar entries for this date
-    calendar_entries = CalendarStatus.query.filter_by(
-        walking_bus_id=walking_bus_id,
-        date=target_date
-    ).all()
-    
-    # Create lookup dictionary for quick access
-    calendar_lookup = {entry.participant_id: entry.status for entry in calendar_entries}
-    
-    # Count confirmed participants
-    total_confirmed = 0
-    weekday = WEEKDAY_MAPPING[target_date.weekday()]
-    
-    for participant in participants:
-        # Check calendar override first, then default weekday setting
-        if participant.id in calendar_lookup:
-            if calendar_lookup[participant.id]:
-                total_confirmed += 1
-        elif getattr(participant, weekday, True):
-            total_confirmed += 1
+    # Overrides first, then the weekly participation rules
+    participation = ParticipationService(walking_bus_id).load(target_date)
+    total_confirmed = participation.count_confirmed(participants, target_date)
             
     current_app.logger.debug(f"[TOTAL_CONFIRMED] Date: {target_date}, Active: {is_active}, Count: {total_confirmed}")
     return total_confirmed
 
 
+def calculate_confirmed_counts(walking_bus_id, dates):
+    """
+    Confirmed participants for several dates with one load of rules and overrides
+    Returns:
+        dict: date -> number of confirmed participants (ignores whether the bus runs)
+    """
+    participants = Participant.query.filter(
+        Participant.walking_bus_id == walking_bus_id,
+        Participant.station_id.isnot(None)
+    ).all()
+    
+    participation = ParticipationService(walking_bus_id).load(min(dates), max(dates))
+    return participation.confirmed_counts(participants, dates)
+
+
 
 ########################################
 ########################################
@@ -575,13 +712,13 @@ def get_stations():
     else:
         target_date = get_current_date()
 
-    # Get regular stations with eager loading of participants
-    stations = (Station.query
-               .filter_by(walking_bus_id=walking_bus_id)
-               .order_by(Station.position)
-               .all())
+    # Columns of create_participant_data (the weekday properties derive from weekday_mask)
+    stations = load_stations(
+        walking_bus_id, Participant.name, Participant.position, Participant.weekday_mask
+    )
 
     result = []
+    participation = ParticipationService(walking_bus_id).load(target_date)
 
     # Add unassigned section only for admin view
     if is_admin:
@@ -591,27 +728,22 @@ def get_stations():
         ).order_by(Participant.position).all()
 
         if unassigned_participants:
-            result.append(create_unassigned_section(unassigned_participants, target_date))
+            result.append(create_unassigned_section(unassigned_participants, target_date, participation))
 
     # Process regular stations
-    for station in stations:
-        station_data = {
-            "id": station.id,
-            "name": station.name,
-            "position": station.position,
-            "arrival_time": station.arrival_time.strftime("%H:%M") if station.arrival_time else None,
-            "participants": create_participant_list(station.participants, target_date, is_admin)
-        }
-        result.append(station_data)
+    result.extend(
+        serialize_station(station, lambda p: create_participant_data(p, target_date, is_admin, participation))
+        for station in stations
+    )
 
     return jsonify(result)
 
 
-def create_unassigned_section(participants, target_date):
+def create_unassigned_section(participants, target_date, participation=None):
     """Helper function to create unassigned section data"""
     unassigned_data = []
     for p in participants:
-        participant_data = create_participant_data(p, target_date, True)
+        participant_data = create_participant_data(p, target_date, True, participation)
         unassigned_data.append(participant_data)
     
     return {
@@ -622,24 +754,12 @@ def create_unassigned_section(participants, target_date):
     }
 
 
-def create_participant_list(participants, target_date, is_admin):
-    """Helper function to create participant list with appropriate data"""
-    return [create_participant_data(p, target_date, is_admin) for p in participants]
-
-
-def create_participant_data(participant, target_date, is_admin):
+def create_participant_data(participant, target_date, is_admin, participation=None):
     """Helper function to create participant data based on view type"""
-    calendar_entry = CalendarStatus.query.filter_by(
-        participant_id=participant.id,
-        date=target_date,
-        walking_bus_id=participant.walking_bus_id
-    ).first()
+    if participation is None:
+        participation = ParticipationService(participant.walking_bus_id).load(target_date)
     
-    status = calendar_entry.status if calendar_entry else getattr(
-        participant, 
-        WEEKDAY_MAPPING[target_date.weekday()], 
-        True
-    )
+    status = participation.status(participant, target_date)
     
     # Base data for both views
     data = {
@@ -678,6 +798,7 @@ def create_station():
     # Create new station at position 0
     new_station = Station(name=data['name'], position=0, walking_bus_id=walking_bus_id)
     db.session.add(new_station)
+    emit_change(walking_bus_id, 'stations')
     db.session.commit()
     
     current_app.logger.info(f"Neue Haltestelle erstellt: {new_station.name} (ID: {new_station.id})")
@@ -715,6 +836,7 @@ def update_station(station_id):
             else:
                 station.arrival_time = None
                 
+        emit_change(walking_bus_id, 'stations')
         db.session.commit()
         
         # Log the final state
@@ -735,24 +857,34 @@ def delete_station(station_id):
     station = Station.query.filter_by(id=station_id, walking_bus_id=walking_bus_id).first_or_404()
     
     db.session.delete(station)
+    emit_change(walking_bus_id, 'stations')
     db.session.commit()
     return jsonify({"success": True})
 
 
 
+def count_participants(walking_bus_id, *criteria):
+    """(total, participating today) of the matching participants in one aggregate query"""
+    total, active = db.session.query(
+        db.func.count(Participant.id),
+        db.func.count(Participant.id).filter(Participant.status_today.is_(True))
+    ).filter(Participant.walking_bus_id == walking_bus_id, *criteria).one()
+    return total, active
+
+
 @bp.route("/api/stations/<int:station_id>/stats")
 @require_auth
 def get_station_stats(station_id):
     try:
         walking_bus_id = get_current_walking_bus_id()
-        station = Station.query.filter_by(id=station_id, walking_bus_id=walking_bus_id).first_or_404()
-        total = len(station.participants)
+        Station.query.filter_by(id=station_id, walking_bus_id=walking_bus_id).first_or_404()
         today = get_current_date()
         
         # Use a different variable name to avoid conflict with function name
         is_active_day = check_walking_bus_day(today)
         
-        active = sum(1 for p in station.participants if p.status_today) if is_active_day else 0
+        total, active = count_participants(walking_bus_id, Participant.station_id == station_id)
+        active = active if is_active_day else 0
         
         return jsonify({
             "total": total,
@@ -768,18 +900,12 @@ def get_station_stats(station_id):
 def get_stations_total_stats():
     try:
         walking_bus_id = get_current_walking_bus_id()
-        # Get all stations for current walking bus
-        stations = Station.query.filter_by(walking_bus_id=walking_bus_id).all()
-        
-        # Sum up all participants across stations
-        total = sum(len(station.participants) for station in stations)
+        # All participants assigned to a station, counted in SQL
+        total, active = count_participants(walking_bus_id, Participant.station_id.isnot(None))
         
         today = get_current_date()
         is_active_day = check_walking_bus_day(today)
-        
-        # Sum up active participants across all stations
-        active = sum(sum(1 for p in station.participants if p.status_today) 
-                    for station in stations) if is_active_day else 0
+        active = active if is_active_day else 0
         
         return jsonify({
             "total": total,
@@ -793,34 +919,45 @@ def get_stations_total_stats():
 @bp.route("/api/stations/order", methods=["PUT"])
 @require_auth
 def update_stations_order():
+    """Positions of all stations after a drag, written with one statement: [{"id": 3, "position": 0}, ...]"""
+    walking_bus_id = get_current_walking_bus_id()
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        return jsonify({"error": "Invalid data format. Expected a list."}), 400
+
     try:
-        walking_bus_id = get_current_walking_bus_id()
-        data = request.get_json()
-        if not isinstance(data, list):
-            return jsonify({"error": "Invalid data format. Expected a list."}), 400
-
-        # Validate all station IDs exist before updating
-        station_ids = [station_data['id'] for station_data in data]
-        stations = Station.query.filter(
-            Station.id.in_(station_ids),
-            Station.walking_bus_id == walking_bus_id
-        ).all()
-        
-        # Create a mapping of id to station for efficient updates
-        station_map = {station.id: station for station in stations}
-        
-        # Update positions
-        for station_data in data:
-            station_id = station_data['id']
-            if station_id in station_map:
-                station_map[station_id].position = station_data['position']
-        
-        db.session.commit()
-        return jsonify({"success": True}), 200
-    except Exception as e:
-        db.session.rollback()
-        current_app.logger.error(f"Error updating station order: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        station_ids = [station_data['id'] for station_data in sorted(data, key=lambda item: item['position'])]
+        OrderingService(walking_bus_id).reorder_stations(station_ids)
+    except (KeyError, TypeError):
+        return jsonify({"error": "Invalid data format. Expected id and position."}), 400
+    except OrderValidationError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    emit_change(walking_bus_id, 'stations')
+    db.session.commit()
+    return jsonify({"success": True}), 200
+
+
+@bp.route("/api/participants/order", methods=["PUT"])
+@require_auth
+def update_participants_order():
+    """
+    Order of the participant lists touched by a drag, including moves
+    between stations and the unassigned section (station_id null):
+
+        {"stations": [{"station_id": 3, "participant_ids": [12, 7]}, {"station_id": null, "participant_ids": [4]}]}
+    """
+    walking_bus_id = get_current_walking_bus_id()
+    data = request.get_json(silent=True) or {}
+
+    try:
+        moved = OrderingService(walking_bus_id).move_participants(data.get('stations'))
+    except OrderValidationError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    emit_change(walking_bus_id, 'stations')
+    db.session.commit()
+    return jsonify({"success": True, "updated": moved})
 
 
 
@@ -831,7 +968,6 @@ def create_participant():
     walking_bus_id = get_current_walking_bus_id()
     data = request.get_json()
     today = get_current_date()
-    weekday = WEEKDAY_MAPPING[today.weekday()]
     
     # Verify station belongs to current walking bus
     station = Station.query.filter_by(
@@ -849,16 +985,12 @@ def create_participant():
     db.session.flush()
     current_app.logger.info(f"Neuer Teilnehmer erstellt: {new_participant.name} (ID: {new_participant.id})")
     
-    calendar_entry = CalendarStatus(
-        participant_id=new_participant.id,
-        date=today,
-        status=getattr(new_participant, weekday, True),
-        is_manual_override=False,
-        walking_bus_id=walking_bus_id  # Add walking bus association
-    )
-    db.session.add(calendar_entry)
+    # Weekly participation starts today, no calendar rows needed
+    participation = ParticipationService(walking_bus_id)
+    participation.set_weekday_mask(new_participant, new_participant.weekday_mask, today)
     
-    new_participant.status_today = calendar_entry.status
+    new_participant.status_today = participation.default_status(new_participant, today)
+    emit_change(walking_bus_id, 'stations')
     db.session.commit()
     
     return jsonify({
@@ -923,7 +1055,14 @@ def update_participant(station_id, participant_id):
                  'thursday', 'friday', 'saturday', 'sunday']:
         if field in data:
             setattr(participant, field, data[field])
+
+    # Weekday changes apply from today on, earlier days keep their rule
+    if any(day in data for day in WEEKDAY_MAPPING.values()):
+        ParticipationService(walking_bus_id).set_weekday_mask(
+            participant, participant.weekday_mask, get_current_date()
+        )
     
+    emit_change(walking_bus_id, 'stations')
     db.session.commit()
     return jsonify({"success": True})
 
@@ -934,11 +1073,15 @@ def delete_participant(participant_id):
     try:
         walking_bus_id = get_current_walking_bus_id()
         
-        # Delete calendar entries for this participant within the walking bus
+        # Delete calendar entries and rules for this participant within the walking bus
         CalendarStatus.query.filter_by(
             participant_id=participant_id,
             walking_bus_id=walking_bus_id
         ).delete()
+        ParticipationRule.query.filter_by(
+            participant_id=participant_id,
+            walking_bus_id=walking_bus_id
+        ).delete()
         
         # Get and verify participant belongs to current walking bus
         participant = Participant.query.filter_by(
@@ -950,6 +1093,7 @@ def delete_participant(participant_id):
         current_app.logger.info(f"Lösche Teilnehmer {name} (ID: {participant_id})")
         
         db.session.delete(participant)
+        emit_change(walking_bus_id, 'stations')
         db.session.commit()
         return jsonify({"success": True})
         
@@ -970,30 +1114,14 @@ def toggle_participation(participant_id):
         walking_bus_id=walking_bus_id
     ).first_or_404()
     
-    calendar_entry = CalendarStatus.query.filter_by(
-        participant_id=participant_id,
-        date=target_date,
-        walking_bus_id=walking_bus_id
-    ).first()
-
-    new_status = not (calendar_entry.status if calendar_entry else getattr(participant, WEEKDAY_MAPPING[target_date.weekday()], True))
-    
-    if calendar_entry:
-        calendar_entry.status = new_status
-        calendar_entry.is_manual_override = True
-    else:
-        calendar_entry = CalendarStatus(
-            participant_id=participant_id,
-            date=target_date,
-            status=new_status,
-            is_manual_override=True,
-            walking_bus_id=walking_bus_id
-        )
-        db.session.add(calendar_entry)
+    participation = ParticipationService(walking_bus_id).load(target_date)
+    new_status = not participation.status(participant, target_date)
+    participation.set_status(participant, target_date, new_status)
 
     if target_date == get_current_date():
         participant.status_today = new_status
     
+    emit_change(walking_bus_id, 'participation', participant_id=participant.id, date=target_date, status=new_status)
     db.session.commit()
     
     return jsonify({
@@ -1003,6 +1131,30 @@ def toggle_participation(participant_id):
     })
 
 
+@bp.route("/api/batch", methods=["POST"])
+@require_auth
+def apply_batch():
+    """Several participation and attendance changes in one request and transaction (see BatchService)"""
+    walking_bus_id = get_current_walking_bus_id()
+    data = request.get_json(silent=True) or {}
+    try:
+        summary = BatchService(walking_bus_id).apply(data.get('operations'))
+    except BatchValidationError as e:
+        return jsonify({
+            "error": str(e),
+            "errors": [{"index": index, "error": message} for index, message in e.errors]
+        }), 400
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"[BATCH] Batch für Bus {walking_bus_id} fehlgeschlagen: {str(e)}")
+        return jsonify({"error": "Änderungen konnten nicht gespeichert werden"}), 500
+
+    return jsonify({
+        "success": True,
+        "changed": len(summary['participation']) + len(summary['attendance']),
+        **summary
+    })
+
+
 @bp.route("/api/participant/<int:participant_id>/weekday-status/<string:weekday>")
 @require_auth
 def get_participant_weekday_status(participant_id, weekday):
@@ -1013,7 +1165,8 @@ def get_participant_weekday_status(participant_id, weekday):
         walking_bus_id=walking_bus_id
     ).first_or_404()
     
-    status = getattr(participant, weekday, True)
+    weekday_index = next((index for index, name in WEEKDAY_MAPPING.items() if name == weekday), None)
+    status = participant.has_weekday(weekday_index) if weekday_index is not None else True
     return jsonify({"status": status})
 
 
@@ -1030,16 +1183,11 @@ def toggle_attendance(participant_id):
     ).first_or_404()
     
     # Prüfe ob Teilnehmer heute zugesagt hat
-    calendar_entry = CalendarStatus.query.filter_by(
-        participant_id=participant_id,
-        date=current_date,
-        walking_bus_id=walking_bus_id
-    ).first()
+    participation = ParticipationService(walking_bus_id).load(current_date)
+    calendar_entry = participation.entry(participant_id, current_date)
     
     # Bestimme den aktuellen Teilnahme-Status
-    current_participation = calendar_entry.status if calendar_entry else getattr(
-        participant, WEEKDAY_MAPPING[current_date.weekday()], True
-    )
+    current_participation = participation.status(participant, current_date)
     
     # Nur für Teilnehmer die zugesagt haben
     if not current_participation:
@@ -1050,7 +1198,7 @@ def toggle_attendance(participant_id):
         calendar_entry = CalendarStatus(
             participant_id=participant_id,
             date=current_date,
-            status=True,  # Implizit durch Teilnahme
+            status=True,  # Implizit durch Teilnahme, nur Träger der Anwesenheit
             is_manual_override=False,
             attendance=False,
             walking_bus_id=walking_bus_id
@@ -1059,15 +1207,10 @@ def toggle_attendance(participant_id):
     
     # Toggle Anwesenheit
     calendar_entry.attendance = not calendar_entry.attendance
+    emit_change(walking_bus_id, 'attendance', participant_id=participant_id,
+                date=current_date, attendance=calendar_entry.attendance)
     db.session.commit()
     
-    # Redis Event senden
-    redis_client.publish(f'walking_bus_{walking_bus_id}_attendance', json.dumps({
-        'participant_id': participant_id,
-        'attendance': calendar_entry.attendance,
-        'date': current_date.isoformat()
-    }))
-    
     return jsonify({
         "attendance": calendar_entry.attendance,
         "participant_id": participant.id,
@@ -1080,17 +1223,19 @@ def toggle_attendance(participant_id):
 def get_participant_current_status(participant_id):
     date = request.args.get('date')
     walking_bus_id = get_current_walking_bus_id()
-    
-    # Get calendar entry for this specific date
-    calendar_entry = CalendarStatus.query.filter_by(
-        participant_id=participant_id,
-        date=date,
+    target_date = datetime.strptime(date, '%Y-%m-%d').date() if date else get_current_date()
+
+    participant = Participant.query.filter_by(
+        id=participant_id,
         walking_bus_id=walking_bus_id
     ).first()
+    if not participant:
+        return jsonify({"status": True})
     
-    # Return calendar status if it exists, otherwise return default True
+    # Override for this specific date, otherwise the weekly rule
+    participation = ParticipationService(walking_bus_id).load(target_date)
     return jsonify({
-        "status": calendar_entry.status if calendar_entry else True
+        "status": participation.status(participant, target_date)
     })
 
 #################################
@@ -1116,12 +1261,10 @@ def get_daily_status():
 
     # Get schedule information
     schedule = WalkingBusSchedule.query.filter_by(walking_bus_id=walking_bus_id).first()
-    weekday = WEEKDAY_MAPPING[target_date.weekday()]
     
     schedule_data = None
     if schedule:
-        start_time = getattr(schedule, f"{weekday}_start", None)
-        end_time = getattr(schedule, f"{weekday}_end", None)
+        start_time, end_time = schedule.times_for(target_date.weekday())
         schedule_data = {
             "start": start_time.strftime("%H:%M") if start_time else None,
             "end": end_time.strftime("%H:%M") if end_time else None
@@ -1135,10 +1278,7 @@ def get_daily_status():
     )
 
     # Get holiday information
-    holiday = SchoolHoliday.query.filter(
-        SchoolHoliday.start_date <= target_date,
-        SchoolHoliday.end_date >= target_date
-    ).first()
+    holiday = find_holiday(target_date)
 
     holiday_data = {
         "name": holiday.name,
@@ -1154,25 +1294,16 @@ def get_daily_status():
 
     # Get participant states for this date
     participants = Participant.query.filter_by(walking_bus_id=walking_bus_id).all()
+    participation = ParticipationService(walking_bus_id).load(target_date)
     participant_states = {}
     participant_attendance = {}
     
     for participant in participants:
-        calendar_entry = CalendarStatus.query.filter_by(
-            participant_id=participant.id,
-            date=target_date,
-            walking_bus_id=walking_bus_id
-        ).first()
-        
-        participant_states[participant.id] = calendar_entry.status if calendar_entry else getattr(
-            participant,
-            weekday,
-            True
-        )
+        participant_states[participant.id] = participation.status(participant, target_date)
         
         # Anwesenheit nur für aktuellen Tag laden
         if target_date == get_current_date():
-            participant_attendance[participant.id] = calendar_entry.attendance if calendar_entry else False
+            participant_attendance[participant.id] = participation.attendance(participant.id, target_date)
 
     response = jsonify({
         "currentDate": target_date.isoformat(),
@@ -1282,13 +1413,9 @@ def get_bus_weather():
 @require_auth
 def trigger_weather_update():
     try:
-        weather_service = WeatherService()
-        update_result = weather_service.update_weather()
-        
-        if update_result["success"]:
-            weather_service.update_weather_calculations()
-            
-        return jsonify({"status": "success"})
+        # API call and recalculation run in the scheduler worker; concurrent triggers share one task
+        task_id = TaskService().submit('weather_update', {}, task_id='weather_update')
+        return task_response(task_id)
     except Exception as e:
         current_app.logger.error(f"[WEATHER] Update error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -1344,9 +1471,9 @@ def clear_weather_database():
         # Log the start of operation
         current_app.logger.info("[DATABASE] Starting complete weather database cleanup")
         
-        # Delete all weather records
-        weather_count = Weather.query.delete()
-        current_app.logger.info(f"[DATABASE] Deleted {weather_count} weather records")
+        # Delete all weather series (one row per fetch and forecast type)
+        weather_count = WeatherSeries.query.delete()
+        current_app.logger.info(f"[DATABASE] Deleted {weather_count} weather series")
         
         # Delete ALL weather calculations (removed walking_bus_id filter)
         calc_count = WeatherCalculation.query.delete()
@@ -1357,7 +1484,7 @@ def clear_weather_database():
         
         return jsonify({
             "success": True,
-            "message": f"Successfully deleted {weather_count} weather records and {calc_count} calculations",
+            "message": f"Successfully deleted {weather_count} weather series and {calc_count} calculations",
             "details": {
                 "weather_records": weather_count, 
                 "calculations": calc_count
@@ -1375,19 +1502,20 @@ def clear_weather_database():
 
 @bp.route('/api/weather/all')
 def get_all_weather():
-    minutely_data = Weather.query.filter_by(forecast_type='minutely').order_by(Weather.timestamp).all()
-    hourly_data = Weather.query.filter_by(forecast_type='hourly').order_by(Weather.timestamp).all()
+    weather_service = WeatherService()
+    minutely_data = weather_service.get_forecast('minutely').records()
+    hourly_data = weather_service.get_forecast('hourly').records()
     
     return jsonify({
         'minutely': [{
-            'timestamp': record.timestamp.isoformat(),
-            'precipitation': record.precipitation
+            'timestamp': record['timestamp'].isoformat(),
+            'precipitation': record['precipitation']
         } for record in minutely_data],
         'hourly': [{
-            'timestamp': record.timestamp.isoformat(),
-            'total_precipitation': record.total_precipitation,
-            'pop': record.pop,
-            'weather_icon': record.weather_icon
+            'timestamp': record['timestamp'].isoformat(),
+            'total_precipitation': record['precipitation'],
+            'pop': record['pop'],
+            'weather_icon': record['weather_icon']
         } for record in hourly_data]
     })
 
@@ -1402,18 +1530,19 @@ def get_weather_calculations():
     latest_calc = WeatherCalculation.query.order_by(
         WeatherCalculation.last_updated.desc()
     ).first()
-    latest_weather = Weather.query.order_by(
-        Weather.created_at.desc()
-    ).first()
+    latest_fetch = db.session.query(db.func.max(WeatherSeries.fetched_at)).scalar()
+    if latest_fetch:
+        # last_updated is stored as naive local time
+        latest_fetch = latest_fetch.astimezone(TIMEZONE).replace(tzinfo=None)
 
     # Get the most recent timestamp
     last_update = None
-    if latest_calc and latest_weather:
-        last_update = max(latest_calc.last_updated, latest_weather.created_at)
+    if latest_calc and latest_fetch:
+        last_update = max(latest_calc.last_updated, latest_fetch)
     elif latest_calc:
         last_update = latest_calc.last_updated
-    elif latest_weather:
-        last_update = latest_weather.created_at
+    elif latest_fetch:
+        last_update = latest_fetch
 
     # Rest of your existing code...
     
@@ -1496,26 +1625,33 @@ def get_weather_calculations():
 
 @bp.route('/api/weather/debug')
 def weather_debug():
-    records = Weather.query.order_by(Weather.timestamp).all()
+    weather_service = WeatherService()
+    forecasts = {
+        forecast_type: weather_service.get_forecast(forecast_type)
+        for forecast_type in WeatherService.FORECAST_STEPS
+    }
+    records = sorted(
+        (record for forecast in forecasts.values() for record in forecast.records()),
+        key=lambda record: record['timestamp']
+    )
     calculations = WeatherCalculation.query.all()
     
     response = {
         'query_timeframe': {
-            'oldest': records[0].timestamp.astimezone(TIMEZONE).strftime('%Y-%m-%d %H:%M:%S %Z') if records else 'No records',
-            'newest': records[-1].timestamp.astimezone(TIMEZONE).strftime('%Y-%m-%d %H:%M:%S %Z') if records else 'No records'
+            'oldest': records[0]['timestamp'].strftime('%Y-%m-%d %H:%M:%S %Z') if records else 'No records',
+            'newest': records[-1]['timestamp'].strftime('%Y-%m-%d %H:%M:%S %Z') if records else 'No records'
         },
         'total_records': len(records),
         'types': {
-            'minutely': len([r for r in records if r.forecast_type == 'minutely']),
-            'hourly': len([r for r in records if r.forecast_type == 'hourly']),
-            'daily': len([r for r in records if r.forecast_type == 'daily'])
+            forecast_type: len(forecast)
+            for forecast_type, forecast in forecasts.items()
         },
         'sample_records': [{
-            'type': r.forecast_type,
-            'timestamp': r.timestamp.astimezone(TIMEZONE).strftime('%Y-%m-%d %H:%M:%S %Z'),
-            'precipitation': r.precipitation if r.forecast_type == 'minutely' else r.total_precipitation,
-            'pop': r.pop,
-            'weather_icon': r.weather_icon
+            'type': r['type'],
+            'timestamp': r['timestamp'].strftime('%Y-%m-%d %H:%M:%S %Z'),
+            'precipitation': r['precipitation'],
+            'pop': r['pop'],
+            'weather_icon': r['weather_icon']
         } for r in records[:500]],
         'weather_calculations': [{
             'walking_bus_id': calc.walking_bus_id,
@@ -1615,6 +1751,17 @@ def cleanup_duplicate_subscriptions():
 
 
 
+@bp.route('/api/notifications/stats')
+@require_auth
+def get_push_delivery_stats():
+    """Delivery health from the push_delivery_stats rollup (no log scans)"""
+    walking_bus_id = get_current_walking_bus_id()
+    days = min(max(request.args.get('days', PUSH_STATS_DEFAULT_DAYS, type=int), 1), PUSH_STATS_MAX_DAYS)
+    end_date = get_current_date()
+    stats = PushDeliveryStatsService(walking_bus_id).summary(end_date - timedelta(days=days - 1), end_date)
+    return jsonify(stats)
+
+
 @bp.route('/api/notifications/subscription', methods=['GET'])
 @require_auth
 def get_subscription_details():
@@ -1741,25 +1888,13 @@ def test_notification():
 
     # Create job data with user identifier
     job_data = {
-        'type': 'test_notification',
         'walking_bus_id': walking_bus_id,
         'participant_ids': participant_ids,
         'token_identifier': auth_token.token_identifier
     }
 
-    # Store in Redis for scheduler
-    job_key = f'test_notification:{walking_bus_id}:{int(time.time())}'
-    redis_client.setex(
-        job_key,
-        300,  # 5 minutes TTL
-        json.dumps(job_data)
-    )
-
-    # Notify scheduler
-    redis_client.publish('test_notification_requests', json.dumps({
-        'type': 'new_test_notification',
-        'job_key': job_key
-    }))
+    # Delayed job for the scheduler worker, due in 2 minutes
+    DelayedJobQueue().enqueue('test_notification', job_data, delay=TEST_NOTIFICATION_DELAY)
 
     current_app.logger.info(
         f"[TEST] Queued notification for bus {walking_bus_id}, "
@@ -1782,7 +1917,6 @@ def test_notification():
 @require_auth 
 def broadcast_notification():
     walking_bus_id = get_current_walking_bus_id()
-    push_service = PushService(walking_bus_id)
     
     data = request.json
     message = data.get('message', '').strip()
@@ -1792,7 +1926,6 @@ def broadcast_notification():
         return jsonify({'error': 'Message cannot be empty'}), 400
 
     unique_id = str(uuid4())
-    results = []
 
     notification_data = {
         'title': 'Walking Bus Nachricht',
@@ -1809,26 +1942,94 @@ def broadcast_notification():
         'requireInteraction': True
     }
 
-    # Get subscriptions based on target
-    subscriptions = push_service.get_subscriptions()
-    if target_bus_id:
-        subscriptions = [s for s in subscriptions if s.walking_bus_id == target_bus_id]
-
-    for subscription in subscriptions:
-        success, error, _ = push_service.send_notification(subscription, notification_data)
-        results.append({
-            'endpoint': subscription.endpoint,
-            'success': success,
-            'error': error
-        })
+    # Sending runs in the scheduler worker, progress via /api/tasks/<id>
+    task_id = TaskService().submit('broadcast', {
+        'walking_bus_id': walking_bus_id,
+        'notification_data': notification_data,
+        'target_bus_id': target_bus_id
+    }, walking_bus_id=walking_bus_id)
 
-    cleanup_result = push_service.cleanup_expired_subscriptions()
+    return task_response(task_id)
 
+
+def task_response(task_id):
+    """202 answer for a queued background task"""
     return jsonify({
-        'status': 'success',
-        'results': results,
-        'cleanup': cleanup_result
-    })
+        'status': 'queued',
+        'task_id': task_id,
+        'status_url': url_for('main.get_task_status', task_id=task_id),
+        'stream_url': url_for('main.stream_task_status', task_id=task_id)
+    }), 202
+
+
+def get_visible_task(task_id):
+    """Task status, None if unknown or belonging to another walking bus"""
+    task = TaskService().get(task_id)
+    if task is None:
+        return None
+    if task.get('walking_bus_id') not in (None, get_current_walking_bus_id()):
+        return None
+    return dict(task, id=task_id)
+
+
+@bp.route('/api/tasks/<task_id>')
+@require_auth
+def get_task_status(task_id):
+    task = get_visible_task(task_id)
+    if task is None:
+        return jsonify({'error': 'Task nicht gefunden'}), 404
+    return jsonify(task)
+
+
+@bp.route('/api/tasks/<task_id>/stream')
+@require_auth
+def stream_task_status(task_id):
+    """SSE with every status change of a task, closed once it has finished"""
+    task_service = TaskService()
+    # Subscribe before reading the state so no update falls in between
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(TaskService.channel(task_id))
+
+    task = get_visible_task(task_id)
+    if task is None:
+        pubsub.close()
+        return jsonify({'error': 'Task nicht gefunden'}), 404
+    # Release the connection for the lifetime of the stream
+    db.session.remove()
+
+    walking_bus_id = task.get('walking_bus_id')
+
+    def event_stream():
+        sse_connections.inc(stream='task', walking_bus_id=walking_bus_id)
+        try:
+            yield sse_event(task)
+            status = task['status']
+            while status not in FINAL_STATES:
+                message = pubsub.get_message(timeout=30.0)
+                if message is None:
+                    # Keep-alive, and catch up in case the worker died silently
+                    current = task_service.get(task_id)
+                    if current is None:
+                        break
+                    yield b": keep-alive\n\n"
+                    continue
+                update = loads(message['data'])
+                observe_pubsub_lag('task_updates', update, 'updated_at')
+                status = update.get('status')
+                yield sse_event(message['data'])
+        finally:
+            sse_connections.dec(stream='task', walking_bus_id=walking_bus_id)
+            pubsub.unsubscribe()
+            pubsub.close()
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive'
+        }
+    )
 
 
 @bp.route("/api/pwa-status", methods=["POST"])
@@ -1890,30 +2091,24 @@ def initialize_daily_status():
         
         current_app.logger.info(f"Initializing daily status for {target_date} at {current_time}")
 
-        # Update holiday cache
-        holiday_service = HolidayService()
-        holiday_service.update_holiday_cache()
-
-        # Clean up past entries for current date only
-        if not requested_date:
-            deleted_count = CalendarStatus.query.filter(
-                CalendarStatus.date < target_date,
-                CalendarStatus.walking_bus_id == walking_bus_id
-            ).delete()
-            current_app.logger.info(f"Deleted {deleted_count} past calendar entries")
-            db.session.commit()
+        # Clean up past entries for current date only, once a day in the background
+        if not requested_date and redis_client.set(
+            f'calendar_purge:{walking_bus_id}:{target_date.isoformat()}', 1, nx=True, ex=86400
+        ):
+            TaskService().submit('purge_past_calendar', {
+                'walking_bus_id': walking_bus_id,
+                'before': target_date.isoformat()
+            }, walking_bus_id=walking_bus_id, task_id=f'purge_calendar_{walking_bus_id}')
 
         # Get schedule information
         schedule = WalkingBusSchedule.query.filter_by(walking_bus_id=walking_bus_id).first()
         schedule_data = None
         if schedule:
             weekday = target_date.weekday()
-            weekday_name = WEEKDAY_MAPPING[weekday]
-            start_time = getattr(schedule, f"{weekday_name}_start", None)
-            end_time = getattr(schedule, f"{weekday_name}_end", None)
+            start_time, end_time = schedule.times_for(weekday)
             
             schedule_data = {
-                "active": getattr(schedule, weekday_name, False),
+                "active": schedule.has_weekday(weekday),
                 "start": start_time.strftime("%H:%M") if start_time else None,
                 "end": end_time.strftime("%H:%M") if end_time else None
             }
@@ -1984,9 +2179,10 @@ def get_week_overview():
     current_time = get_current_time().time()
     
     week_data = []
+    dates = [today + timedelta(days=i) for i in range(6)]
+    confirmed = calculate_confirmed_counts(walking_bus_id, dates)
     
-    for i in range(6):
-        current_date = today + timedelta(days=i)
+    for current_date in dates:
         # Get full walking bus day info including reason and reason_type
         is_active, reason, reason_type = check_walking_bus_day(
             current_date,
@@ -1998,8 +2194,7 @@ def get_week_overview():
         if current_date == today:
             schedule = WalkingBusSchedule.query.filter_by(walking_bus_id=walking_bus_id).first()
             if schedule:
-                weekday = WEEKDAY_MAPPING[current_date.weekday()]
-                end_time = getattr(schedule, f"{weekday}_end", None)
+                _, end_time = schedule.times_for(current_date.weekday())
                 if end_time and current_time > end_time:
                     is_active = False
                     reason = "Der Walking Bus hat heute bereits stattgefunden."
@@ -2007,8 +2202,7 @@ def get_week_overview():
         
         # Get schedule information
         schedule = WalkingBusSchedule.query.filter_by(walking_bus_id=walking_bus_id).first()
-        weekday = WEEKDAY_MAPPING[current_date.weekday()]
-        is_schedule_day = schedule and getattr(schedule, weekday, False)
+        is_schedule_day = schedule and schedule.is_active_on(current_date)
         
         # Check for manual override
         override = WalkingBusOverride.query.filter_by(
@@ -2022,27 +2216,8 @@ def get_week_overview():
             walking_bus_id=walking_bus_id
         ).first()
         
-        # Calculate total confirmed participants
-        total_confirmed = 0
-        if is_active:
-            participants = Participant.query.filter(
-                Participant.walking_bus_id == walking_bus_id,
-                Participant.station_id.isnot(None)
-            ).all()
-            
-            calendar_entries = CalendarStatus.query.filter_by(
-                walking_bus_id=walking_bus_id,
-                date=current_date
-            ).all()
-            
-            calendar_lookup = {entry.participant_id: entry.status for entry in calendar_entries}
-            
-            for participant in participants:
-                if participant.id in calendar_lookup:
-                    if calendar_lookup[participant.id]:
-                        total_confirmed += 1
-                elif getattr(participant, weekday, True):
-                    total_confirmed += 1
+        # Total confirmed participants (precomputed for the whole week)
+        total_confirmed = confirmed[current_date] if is_active else 0
         
         week_data.append({
             'date': current_date.isoformat(),
@@ -2162,9 +2337,9 @@ def update_schedule():
         schedule = WalkingBusSchedule(walking_bus_id=walking_bus_id)
         db.session.add(schedule)
     
-    for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']:
+    for index, day in WEEKDAY_MAPPING.items():
         day_data = data.get(day, {})
-        setattr(schedule, day, day_data.get('active', False))
+        schedule.set_weekday(index, day_data.get('active', False))
         
         start_time = day_data.get('start')
         end_time = day_data.get('end')
@@ -2179,9 +2354,9 @@ def update_schedule():
                     "error": f"Die Startzeit muss vor der Endzeit liegen ({day})"
                 }), 400
                 
-            setattr(schedule, f"{day}_start", start)
-            setattr(schedule, f"{day}_end", end)
+            schedule.set_times(index, start, end)
     
+    emit_change(walking_bus_id, 'schedule')
     db.session.commit()
     current_app.logger.info(f"[SCHEDULE] Schedule update completed for bus {walking_bus_id}")
     
@@ -2189,6 +2364,11 @@ def update_schedule():
     redis_client.publish('schedule_updates', json.dumps({
         'bus_id': walking_bus_id
     }))
+
+    # Changed times shift the weather windows; repeated saves coalesce into one job
+    DelayedJobQueue().enqueue(
+        'weather_recalculation', {}, delay=WEATHER_RECALCULATION_DELAY, job_id='weather_recalculation'
+    )
     
     return jsonify({"success": True})
 
@@ -2213,28 +2393,12 @@ def update_calendar_status():
     
     status = data['status']
     
-    calendar_entry = CalendarStatus.query.filter_by(
-        participant_id=participant_id,
-        date=date,
-        walking_bus_id=walking_bus_id
-    ).first()
-    
-    if calendar_entry:
-        calendar_entry.status = status
-        calendar_entry.is_manual_override = True
-    else:
-        calendar_entry = CalendarStatus(
-            participant_id=participant_id,
-            date=date,
-            status=status,
-            is_manual_override=True,
-            walking_bus_id=walking_bus_id
-        )
-        db.session.add(calendar_entry)
+    ParticipationService(walking_bus_id).load(date).set_status(participant, date, status)
     
     if date == get_current_date():
         participant.status_today = status
     
+    emit_change(walking_bus_id, 'participation', participant_id=participant.id, date=date, status=status)
     db.session.commit()
     current_app.logger.info(f"Kalenderstatus für {participant.name} (ID: {participant_id}) am {date} auf {status} gesetzt")
     return jsonify({"success": True})
@@ -2248,7 +2412,8 @@ def get_calendar_status(participant_id):
     
     entries = CalendarStatus.query.filter_by(
         participant_id=participant_id,
-        walking_bus_id=walking_bus_id
+        walking_bus_id=walking_bus_id,
+        is_manual_override=True
     ).all()
     
     return jsonify([{
@@ -2265,7 +2430,7 @@ def get_calendar_data(participant_id):
         walking_bus_id = get_current_walking_bus_id()
         if not walking_bus_id:
             return jsonify({"error": "No walking bus selected", "redirect": True}), 401
-        current_app.logger.info(f"Fetching calendar data for participant {participant_id}")
+        calendar_logger.debug("Fetching calendar data for participant %s", participant_id)
         
         # Verify participant belongs to current walking bus
         participant = Participant.query.filter_by(
@@ -2279,54 +2444,117 @@ def get_calendar_data(participant_id):
         week_start = today - timedelta(days=today.weekday())
         dates_to_check = [week_start + timedelta(days=x) for x in range(28)]
         
-        current_app.logger.info(f"Checking dates from {dates_to_check[0]} to {dates_to_check[-1]}")
+        calendar_logger.debug("Checking dates from %s to %s", dates_to_check[0], dates_to_check[-1])
 
-        # Get existing calendar entries for the participant within walking bus
-        calendar_entries = CalendarStatus.query.filter(
-            CalendarStatus.participant_id == participant_id,
-            CalendarStatus.walking_bus_id == walking_bus_id,
-            CalendarStatus.date.in_(dates_to_check)
-        ).all()
-        
-        current_app.logger.info(f"Found {len(calendar_entries)} existing calendar entries")
+        # Rules and overrides for the whole range in one go
+        participation = ParticipationService(walking_bus_id).load(dates_to_check[0], dates_to_check[-1])
         
-        calendar_data = []
-        for date in dates_to_check:
-            weekday = WEEKDAY_MAPPING[date.weekday()]
-            default_status = getattr(participant, weekday, False)
-            
-            # Find existing calendar entry if any
-            calendar_entry = next(
-                (entry for entry in calendar_entries if entry.date == date),
-                None
-            )
-            
-            # Get walking bus status from central function
-            is_active, reason, reason_type = check_walking_bus_day(date, include_reason=True)
-            
-            entry_data = {
-                'date': date.isoformat(),
-                'weekday': weekday,
-                'is_schedule_day': is_active,
-                'reason': reason,
-                'is_past': date < today,
-                'status': calendar_entry.status if calendar_entry else default_status,
-                'is_today': date == today
-            }
-            calendar_data.append(entry_data)
-            current_app.logger.debug(f"Processed date {date}: {entry_data}")
+        days = walking_bus_days(dates_to_check[0], dates_to_check[-1], walking_bus_id)
+        calendar_data = participant_calendar(participant, days, participation, today)
         
-        current_app.logger.info(f"Successfully compiled calendar data with {len(calendar_data)} entries")
+        calendar_logger.debug("Successfully compiled calendar data with %s entries", len(calendar_data))
         return jsonify(calendar_data)
         
     except Exception as e:
-        current_app.logger.error(f"Error in get_calendar_data: {str(e)}")
+        calendar_logger.error("Error in get_calendar_data: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
 
 
 
+def participant_calendar(participant, days, participation, today):
+    """Entries of /api/calendar-data for the days of walking_bus_days()"""
+    return [{
+        'date': date.isoformat(),
+        'weekday': WEEKDAY_MAPPING[date.weekday()],
+        'is_schedule_day': is_active,
+        'reason': reason,
+        'is_past': date < today,
+        'status': participation.status(participant, date),
+        'is_today': date == today
+    } for date, (is_active, reason, reason_type) in days.items()]
+
+
+@bp.route("/api/absences", methods=["POST", "DELETE"])
+@require_auth
+def update_absences():
+    """
+    Vacation mode: mark participants absent for a date range in one write,
+    DELETE lifts the absences of the range again.
+
+        {"participant_ids": [12, 13], "start_date": "2025-07-28", "end_date": "2025-08-08"}
+
+    Instead of participant_ids, subscription_id selects the children of a
+    push subscription. Days without walking bus are skipped. The response
+    carries the updated calendar of every participant.
+    """
+    walking_bus_id = get_current_walking_bus_id()
+    data = request.get_json(silent=True) or {}
+    today = get_current_date()
+
+    try:
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(data.get('end_date') or data['start_date'], '%Y-%m-%d').date()
+        if 'subscription_id' in data:
+            subscription = PushSubscription.query.filter_by(
+                id=int(data['subscription_id']),
+                walking_bus_id=walking_bus_id
+            ).first_or_404()
+            participant_ids = {int(participant_id) for participant_id in subscription.participant_ids}
+        else:
+            participant_ids = {int(participant_id) for participant_id in data['participant_ids']}
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "participant_ids oder subscription_id und start_date angeben"}), 400
+
+    if end_date < start_date:
+        return jsonify({"error": "Das Enddatum liegt vor dem Startdatum"}), 400
+    if start_date < today:
+        return jsonify({"error": "Abwesenheiten können nur ab heute eingetragen werden"}), 400
+    if (end_date - start_date).days >= ABSENCE_MAX_DAYS:
+        return jsonify({"error": f"Höchstens {ABSENCE_MAX_DAYS} Tage auf einmal"}), 400
+
+    participants = Participant.query.filter(
+        Participant.walking_bus_id == walking_bus_id,
+        Participant.id.in_(participant_ids)
+    ).order_by(Participant.id).all()
+    # A subscription may still list children that were removed since
+    if not participants or ('subscription_id' not in data and len(participants) != len(participant_ids)):
+        return jsonify({"error": "Teilnehmer nicht gefunden"}), 404
+    by_id = {participant.id: participant for participant in participants}
+
+    days = walking_bus_days(start_date, end_date, walking_bus_id)
+    participation = ParticipationService(walking_bus_id)
+    if request.method == 'POST':
+        skip_days = [day for day, (is_active, _, _) in days.items() if not is_active]
+        changed = participation.apply_absence(list(by_id), start_date, end_date, skip_days, today)
+    else:
+        changed = participation.clear_absences(list(by_id), start_date, end_date)
+
+    # Written in SQL, resolve the new state like every other read
+    participation.load(start_date, end_date)
+    if request.method == 'DELETE' and start_date <= today <= end_date:
+        for participant in participants:
+            participant.status_today = participation.status(participant, today)
+    for participant_id, day in changed:
+        emit_change(walking_bus_id, 'participation', participant_id=participant_id, date=day,
+                    status=participation.status(by_id[participant_id], day))
+    db.session.commit()
+
+    calendar_logger.info(
+        "Absences %s for participants %s from %s to %s, %s days changed",
+        'set' if request.method == 'POST' else 'cleared', sorted(by_id), start_date, end_date, len(changed)
+    )
+    return jsonify({
+        "success": True,
+        "changed": len(changed),
+        "calendars": [{
+            'participant_id': participant.id,
+            'calendar': participant_calendar(participant, days, participation, today)
+        } for participant in participants]
+    })
+
+
 @bp.route("/api/update-future-entries", methods=["PUT"])
 @require_auth
 def update_future_entries():
@@ -2342,47 +2570,16 @@ def update_future_entries():
         walking_bus_id=walking_bus_id
     ).first_or_404()
     
-    today = get_current_date()
-    
-    day_mapping = {
-        'monday': 0,
-        'tuesday': 1,
-        'wednesday': 2,
-        'thursday': 3,
-        'friday': 4,
-        'saturday': 5,
-        'sunday': 6
-    }
-    
-    target_weekday = day_mapping[day]
-    
-    future_dates = []
-    current_date = today
-    for _ in range(90):
-        if current_date.weekday() == target_weekday:
-            future_dates.append(current_date)
-        current_date += timedelta(days=1)
+    if day not in WEEKDAY_MAPPING.values():
+        return jsonify({"error": "Invalid day"}), 400
     
-    for date in future_dates:
-        calendar_entry = CalendarStatus.query.filter_by(
-            participant_id=participant_id,
-            walking_bus_id=walking_bus_id,
-            date=date
-        ).first()
-        
-        if not calendar_entry or not calendar_entry.is_manual_override:
-            if calendar_entry:
-                calendar_entry.status = status
-            else:
-                new_entry = CalendarStatus(
-                    participant_id=participant_id,
-                    walking_bus_id=walking_bus_id,
-                    date=date,
-                    status=status,
-                    is_manual_override=False
-                )
-                db.session.add(new_entry)
+    # A single rule change instead of one row per future date; manual overrides stay untouched
+    setattr(participant, day, status)
+    ParticipationService(walking_bus_id).set_weekday_mask(
+        participant, participant.weekday_mask, get_current_date()
+    )
     
+    emit_change(walking_bus_id, 'participant', participant_id=participant.id)
     db.session.commit()
     return jsonify({"success": True})
 
@@ -2390,6 +2587,10 @@ def update_future_entries():
 @bp.route('/api/trigger-update', methods=['POST'])
 @require_auth
 def trigger_update():
+    """
+    Kept for older clients (service worker before v36): writes now publish
+    their change events themselves after the commit, see change_event_service.
+    """
     walking_bus_id = get_current_walking_bus_id()
     data = request.get_json()
     
@@ -2399,6 +2600,12 @@ def trigger_update():
     else:
         update_date = get_current_date()
 
+    publish_status_update(walking_bus_id, update_date)
+    return jsonify({"success": True})
+
+
+def publish_status_update(walking_bus_id, update_date):
+    """Send the stations' state for a day to all /stream clients"""
     # Get walking bus status with reason
     is_active, reason, reason_type = check_walking_bus_day(
         update_date,
@@ -2414,36 +2621,27 @@ def trigger_update():
         "stations": current_status['stations'],
         "isWalkingBusDay": is_active,
         "reason": reason,
-        "reason_type": reason_type
+        "reason_type": reason_type,
+        "published_at": time.time()
     }
     
     current_app.logger.info(f"[TRIGGER] Publishing status update for date: {update_date}")
     current_app.logger.debug(f"[TRIGGER] Status data: {status_data}")
     
-    redis_client.publish('status_updates', json.dumps(status_data))
+    # Encoded once, every /stream subscriber forwards these bytes
+    redis_client.publish('status_updates', dumps_bytes(status_data))
     current_app.logger.info("[TRIGGER] Status update published to Redis")
-    
-    return jsonify({"success": True})
 
 
 def get_current_status(walking_bus_id, target_date):
-    stations = Station.query.filter_by(walking_bus_id=walking_bus_id).all()
+    stations = load_stations(walking_bus_id, Participant.weekday_mask)
+    participation = ParticipationService(walking_bus_id).load(target_date)
     
     stations_data = []
     for station in stations:
         participants_data = []
         for p in station.participants:
-            calendar_entry = CalendarStatus.query.filter_by(
-                participant_id=p.id,
-                date=target_date,
-                walking_bus_id=walking_bus_id
-            ).first()
-            
-            status = calendar_entry.status if calendar_entry else getattr(
-                p, 
-                WEEKDAY_MAPPING[target_date.weekday()], 
-                True
-            )
+            status = participation.status(p, target_date)
             
             participants_data.append({
                 "id": p.id,
@@ -2464,45 +2662,47 @@ def get_current_status(walking_bus_id, target_date):
 
 @bp.route('/stream')
 def stream():
+    walking_bus_id = get_current_walking_bus_id()
+    # The stream never touches the DB: give the connection back to the pool right away
+    db.session.remove()
+
     def event_stream():
-        walking_bus_id = get_current_walking_bus_id()
         pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
         pubsub.subscribe('status_updates')
         pubsub.subscribe(f'walking_bus_{walking_bus_id}_attendance')
         last_time = None
-        
-        while True:
-            try:
-                # Time updates (check current minute)
-                current_time = get_current_time().strftime("%H:%M")
-                if current_time != last_time:
-                    yield f"data: {json.dumps({'type': 'time_update', 'time': current_time})}\n\n"
-                    last_time = current_time
-
-                # Get Redis messages - this is blocking until message arrives
-                message = pubsub.get_message(timeout=60.0)  # Block until message or next minute
-                if message and message['type'] == 'message':
-                    channel = message['channel'].decode()
-                    if channel == 'status_updates':
-                        yield f"data: {message['data'].decode()}\n\n"
-                    elif channel == f'walking_bus_{walking_bus_id}_attendance':
-                        # Transform attendance message to SSE format
-                        attendance_data = json.loads(message['data'].decode())
-                        sse_message = {
-                            'type': 'attendance_update',
-                            'participant_id': attendance_data['participant_id'],
-                            'attendance': attendance_data['attendance'],
-                            'date': attendance_data['date']
-                        }
-                        yield f"data: {json.dumps(sse_message)}\n\n"
-
-            except Exception as e:
-                current_app.logger.error(f"[STREAM] Error: {e}")
-                yield "event: error\ndata: Connection error\n\n"
-                break
-
-        pubsub.unsubscribe()
-        pubsub.close()
+        sse_connections.inc(stream='status', walking_bus_id=walking_bus_id)
+
+        try:
+            while True:
+                try:
+                    # Time updates (check current minute)
+                    current_time = get_current_time().strftime("%H:%M")
+                    if current_time != last_time:
+                        yield time_update_event(current_time)
+                        last_time = current_time
+
+                    # Get Redis messages - this is blocking until message arrives
+                    message = pubsub.get_message(timeout=60.0)  # Block until message or next minute
+                    if message and message['type'] == 'message':
+                        channel = message['channel'].decode()
+                        # Publishers send the final SSE payload, forwarded without re-encoding
+                        if channel == 'status_updates':
+                            observe_pubsub_lag('status_updates', message['data'])
+                            yield sse_event(message['data'])
+                        elif channel == f'walking_bus_{walking_bus_id}_attendance':
+                            observe_pubsub_lag('attendance', message['data'])
+                            yield sse_event(message['data'])
+
+                except Exception as e:
+                    current_app.logger.error(f"[STREAM] Error: {e}")
+                    yield b"event: error\ndata: Connection error\n\n"
+                    break
+        finally:
+            # Also runs when the client disconnects (generator closed)
+            sse_connections.dec(stream='status', walking_bus_id=walking_bus_id)
+            pubsub.unsubscribe()
+            pubsub.close()
 
     return Response(
         stream_with_context(event_stream()),
@@ -2514,6 +2714,26 @@ def stream():
     )
 
 
+def observe_pubsub_lag(channel, payload, field='published_at'):
+    """Time from publish (epoch seconds in the message) to forwarding it to the client"""
+    try:
+        if isinstance(payload, (str, bytes)):
+            payload = loads(payload)
+        published_at = float(payload[field])
+    except (ValueError, TypeError, KeyError):
+        return
+    pubsub_lag.observe(max(time.time() - published_at, 0.0), channel=channel)
+
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Prometheus exposition, summed over all workers (optionally guarded by METRICS_TOKEN)"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized', status=401)
+    return Response(metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+
 @bp.route('/ALT_stream')
 def ALT_stream():
     def event_stream():
@@ -2533,23 +2753,21 @@ def ALT_stream():
                             
                             # Get schedule for time check
                             schedule = WalkingBusSchedule.query.filter_by(walking_bus_id=walking_bus_id).first()
-                            weekday = WEEKDAY_MAPPING[current_date.weekday()]
                             schedule_data = None
 
                             if schedule:
-                                start_time = getattr(schedule, f"{weekday}_start", None)
-                                end_time = getattr(schedule, f"{weekday}_end", None)
+                                start_time, end_time = schedule.times_for(current_date.weekday())
                                 
                                 schedule_data = {
-                                    "active": getattr(schedule, weekday, False),
+                                    "active": schedule.is_active_on(current_date),
                                     "start": start_time.strftime("%H:%M") if start_time else None,
                                     "end": end_time.strftime("%H:%M") if end_time else None
                                 }
 
                             # Get stations data
-                            stations = Station.query.filter_by(
-                                walking_bus_id=walking_bus_id
-                            ).order_by(Station.position).all()
+                            stations = load_stations(
+                                walking_bus_id, Participant.name, Participant.status_today
+                            )
                             
                             # Get week overview data
                             week_data = []
@@ -2561,18 +2779,12 @@ def ALT_stream():
                                 Participant.station_id.isnot(None)
                             ).all()
                             
-                            calendar_entries = CalendarStatus.query.filter(
-                                CalendarStatus.walking_bus_id == walking_bus_id,
-                                CalendarStatus.date >= today,
-                                CalendarStatus.date <= today + timedelta(days=5)
-                            ).all()
-                            
-                            # Create lookup dictionary
-                            calendar_lookup = {}
-                            for entry in calendar_entries:
-                                if entry.date not in calendar_lookup:
-                                    calendar_lookup[entry.date] = {}
-                                calendar_lookup[entry.date][entry.participant_id] = entry.status
+                            participation = ParticipationService(walking_bus_id).load(
+                                today, today + timedelta(days=5)
+                            )
+                            confirmed = participation.confirmed_counts(
+                                participants, [today + timedelta(days=i) for i in range(6)]
+                            )
 
                             # Process each day
                             for i in range(6):
@@ -2585,8 +2797,7 @@ def ALT_stream():
                                 
                                 # Check for TIME_PASSED specifically for today
                                 if check_date == today and is_active and schedule:
-                                    weekday = WEEKDAY_MAPPING[today.weekday()]
-                                    end_time = getattr(schedule, f"{weekday}_end", None)
+                                    _, end_time = schedule.times_for(today.weekday())
                                     if end_time:
                                         current_time_obj = current_time.time()
                                         if current_time_obj > end_time:
@@ -2597,13 +2808,7 @@ def ALT_stream():
                                 # Calculate confirmed participants
                                 total_confirmed = 0
                                 if is_active and reason_type != 'TIME_PASSED':
-                                    weekday = WEEKDAY_MAPPING[check_date.weekday()]
-                                    for participant in participants:
-                                        if check_date in calendar_lookup and participant.id in calendar_lookup[check_date]:
-                                            if calendar_lookup[check_date][participant.id]:
-                                                total_confirmed += 1
-                                        elif getattr(participant, weekday, True):
-                                            total_confirmed += 1
+                                    total_confirmed = confirmed[check_date]
                                 
                                 week_data.append({
                                     'date': check_date.isoformat(),
@@ -2618,18 +2823,11 @@ def ALT_stream():
                                 "time": current_time.strftime("%H:%M"),
                                 "date": current_date.isoformat(),
                                 "stations": [
-                                    {
-                                        "id": station.id,
-                                        "name": station.name,
-                                        "arrival_time": station.arrival_time.strftime("%H:%M") if station.arrival_time else None,
-                                        "participants": [
-                                            {
-                                                "id": p.id,
-                                                "name": p.name,
-                                                "status_today": p.status_today
-                                            } for p in station.participants
-                                        ]
-                                    } for station in stations
+                                    serialize_station(station, lambda p: {
+                                        "id": p.id,
+                                        "name": p.name,
+                                        "status_today": p.status_today
+                                    }) for station in stations
                                 ],
                                 "week_overview": week_data,
                                 "dailyStatus": {
@@ -2965,43 +3163,64 @@ def check_walking_bus_day(date, include_reason=False, walking_bus_id=None):
         date=date,
         walking_bus_id=walking_bus_id
     ).first()
+    # The schedule only matters on days without override and holiday
+    schedule = None
+    if override is None and find_holiday(date) is None:
+        schedule = WalkingBusSchedule.query.filter_by(walking_bus_id=walking_bus_id).first()
+
+    state = _walking_bus_day_state(date, override, schedule)
+    return state if include_reason else state[0]
+
+
+def walking_bus_days(start_date, end_date, walking_bus_id):
+    """
+    check_walking_bus_day(include_reason=True) for every day of a range,
+    with one query for the overrides and one for the schedule
+    """
+    overrides = {
+        override.date: override
+        for override in WalkingBusOverride.query.filter(
+            WalkingBusOverride.walking_bus_id == walking_bus_id,
+            WalkingBusOverride.date.between(start_date, end_date)
+        )
+    }
+    schedule = WalkingBusSchedule.query.filter_by(walking_bus_id=walking_bus_id).first()
+
+    days = {}
+    day = start_date
+    while day <= end_date:
+        days[day] = _walking_bus_day_state(day, overrides.get(day), schedule)
+        day += timedelta(days=1)
+    return days
+
+
+def _walking_bus_day_state(date, override, schedule):
+    """(is_active, reason, reason_type) of a day from its override and the bus schedule"""
     if override:
-        return (override.is_active, 
-                override.reason,
-                "MANUAL_OVERRIDE") if include_reason else override.is_active
+        return (override.is_active, override.reason, "MANUAL_OVERRIDE")
 
-    # Check for school holidays
-    holiday = SchoolHoliday.query\
-        .filter(SchoolHoliday.start_date <= date)\
-        .filter(SchoolHoliday.end_date >= date)\
-        .first()
+    # Check for school holidays (in-process calendar, refreshed by the scheduler)
+    holiday = find_holiday(date)
 
     if holiday:
         short_reason = holiday.name
         full_reason = f"Es sind {holiday.name}."
-        return (False, {"short_reason": short_reason, "full_reason": full_reason}, "HOLIDAY") if include_reason else False
+        return (False, {"short_reason": short_reason, "full_reason": full_reason}, "HOLIDAY")
 
-    # Get base schedule for specific walking bus
-    schedule = WalkingBusSchedule.query.filter_by(walking_bus_id=walking_bus_id).first()
     if not schedule:
-        return (False, "Achtung: Keine Planung angelegt!", "NO_SCHEDULE") if include_reason else False
+        return (False, "Achtung: Keine Planung angelegt!", "NO_SCHEDULE")
     
     # Check weekday schedule
     weekday = date.weekday()
     weekday_names = ['Montags', 'Dienstags', 'Mittwochs', 'Donnerstags', 'Freitags', 'Samstags', 'Sonntags']
-    if not getattr(schedule, WEEKDAY_MAPPING[weekday], False):
+    if not schedule.has_weekday(weekday):
         if weekday < 5:
-            return (False, f"{weekday_names[weekday]} findet kein Walking Bus statt.", "INACTIVE_WEEKDAY") if include_reason else False
+            return (False, f"{weekday_names[weekday]} findet kein Walking Bus statt.", "INACTIVE_WEEKDAY")
         else:
-            return (False, "Am Wochenende findet kein Walking Bus statt.", "WEEKEND") if include_reason else False
+            return (False, "Am Wochenende findet kein Walking Bus statt.", "WEEKEND")
   
     # Base case: Walking Bus is active
-    return (True, "Active", "ACTIVE") if include_reason else True
-
-
-def update_holiday_cache():
-    service = HolidayService()
-    service.update_holiday_cache()
+    return (True, "Active", "ACTIVE")
 
 
 @bp.route('/api/calendar/months/<int:year>/<int:month>/<int:count>')
@@ -3042,7 +3261,8 @@ def get_calendar_months(year, month, count):
         }.get(reason_type, "")
         
         calendar_data.append({
-            'date': current_date.isoformat(),
+            # Serialized as ISO 8601 by the app's JSON provider
+            'date': current_date,
             'is_active': is_active,
             'reason': display_reason,
             'reason_type': reason_type,
@@ -3096,6 +3316,8 @@ def toggle_walking_bus_override():
         display_reason = reason
         reason_type = "MANUAL_OVERRIDE"
     
+    emit_change(walking_bus_id, 'day', date=date, is_active=new_state,
+                reason=display_reason, reason_type=reason_type)
     db.session.commit()
     
     return jsonify({
@@ -3133,6 +3355,7 @@ def update_daily_note():
         if daily_note:
             db.session.delete(daily_note)
     
+    emit_change(walking_bus_id, 'note', date=date, note=note or None)
     db.session.commit()
     
     return jsonify({
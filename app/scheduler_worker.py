@@ -1,12 +1,21 @@
 from app import create_app, db
-from app.models import WalkingBus, WalkingBusSchedule, SchedulerJob, Participant, PushSubscription
+from app.models import Participant, PushSubscription, CalendarStatus
 from app.services.push_service import PushService
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.executors.pool import ProcessPoolExecutor
-from apscheduler.jobstores.base import JobLookupError
-from datetime import datetime, timedelta
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
+from datetime import datetime
+from functools import partial
 from app.services.weather_service import WeatherService
+from app.services.holiday_service import HolidayService
+from app.services.push_log_service import PushLogPartitionService
+from app.services.scheduler_service import SchedulerMetricsService, ReminderJobReconciler, REMINDER_JOB_PREFIX
+from app.services.lease_service import Lease, LeaseLost
+from app.services.job_queue_service import DelayedJobQueue, DelayedJobConsumer, RetryJob
+from app.services.task_service import TASK_QUEUE, task_handler
+from app.services.metrics_service import timed_job
+import threading
 import time
 import pytz
 import logging
@@ -25,28 +34,62 @@ logger.addHandler(logging.StreamHandler())
 redis_url = os.environ.get('REDIS_URL')
 redis_client = Redis.from_url(redis_url)
 
+# Buses run in parallel on this many processes, each bus is serialized by its Redis lease
+SCHEDULER_MAX_WORKERS = int(os.environ.get('SCHEDULER_MAX_WORKERS', 4))
+# Leases are renewed while the run is alive, the ttl only bounds a crashed holder
+LEASE_TTL = 60
+# Delayed jobs enqueued by the web workers (see DelayedJobQueue)
+QUEUE_WORKERS = int(os.environ.get('JOB_QUEUE_WORKERS', 4))
+QUEUE_POLL_INTERVAL = 1.0
+# Background tasks of the web UI get their own, smaller pool
+TASK_WORKERS = int(os.environ.get('TASK_QUEUE_WORKERS', 2))
+
 # Global scheduler instance
 scheduler = None
+reconciler = None
+
+
+_app = None
+_app_pid = None
+_app_lock = threading.Lock()
+
+
+def get_app():
+    """
+    The Flask app of this process, created once. Job handlers run on
+    threads of the long-lived worker (or in its pool processes) and only
+    enter an app context, instead of building a new app, engine and pool
+    per job. The pid check gives forked pool processes their own app.
+    """
+    global _app, _app_pid
+    if _app is None or _app_pid != os.getpid():
+        with _app_lock:
+            if _app is None or _app_pid != os.getpid():
+                _app = create_app()
+                _app_pid = os.getpid()
+    return _app
 
 
 def init_scheduler(app):
-    """Initialize the APScheduler with database job store"""
-    global scheduler
+    """
+    Initialize the APScheduler. Jobs live in memory only: reminder jobs are
+    derived from WalkingBusSchedule by the ReminderJobReconciler on startup.
+    """
+    global scheduler, reconciler
     
     if scheduler is None:
         logger.info("Initializing scheduler...")
-        database_url = os.environ.get('DATABASE_URL')
-        logger.info(f"Using database: {database_url}")
         
         jobstores = {
-            'default': SQLAlchemyJobStore(url=database_url)
+            'default': MemoryJobStore()
         }
         
         executors = {
             'default': ProcessPoolExecutor(
-                max_workers=1  # no more than one to avoid race conditions
+                max_workers=SCHEDULER_MAX_WORKERS
             )
         }
+        logger.info(f"Executor pool size: {SCHEDULER_MAX_WORKERS}")
         
         scheduler = BackgroundScheduler(
             jobstores=jobstores,
@@ -57,27 +100,59 @@ def init_scheduler(app):
                 'misfire_grace_time': 300  # 5 minute timeout
             }
         )
+        # Listeners run on scheduler threads without app context, the app is bound here
+        scheduler.add_listener(partial(record_job_run, app), EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+        reconciler = ReminderJobReconciler(scheduler, send_walking_bus_notifications)
     
     return scheduler
 
 
+def record_job_run(app, event):
+    """Report duration and queue lag of bus notification runs (runs in the scheduler process)"""
+    if not event.job_id.startswith(REMINDER_JOB_PREFIX):
+        return
+
+    # Keep the SchedulerJob read model's next run time current (the context teardown removes the session)
+    try:
+        with app.app_context():
+            reconciler.update_next_run(event.job_id)
+    except Exception as e:
+        logger.error(f"[SCHEDULER] Failed to update next run of {event.job_id}: {str(e)}")
+
+    if event.code == EVENT_JOB_MISSED:
+        logger.warning(f"[SCHEDULER][METRICS] Job {event.job_id} missed its run at {event.scheduled_run_time}")
+        return
+
+    report = event.retval if event.code == EVENT_JOB_EXECUTED else None
+    if not isinstance(report, dict):
+        logger.error(f"[SCHEDULER][METRICS] Job {event.job_id} failed: {event.exception}")
+        return
+
+    try:
+        run = SchedulerMetricsService(redis_client).record_run(
+            bus_id=report['bus_id'],
+            scheduled_at=event.scheduled_run_time.timestamp(),
+            started_at=report['started_at'],
+            duration=report['duration'],
+            outcome=report['outcome']
+        )
+        logger.info(
+            f"[SCHEDULER][METRICS] Bus {run['bus_id']}: {run['outcome']} | "
+            f"Duration: {run['duration']:.2f}s | Lag: {run['lag']:.2f}s"
+        )
+    except Exception as e:
+        logger.error(f"[SCHEDULER][METRICS] Failed to record run of {event.job_id}: {str(e)}")
+
+
 def init_redis_listener(app):
     """Initialize Redis listener for schedule changes"""
     logger.info(f"Initializing Redis listener with URL: {redis_url}")
     
     pubsub = redis_client.pubsub()
-    pubsub.subscribe('schedule_updates', 'test_notification_requests')
+    pubsub.subscribe('schedule_updates')
     return pubsub
 
 
-def initialize_all_schedules():
-    """Load and initialize all existing schedules on startup"""
-    with app.app_context():
-        buses = WalkingBus.query.all()
-        for bus in buses:
-            update_walking_bus_notifications(app, bus.id)
-
-
 def handle_schedule_change(app, data):
     """Process schedule change notification"""
     try:
@@ -88,97 +163,20 @@ def handle_schedule_change(app, data):
         logger.error(f"[REDIS] Error handling schedule change: {e}")
 
 
+@timed_job('update_walking_bus_notifications')
 def update_walking_bus_notifications(app, walking_bus_id=None):
-    """Update notification schedules for walking buses with concurrency control"""
-    lock_key = f"schedule_update_lock_{walking_bus_id or 'all'}"
+    """Reconcile the reminder jobs of one bus (or all) with their schedules"""
+    lease = Lease(f"schedule_update_lock_{walking_bus_id or 'all'}", ttl=LEASE_TTL, renew=True, client=redis_client)
     logger.info(f"[SCHEDULER] Starting update_walking_bus_notifications with walking_bus_id: {walking_bus_id}")
 
     with app.app_context():
         try:
-            # Try to acquire lock with 5 minute timeout
-            if not redis_client.set(lock_key, "1", ex=300, nx=True):
+            if not lease.acquire():
                 logger.info(f"[SCHEDULER] Schedule update already in progress for bus {walking_bus_id}")
                 return
 
-            # Query buses with optional filter
-            query = WalkingBus.query
-            if walking_bus_id:
-                query = query.filter_by(id=walking_bus_id)
-            buses = query.all()
-
-            for bus in buses:
-                try:
-                    logger.info(f"[SCHEDULER] Processing bus {bus.id} ({bus.name})")
-                    schedule = WalkingBusSchedule.query.filter_by(walking_bus_id=bus.id).first()
-                    
-                    if not schedule:
-                        logger.warning(f"[SCHEDULER] No schedule found for bus {bus.id}, skipping")
-                        continue
-
-                    weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 
-                               'friday', 'saturday', 'sunday']
-                    
-                    for day in weekdays:
-                        job_id = f'notify_bus_{bus.id}_{day}'
-                        
-                        # Handle inactive days
-                        if not getattr(schedule, day):
-                            try:
-                                scheduler.remove_job(job_id)
-                                SchedulerJob.query.filter_by(job_id=job_id).delete()
-                            except Exception as e:
-                                logger.debug(f"[SCHEDULER] No job to remove for {job_id}: {str(e)}")
-                            continue
-                            
-                        start_time = getattr(schedule, f"{day}_start")
-                        if not start_time:
-                            continue
-                            
-                        notification_time = (
-                            datetime.combine(datetime.today(), start_time) - 
-                            timedelta(minutes=55)
-                        ).time()
-                        
-                        # Create or update job
-                        try:
-                            job = scheduler.add_job(
-                                send_walking_bus_notifications,
-                                'cron',
-                                day_of_week=day[:3],
-                                hour=notification_time.hour,
-                                minute=notification_time.minute,
-                                args=[bus.id],
-                                id=job_id,
-                                replace_existing=True
-                            )
-                            
-                            # Update database record if scheduler is running
-                            if scheduler.running:
-                                scheduler_job = SchedulerJob.query.filter_by(job_id=job_id).first()
-                                if not scheduler_job:
-                                    scheduler_job = SchedulerJob(
-                                        walking_bus_id=bus.id,
-                                        job_id=job_id,
-                                        job_type='walking_bus_notification',
-                                        next_run_time=job.next_run_time
-                                    )
-                                    db.session.add(scheduler_job)
-                                else:
-                                    scheduler_job.next_run_time = job.next_run_time
-                                    
-                        except Exception as e:
-                            logger.error(f"[SCHEDULER] Failed to update job {job_id}: {str(e)}")
-                            continue
-                    
-                    # Commit changes for each bus
-                    db.session.commit()
-                    
-                except Exception as e:
-                    logger.error(f"[SCHEDULER] Error processing bus {bus.id}: {str(e)}")
-                    db.session.rollback()
-                    continue
-
-            logger.info("[SCHEDULER] Finished update_walking_bus_notifications successfully")
+            result = reconciler.reconcile([walking_bus_id] if walking_bus_id else None)
+            logger.info(f"[SCHEDULER] Finished update_walking_bus_notifications: {result}")
             
         except Exception as e:
             logger.error(f"[SCHEDULER] Critical error in update_walking_bus_notifications: {str(e)}")
@@ -186,8 +184,8 @@ def update_walking_bus_notifications(app, walking_bus_id=None):
             raise
             
         finally:
-            # Always clean up the lock
-            redis_client.delete(lock_key)
+            # Token-checked release, never deletes a lease another run has taken over
+            lease.release()
             
             # Ensure session is cleaned up
             try:
@@ -196,83 +194,136 @@ def update_walking_bus_notifications(app, walking_bus_id=None):
                 logger.error(f"[SCHEDULER] Error cleaning up session: {str(e)}")
 
 
-
+@timed_job('send_walking_bus_notifications')
 def send_walking_bus_notifications(bus_id):
-    """Execute notifications for a specific walking bus"""
+    """
+    Execute notifications for a specific walking bus.
+    Runs in a pool process; returns a run report for record_job_run.
+    """
+    started_at = time.time()
     logger.info(f"[SCHEDULER] Starting notifications for bus {bus_id}")
     
-    # Create lock key specific to this bus
-    lock_key = f"walking_bus_lock_{bus_id}"
+    # Lease specific to this bus, its fencing token goes into the push log
+    lease = Lease(f"walking_bus_lock_{bus_id}", ttl=LEASE_TTL, renew=True, client=redis_client)
+    outcome = 'failed'
     
-    # Create app context since this runs in a separate thread
-    app = create_app()
+    # Pool processes have no app of their own yet, the first job creates it
+    app = get_app()
 
     with app.app_context():
         try:
-            # Try to acquire lock with 5 minute expiry
-            if not redis_client.set(lock_key, "1", ex=300, nx=True):
+            if not lease.acquire():
                 logger.info(f"[SCHEDULER] Bus {bus_id} already being processed")
-                return False
-                
-            # Execute existing notification logic
-            try:
-                weather_service = WeatherService()
-                update_result = weather_service.update_weather()
-                if update_result["success"]:
-                    weather_service.update_weather_calculations()
-                logger.info("[SCHEDULER] Weather update completed successfully")
-            except Exception as e:
-                logger.error(f"[SCHEDULER] Weather update failed: {str(e)}")
-            
-            push_service = PushService(bus_id)
-            result = push_service.prepare_schedule_notifications()
-            logger.info(f"[SCHEDULER] Notification completed for bus {bus_id}: {result}")
-            return True
+                outcome = 'skipped'
+            else:
+                # Execute existing notification logic; concurrent runs share one weather update
+                try:
+                    weather_service = WeatherService()
+                    update_result = weather_service.update_weather()
+                    if update_result["success"]:
+                        weather_service.update_weather_calculations()
+                    logger.info(f"[SCHEDULER] Weather update: {update_result['message']}")
+                except Exception as e:
+                    logger.error(f"[SCHEDULER] Weather update failed: {str(e)}")
+
+                push_service = PushService(bus_id, lease=lease)
+                try:
+                    result = push_service.prepare_schedule_notifications()
+                except LeaseLost:
+                    # Keep the logs of everything sent before the lease was lost
+                    push_service.flush_logs()
+                    raise
+                logger.info(f"[SCHEDULER] Notification completed for bus {bus_id} (token {lease.token}): {result}")
+                outcome = 'success'
+
+        except LeaseLost as e:
+            logger.warning(f"[SCHEDULER] Stopped notifications for bus {bus_id}: {str(e)}")
+            db.session.rollback()
+            outcome = 'lease_lost'
             
         except Exception as e:
             logger.error(f"[SCHEDULER] Error sending notifications for bus {bus_id}: {str(e)}")
-            return False
             
         finally:
-            # Always clean up the lock
-            redis_client.delete(lock_key)
+            # Token-checked release, never deletes another run's lease
+            lease.release()
             db.session.remove()
 
+    return {
+        'bus_id': bus_id,
+        'started_at': started_at,
+        'duration': time.time() - started_at,
+        'outcome': outcome
+    }
 
-def handle_test_notification(app, job_key):
-    """Process a test notification job from Redis"""
-    logger.info(f"[TEST] Processing notification job: {job_key}")
-    
-    # Get job data from Redis
-    job_data = redis_client.get(job_key)
-    if not job_data:
-        logger.warning(f"[TEST] Job data not found for key: {job_key}")
-        return
-    
-    job_data = json.loads(job_data)
-    scheduled_time = datetime.now(pytz.timezone('Europe/Berlin')) + timedelta(minutes=2)
-    
-    # Create unique job ID
-    job_id = f"test_notification_{job_data['walking_bus_id']}_{int(time.time())}"
-    
-    # Schedule the job with token_identifier
+
+@timed_job('refresh_holidays')
+def refresh_holidays():
+    """Refresh the holiday table; web workers reload their calendars via pub/sub"""
+    logger.info("[HOLIDAYS] Starting scheduled holiday refresh")
+
+    app = get_app()
+    with app.app_context():
+        try:
+            HolidayService().update_holiday_cache()
+            logger.info("[HOLIDAYS] Holiday refresh completed")
+        except Exception as e:
+            logger.error(f"[HOLIDAYS] Holiday refresh failed: {str(e)}")
+        finally:
+            db.session.remove()
+
+
+def schedule_holiday_refresh():
+    """Daily holiday refresh, plus one run right after startup"""
     scheduler.add_job(
-        send_test_notifications,
-        'date',
-        run_date=scheduled_time,
-        id=job_id,
-        args=[job_data['walking_bus_id'], job_data['participant_ids'], job_data['token_identifier']],
+        refresh_holidays,
+        'cron',
+        hour=3,
+        minute=30,
+        id='refresh_holidays',
+        next_run_time=datetime.now(pytz.timezone('Europe/Berlin')),
         replace_existing=True
     )
-    
-    logger.info(f"[TEST] Scheduled job {job_id} for {scheduled_time}")
+    logger.info("[HOLIDAYS] Scheduled daily holiday refresh")
+
+
+@timed_job('maintain_push_log_partitions')
+def maintain_push_log_partitions():
+    """Create upcoming push log partitions and drop the expired ones"""
+    logger.info("[PUSH_LOG] Starting partition maintenance")
+
+    app = get_app()
+    with app.app_context():
+        try:
+            result = PushLogPartitionService().run_maintenance()
+            logger.info(f"[PUSH_LOG] Partition maintenance completed: {result}")
+        except Exception as e:
+            logger.error(f"[PUSH_LOG] Partition maintenance failed: {str(e)}")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+
+def schedule_push_log_maintenance():
+    """Daily partition maintenance, plus one run right after startup"""
+    scheduler.add_job(
+        maintain_push_log_partitions,
+        'cron',
+        hour=3,
+        minute=45,
+        id='maintain_push_log_partitions',
+        next_run_time=datetime.now(pytz.timezone('Europe/Berlin')),
+        replace_existing=True
+    )
+    logger.info("[PUSH_LOG] Scheduled daily partition maintenance")
 
 
+@timed_job('send_test_notifications')
 def send_test_notifications(walking_bus_id, participant_ids, token_identifier):
     """Execute test notifications"""
     logger.info(f"[TEST] Executing test notifications for bus {walking_bus_id}")
     
-    app = create_app()
+    app = get_app()
     with app.app_context():
         try:
             push_service = PushService(walking_bus_id)
@@ -323,50 +374,163 @@ def send_test_notifications(walking_bus_id, participant_ids, token_identifier):
             
         except Exception as e:
             logger.error(f"[TEST] Error sending notifications: {str(e)}")
-            return False
+            # Let the job queue retry / dead-letter it
+            raise
         finally:
             db.session.remove()
 
 
-def initialize_all_schedules():
-    """Initialize notification schedules for all existing walking buses on startup"""
-    logger.info("[INIT] Starting initial schedule setup")
-    
+@timed_job('retry_push_notification')
+def retry_push_notification(walking_bus_id, subscription_id, notification_data):
+    """Resend a notification that hit a rate limit; retried by the queue while it keeps being limited"""
+    app = get_app()
     with app.app_context():
-        # Get all walking buses with active schedules
-        buses = WalkingBus.query.join(WalkingBusSchedule).all()
-        
-        for bus in buses:
-            logger.info(f"[INIT] Setting up notifications for bus: {bus.id} - {bus.name}")
-            update_walking_bus_notifications(app, bus.id)
-            
-        logger.info(f"[INIT] Completed initial setup for {len(buses)} buses")
+        try:
+            subscription = db.session.get(PushSubscription, subscription_id)
+            if not subscription or not subscription.is_active:
+                logger.info(f"[QUEUE] Subscription {subscription_id} gone or paused, dropping retry")
+                return
+
+            push_service = PushService(walking_bus_id)
+            push_service.retry_rate_limited = False
+            success, error, _ = push_service.send_notification(subscription, notification_data)
+            if not success and push_service.last_retry_after is not None:
+                raise RetryJob(error, delay=push_service.last_retry_after)
+        finally:
+            db.session.remove()
+
+
+@timed_job('recalculate_weather')
+def recalculate_weather():
+    """Recompute weather calculations from the stored forecasts (no API call)"""
+    app = get_app()
+    with app.app_context():
+        try:
+            WeatherService().update_weather_calculations()
+        finally:
+            db.session.remove()
+
+
+@timed_job('broadcast_task')
+@task_handler
+def broadcast_task(progress, walking_bus_id, notification_data, target_bus_id=None):
+    """Send a broadcast message to all subscriptions of a bus"""
+    app = get_app()
+    with app.app_context():
+        try:
+            push_service = PushService(walking_bus_id)
+            result = push_service.send_broadcast(
+                notification_data,
+                target_bus_id=target_bus_id,
+                on_progress=lambda done, total: progress.report(done, total)
+            )
+            sent = sum(1 for r in result['results'] if r['success'])
+            logger.info(f"[TASK] Broadcast for bus {walking_bus_id}: {sent}/{len(result['results'])} sent")
+            return result
+        finally:
+            db.session.remove()
+
+
+@timed_job('weather_update_task')
+@task_handler
+def weather_update_task(progress):
+    """Fetch new weather data and recompute the calculations"""
+    app = get_app()
+    with app.app_context():
+        try:
+            weather_service = WeatherService()
+            progress.report(0, 2, 'Wetterdaten werden abgerufen')
+            update_result = weather_service.update_weather()
+            if not update_result["success"]:
+                return update_result
+            progress.report(1, 2, 'Wetterberechnungen werden aktualisiert')
+            calc_result = weather_service.update_weather_calculations()
+            progress.report(2, 2)
+            return calc_result
+        finally:
+            db.session.remove()
+
+
+@timed_job('purge_past_calendar_task')
+@task_handler
+def purge_past_calendar_task(progress, walking_bus_id, before):
+    """Delete calendar entries before the given date"""
+    app = get_app()
+    with app.app_context():
+        try:
+            deleted_count = CalendarStatus.query.filter(
+                CalendarStatus.date < datetime.fromisoformat(before).date(),
+                CalendarStatus.walking_bus_id == walking_bus_id
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            logger.info(f"[TASK] Deleted {deleted_count} past calendar entries of bus {walking_bus_id}")
+            return {'deleted': deleted_count}
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+
+TASK_HANDLERS = {
+    'broadcast': broadcast_task,
+    'weather_update': weather_update_task,
+    'purge_past_calendar': purge_past_calendar_task
+}
+
+
+JOB_HANDLERS = {
+    'test_notification': send_test_notifications,
+    'push_retry': retry_push_notification,
+    'weather_recalculation': recalculate_weather
+}
+
+
+def initialize_all_schedules(app):
+    """Derive the reminder jobs of all walking buses on startup (one schedule query)"""
+    logger.info("[INIT] Starting initial schedule setup")
+    update_walking_bus_notifications(app)
+    logger.info("[INIT] Completed initial schedule setup")
 
 
 if __name__ == '__main__':
     # Create Flask app instance with enhanced configuration
-    app = create_app()
+    app = get_app()
     
     with app.app_context():
         try:
             scheduler = init_scheduler(app)
             scheduler.start()
-            initialize_all_schedules()
+            initialize_all_schedules(app)
+            schedule_holiday_refresh()
+            schedule_push_log_maintenance()
             logger.info('Scheduler started with all existing schedules initialized')
             
             pubsub = init_redis_listener(app)
             logger.info('Redis listener initialized')
+
+            consumer = DelayedJobConsumer(DelayedJobQueue(client=redis_client), JOB_HANDLERS, max_workers=QUEUE_WORKERS)
+            task_consumer = DelayedJobConsumer(
+                DelayedJobQueue(TASK_QUEUE, client=redis_client), TASK_HANDLERS, max_workers=TASK_WORKERS
+            )
+            logger.info(f'Job queue consumer initialized with {QUEUE_WORKERS} workers, tasks with {TASK_WORKERS}')
             
-            for message in pubsub.listen():
-                if message['type'] == 'message':
+            # One loop for schedule messages and due queue jobs
+            while True:
+                message = pubsub.get_message(timeout=QUEUE_POLL_INTERVAL)
+                if message and message['type'] == 'message':
                     data = json.loads(message['data'])
                     logger.info(f"[REDIS] Received message: {data}")
                     
                     channel = message.get('channel', b'').decode('utf-8')
-                    if channel == 'test_notification_requests':
-                        handle_test_notification(app, data['job_key'])
-                    elif channel == 'schedule_updates':
+                    if channel == 'schedule_updates':
                         handle_schedule_change(app, data)
+
+                try:
+                    consumer.poll()
+                    task_consumer.poll()
+                except Exception as e:
+                    logger.error(f"[QUEUE] Polling failed: {str(e)}")
                     
         except Exception as e:
             logger.error(f"Critical error in scheduler worker: {e}")
@@ -376,3 +540,7 @@ if __name__ == '__main__':
                 scheduler.shutdown()
             if 'pubsub' in locals():
                 pubsub.close()
+            if 'consumer' in locals():
+                consumer.shutdown()
+            if 'task_consumer' in locals():
+                task_consumer.shutdown()
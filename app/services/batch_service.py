@@ -0,0 +1,189 @@
+from datetime import datetime
+from redis.exceptions import RedisError
+from .. import get_current_date, redis_client
+from ..models import db, Participant
+from .change_event_service import emit_change
+from .participation_service import ParticipationService
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_OPERATIONS = 500
+OPERATION_TYPES = ('participation', 'attendance')
+# Applied operation ids are remembered this long (offline outbox of the service worker)
+OPERATION_ID_KEY = 'batch_operation:{walking_bus_id}:{operation_id}'
+OPERATION_ID_TTL = 7 * 86400
+
+
+class BatchValidationError(ValueError):
+    """The batch was rejected as a whole; errors lists (index, message) per operation"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} ungültige Operation(en)')
+        self.errors = errors
+
+
+class BatchService:
+    """
+    Applies a list of typed operations of one walking bus in a single
+    transaction:
+
+        {"type": "participation", "participant_id": 12, "date": "2025-03-14", "status": false}
+        {"type": "attendance", "participant_id": 12, "attendance": true}
+
+    Statuses are absolute, so repeating a batch changes nothing. Ownership
+    of all participants is checked with one query, the changes are written
+    with set-based upserts (see ParticipationService.apply_statuses) and
+    announced as change events, published together after the commit.
+
+    An operation may carry a client "id" (the service worker outbox sends
+    one per queued change). Ids applied before are skipped and listed as
+    duplicates, so a toggled-back status is not overwritten by a late replay.
+    """
+
+    def __init__(self, walking_bus_id, client=None):
+        self.walking_bus_id = walking_bus_id
+        self.redis = client or redis_client
+
+    def parse(self, operations, today):
+        """Validate the shape of every operation, returns (index, type, participant_id, day, value, id) tuples"""
+        if not isinstance(operations, list) or not operations:
+            raise BatchValidationError([(None, 'operations fehlt')])
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            raise BatchValidationError([(None, f'Höchstens {BATCH_MAX_OPERATIONS} Operationen pro Anfrage')])
+
+        parsed, errors = [], []
+        for index, operation in enumerate(operations):
+            try:
+                op_type = operation['type']
+                participant_id = int(operation['participant_id'])
+                operation_id = operation.get('id')
+                if operation_id is not None and (not isinstance(operation_id, str) or not operation_id):
+                    errors.append((index, 'Ungültige ID'))
+                    continue
+                if op_type == 'participation':
+                    day = datetime.strptime(operation['date'], '%Y-%m-%d').date()
+                    value = operation['status']
+                elif op_type == 'attendance':
+                    # Attendance is only recorded for the current day
+                    day = today
+                    value = operation['attendance']
+                    if operation.get('date') not in (None, today.isoformat()):
+                        errors.append((index, 'Anwesenheit nur für heute möglich'))
+                        continue
+                else:
+                    errors.append((index, f'Unbekannter Typ, erlaubt: {", ".join(OPERATION_TYPES)}'))
+                    continue
+            except (KeyError, TypeError, ValueError):
+                errors.append((index, 'Ungültige Operation'))
+                continue
+            if not isinstance(value, bool):
+                errors.append((index, 'Status muss true oder false sein'))
+                continue
+            parsed.append((index, op_type, participant_id, day, value, operation_id))
+
+        if errors:
+            raise BatchValidationError(errors)
+        return parsed
+
+    def apply(self, operations):
+        """Validate and apply all operations or none; returns a summary of what changed"""
+        today = get_current_date()
+        parsed = self.parse(operations, today)
+
+        seen = self._seen_ids({operation_id for *_, operation_id in parsed if operation_id})
+        duplicates = [operation_id for *_, operation_id in parsed if operation_id in seen]
+        parsed = [operation for operation in parsed if operation[5] not in seen]
+        if not parsed:
+            return {'participation': [], 'attendance': [], 'duplicates': duplicates}
+
+        # Ownership of every participant in one query
+        participant_ids = {participant_id for _, _, participant_id, _, _, _ in parsed}
+        participants = {
+            participant.id: participant
+            for participant in Participant.query.filter(
+                Participant.walking_bus_id == self.walking_bus_id,
+                Participant.id.in_(participant_ids)
+            )
+        }
+        errors = [
+            (index, 'Teilnehmer nicht gefunden')
+            for index, _, participant_id, _, _, _ in parsed
+            if participant_id not in participants
+        ]
+        if errors:
+            raise BatchValidationError(errors)
+
+        # Later operations on the same participant and day win
+        statuses, attendance = {}, {}
+        for index, op_type, participant_id, day, value, _ in parsed:
+            if op_type == 'participation':
+                statuses[(participants[participant_id], day)] = value
+            else:
+                attendance[(participant_id, day)] = (index, value)
+
+        days = [day for _, day in statuses] + [today] * bool(attendance)
+        participation = ParticipationService(self.walking_bus_id).load(min(days), max(days))
+
+        for (participant_id, day), (index, value) in attendance.items():
+            participant = participants[participant_id]
+            participating = statuses.get((participant, day), participation.status(participant, day))
+            if value and not participating:
+                errors.append((index, 'Anwesenheit kann nur für teilnehmende Personen geändert werden'))
+        if errors:
+            raise BatchValidationError(errors)
+
+        try:
+            changed_statuses = participation.apply_statuses(statuses, today=today)
+            changed_attendance = participation.apply_attendance(
+                {key: value for key, (_, value) in attendance.items()}
+            )
+            for participant_id, day, status in changed_statuses:
+                emit_change(self.walking_bus_id, 'participation', participant_id=participant_id, date=day, status=status)
+            for participant_id, day, value in changed_attendance:
+                emit_change(self.walking_bus_id, 'attendance', participant_id=participant_id, date=day, attendance=value)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        # Only after the commit, a failed batch is retried as a whole
+        self._remember_ids([operation_id for *_, operation_id in parsed if operation_id])
+
+        return {
+            'participation': [
+                {'participant_id': participant_id, 'date': day, 'status': status}
+                for participant_id, day, status in changed_statuses
+            ],
+            'attendance': [
+                {'participant_id': participant_id, 'date': day, 'attendance': value}
+                for participant_id, day, value in changed_attendance
+            ],
+            'duplicates': duplicates
+        }
+
+    def _id_key(self, operation_id):
+        return OPERATION_ID_KEY.format(walking_bus_id=self.walking_bus_id, operation_id=operation_id)
+
+    def _seen_ids(self, operation_ids):
+        if not operation_ids:
+            return set()
+        operation_ids = list(operation_ids)
+        try:
+            found = self.redis.mget([self._id_key(operation_id) for operation_id in operation_ids])
+        except RedisError as e:
+            # Statuses are absolute, applying an operation twice only costs the write
+            logger.warning(f"[BATCH] Could not read applied operation ids, applying without check: {e}")
+            return set()
+        return {operation_id for operation_id, value in zip(operation_ids, found) if value}
+
+    def _remember_ids(self, operation_ids):
+        if not operation_ids:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            for operation_id in operation_ids:
+                pipe.set(self._id_key(operation_id), 1, ex=OPERATION_ID_TTL)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[BATCH] Could not remember {len(operation_ids)} applied operation ids: {e}")
@@ -0,0 +1,129 @@
+from .. import redis_client
+from ..json_provider import dumps_bytes
+from sqlalchemy import event
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bus-scoped channel of /stream (also carried the single attendance toggles before)
+BUS_CHANNEL = 'walking_bus_{walking_bus_id}_attendance'
+# Changes within this window go out as one message per bus
+WINDOW = float(os.getenv('CHANGE_EVENT_WINDOW_MS', 200)) / 1000
+
+# Event type -> fields identifying the changed entity; a later event with the same key replaces an earlier one
+EVENT_KEYS = {
+    'participation': ('participant_id', 'date'),
+    'attendance': ('participant_id', 'date'),
+    'day': ('date',),
+    'note': ('date',),
+    'participant': ('participant_id',),
+    'schedule': (),
+    'stations': ()
+}
+
+OUTBOX_KEY = 'change_events'
+
+
+def emit_change(walking_bus_id, event_type, session=None, **fields):
+    """
+    Record a change in the outbox of the current transaction. It is
+    published after the commit (coalesced with other changes of the bus)
+    and dropped on rollback:
+
+        emit_change(walking_bus_id, 'participation', participant_id=12, date=day, status=False)
+    """
+    if event_type not in EVENT_KEYS:
+        raise ValueError(f'Unknown change event type {event_type}')
+    if session is None:
+        from ..models import db
+        session = db.session
+
+    key = (walking_bus_id, event_type) + tuple(str(fields[name]) for name in EVENT_KEYS[event_type])
+    outbox = session.info.setdefault(OUTBOX_KEY, {})
+    # Re-insert so the event keeps the position of its latest change
+    outbox.pop(key, None)
+    outbox[key] = dict(fields, type=event_type)
+
+
+def _after_commit(session):
+    outbox = session.info.pop(OUTBOX_KEY, None)
+    if outbox:
+        publisher.add(outbox)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    # A rolled back savepoint keeps the events of the enclosing transaction
+    if not previous_transaction.nested:
+        session.info.pop(OUTBOX_KEY, None)
+
+
+def install_change_events(session):
+    """Flush the outbox of every commit of session (a Session, sessionmaker or scoped_session)"""
+    if not event.contains(session, 'after_commit', _after_commit):
+        event.listen(session, 'after_commit', _after_commit)
+        event.listen(session, 'after_soft_rollback', _after_soft_rollback)
+
+
+class ChangeEventPublisher:
+    """
+    Collects committed change events per walking bus for WINDOW seconds and
+    publishes them as one {"type": "changes", "events": [...]} message on
+    the bus channel, so a burst of writes costs one fan-out.
+    """
+
+    def __init__(self, client=None, window=WINDOW):
+        self.redis = client
+        self.window = window
+        self._lock = threading.Lock()
+        self._reset_process()
+
+    def _reset_process(self):
+        self._pid = os.getpid()
+        self._pending = {}
+        self._timer = None
+
+    @property
+    def client(self):
+        return self.redis or redis_client
+
+    def add(self, events):
+        if self.window <= 0:
+            self.publish(events)
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_process()
+            for key, change in events.items():
+                self._pending.pop(key, None)
+                self._pending[key] = change
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            events, self._pending = self._pending, {}
+            self._timer = None
+        self.publish(events)
+
+    def publish(self, events):
+        by_bus = {}
+        for (walking_bus_id, *_), change in events.items():
+            by_bus.setdefault(walking_bus_id, []).append(change)
+
+        published_at = time.time()
+        for walking_bus_id, changes in by_bus.items():
+            try:
+                self.client.publish(
+                    BUS_CHANNEL.format(walking_bus_id=walking_bus_id),
+                    dumps_bytes({'type': 'changes', 'events': changes, 'published_at': published_at})
+                )
+            except Exception as e:
+                # Clients catch up on their next reload, the write itself is committed
+                logger.error(f"[CHANGES] Could not publish {len(changes)} events for bus {walking_bus_id}: {str(e)}")
+
+
+publisher = ChangeEventPublisher()
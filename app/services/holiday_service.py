@@ -1,139 +1,354 @@
 import requests
 from flask import current_app
 from datetime import datetime, date, timedelta
+from collections import namedtuple
+from itertools import accumulate
+from redis.exceptions import RedisError
+from sqlalchemy import insert
 from ..models import SchoolHoliday, db
+from .. import redis_client
+import bisect
+import json
+import logging
 import os
+import re
+import threading
+import time
+
+HOLIDAY_UPDATES_CHANNEL = 'holiday_updates'
+# Safety net in case an invalidation message gets lost (e.g. Redis restart)
+CALENDAR_MAX_AGE = 6 * 3600
+# ISO 3166 country and subdivision part; "DE-" plus the subdivision fits String(10)
+COUNTRY_CODE = re.compile(r'^[A-Z]{2}$')
+SUBDIVISION_CODE = re.compile(r'^[A-Z0-9]{1,7}$')
+
+logger = logging.getLogger(__name__)
+
+Holiday = namedtuple('Holiday', ['start_date', 'end_date', 'name'])
+
+
+def configured_subdivisions():
+    """
+    Subdivision codes as used by the OpenHolidays API, e.g. ['DE-NW'].
+    HOLIDAY_SUBDIVISION may list several subdivisions separated by commas.
+    Invalid entries are skipped, codes must fit school_holidays.subdivision.
+    """
+    country = os.getenv('HOLIDAY_COUNTRY', 'DE').strip().upper()
+    if not COUNTRY_CODE.match(country):
+        logger.warning(f"[HOLIDAYS] Invalid HOLIDAY_COUNTRY {country!r}, using DE")
+        country = 'DE'
+
+    codes = []
+    for subdivision in os.getenv('HOLIDAY_SUBDIVISION', 'NW').split(','):
+        subdivision = subdivision.strip().upper()
+        if not subdivision:
+            continue
+        if not SUBDIVISION_CODE.match(subdivision):
+            logger.warning(f"[HOLIDAYS] Ignoring invalid subdivision {subdivision!r} in HOLIDAY_SUBDIVISION")
+            continue
+        code = f"{country}-{subdivision}"
+        if code not in codes:
+            codes.append(code)
+    return codes or [f"{country}-NW"]
+
+
+def default_subdivision():
+    """The first configured subdivision is used for all lookups without explicit subdivision"""
+    return configured_subdivisions()[0]
+
+
+def merge_holidays(school_holidays, public_holidays):
+    """
+    Merge school and public holidays in one sweep over sorted intervals.
+    School holidays are always kept; a public holiday is dropped if it overlaps
+    a school holiday or a public holiday that was already taken.
+    """
+    school_holidays = sorted(school_holidays, key=lambda h: (h.start_date, h.end_date))
+
+    # Union of all school holiday intervals, still sorted by start
+    blocked = []
+    for holiday in school_holidays:
+        if blocked and holiday.start_date <= blocked[-1][1]:
+            blocked[-1][1] = max(blocked[-1][1], holiday.end_date)
+        else:
+            blocked.append([holiday.start_date, holiday.end_date])
+
+    merged = list(school_holidays)
+    index = 0
+    last_public_end = None
+    for holiday in sorted(public_holidays, key=lambda h: (h.start_date, h.end_date)):
+        # Skip school blocks that end before this holiday starts
+        while index < len(blocked) and blocked[index][1] < holiday.start_date:
+            index += 1
+        if index < len(blocked) and blocked[index][0] <= holiday.end_date:
+            continue
+        if last_public_end is not None and holiday.start_date <= last_public_end:
+            continue
+        merged.append(holiday)
+        last_public_end = holiday.end_date
+
+    merged.sort(key=lambda h: (h.start_date, h.end_date))
+    return merged
+
+
+class HolidayCalendar:
+    """Immutable interval index over holidays, sorted by start date"""
+
+    def __init__(self, holidays):
+        self.holidays = sorted(holidays, key=lambda h: (h.start_date, h.end_date))
+        self._starts = [h.start_date for h in self.holidays]
+        # Running maximum of end dates, lets lookups stop early even if intervals overlap
+        self._max_ends = list(accumulate((h.end_date for h in self.holidays), max))
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.holidays)
+
+    def lookup(self, day):
+        """Return the holiday covering the given date or None"""
+        index = bisect.bisect_right(self._starts, day) - 1
+        while index >= 0 and self._max_ends[index] >= day:
+            holiday = self.holidays[index]
+            if holiday.end_date >= day:
+                return holiday
+            index -= 1
+        return None
+
+    def is_stale(self):
+        return time.monotonic() - self.loaded_at > CALENDAR_MAX_AGE
+
+
+_calendars = {}
+_calendar_lock = threading.Lock()
+_listener_pid = None
+_listener_retry_at = 0.0
+
+
+def get_holiday_calendar(subdivision=None):
+    """
+    Return the in-process holiday calendar for a subdivision.
+    Loaded once per process from the database, dropped again when the scheduler
+    publishes a refresh on HOLIDAY_UPDATES_CHANNEL.
+    """
+    subdivision = subdivision or default_subdivision()
+    _ensure_invalidation_listener()
+
+    calendar = _calendars.get(subdivision)
+    if calendar is not None and not calendar.is_stale():
+        return calendar
+
+    with _calendar_lock:
+        calendar = _calendars.get(subdivision)
+        if calendar is None or calendar.is_stale():
+            rows = db.session.query(
+                SchoolHoliday.start_date,
+                SchoolHoliday.end_date,
+                SchoolHoliday.name
+            ).filter(SchoolHoliday.subdivision == subdivision).all()
+            calendar = HolidayCalendar(Holiday(*row) for row in rows)
+            _calendars[subdivision] = calendar
+            logger.info(f"[HOLIDAYS] Loaded {len(calendar)} holidays for {subdivision}")
+    return calendar
+
+
+def find_holiday(day, subdivision=None):
+    """Shortcut for get_holiday_calendar(subdivision).lookup(day)"""
+    return get_holiday_calendar(subdivision).lookup(day)
+
+
+def invalidate_holiday_calendar(subdivision=None):
+    """Drop cached calendars of this process (all subdivisions if none is given)"""
+    with _calendar_lock:
+        if subdivision:
+            _calendars.pop(subdivision, None)
+        else:
+            _calendars.clear()
+
+
+def publish_holiday_update(subdivision=None):
+    """Tell every process to reload its holiday calendar"""
+    invalidate_holiday_calendar(subdivision)
+    try:
+        redis_client.publish(HOLIDAY_UPDATES_CHANNEL, json.dumps({'subdivision': subdivision}))
+    except RedisError as e:
+        logger.warning(f"[HOLIDAYS] Could not publish calendar invalidation: {e}")
+
+
+def _handle_invalidation(message):
+    try:
+        subdivision = json.loads(message['data']).get('subdivision')
+    except (TypeError, ValueError, AttributeError):
+        subdivision = None
+    invalidate_holiday_calendar(subdivision)
+    logger.info(f"[HOLIDAYS] Calendar invalidated ({subdivision or 'all'})")
+
+
+def _handle_listener_error(error, pubsub, thread):
+    """Listener died (e.g. Redis restart): forget everything and resubscribe on next lookup"""
+    global _listener_pid
+    logger.warning(f"[HOLIDAYS] Invalidation listener stopped: {error}")
+    thread.stop()
+    pubsub.close()
+    _listener_pid = None
+    invalidate_holiday_calendar()
+
+
+def _ensure_invalidation_listener():
+    """Subscribe once per process; the pid check covers forked gunicorn workers"""
+    global _listener_pid, _listener_retry_at
+    if _listener_pid == os.getpid() or time.monotonic() < _listener_retry_at:
+        return
+
+    with _calendar_lock:
+        if _listener_pid == os.getpid():
+            return
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{HOLIDAY_UPDATES_CHANNEL: _handle_invalidation})
+            pubsub.run_in_thread(
+                sleep_time=1.0,
+                daemon=True,
+                exception_handler=_handle_listener_error
+            )
+            _listener_pid = os.getpid()
+            # Anything loaded before the subscription may already be outdated
+            _calendars.clear()
+        except RedisError as e:
+            # Without Redis the calendar still expires after CALENDAR_MAX_AGE
+            _listener_retry_at = time.monotonic() + 60
+            logger.warning(f"[HOLIDAYS] Could not subscribe to calendar invalidations: {e}")
 
 
 class HolidayService:
-    def __init__(self):
+    def __init__(self, fixture_dir=None):
         self.base_url = "https://openholidaysapi.org/"
         self.country = os.getenv('HOLIDAY_COUNTRY', 'DE')
-        self.subdivision = os.getenv('HOLIDAY_SUBDIVISION', 'NW')
+        self.subdivision_codes = configured_subdivisions()
+        # Directory with <code>_school.json / <code>_public.json instead of the API (offline runs)
+        self.fixture_dir = fixture_dir or os.getenv('HOLIDAY_FIXTURE_DIR')
+
+    def fetch_holidays(self, kind, subdivision_code, valid_from, valid_to):
+        """
+        Fetch raw holidays of one kind ('school' or 'public') from the API
+        or from the fixture directory if configured
+        """
+        if self.fixture_dir:
+            path = os.path.join(self.fixture_dir, f"{subdivision_code}_{kind}.json")
+            current_app.logger.info(f"Reading {kind} holidays from fixture {path}")
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        endpoint = 'SchoolHolidays' if kind == 'school' else 'PublicHolidays'
+        params = {
+            'countryIsoCode': self.country,
+            'validFrom': valid_from.strftime('%Y-%m-%d'),
+            'validTo': valid_to.strftime('%Y-%m-%d'),
+            'languageIsoCode': self.country,
+            'subdivisionCode': subdivision_code
+        }
+        current_app.logger.info(f"Requesting {kind} holidays with params: {params}")
+
+        response = requests.get(f"{self.base_url}/{endpoint}", params=params, timeout=30)
+        response.raise_for_status()
+        return response.json()
 
-    def update_holiday_cache(self):
+    @staticmethod
+    def parse_holidays(raw_holidays, default_name, today):
+        """Convert API entries into Holiday tuples, ignoring everything already over"""
+        holidays = []
+        for holiday in raw_holidays:
+            start = datetime.strptime(holiday['startDate'], '%Y-%m-%d').date()
+            end = datetime.strptime(holiday['endDate'], '%Y-%m-%d').date()
+            name = next((n['text'] for n in holiday['name'] if n['language'] == 'DE'), default_name)
+            if end >= today:
+                holidays.append(Holiday(start, end, name))
+        return holidays
+
+    def update_holiday_cache(self, force=False):
         """
-        Updates holiday cache for next 12 months and cleans up old entries
+        Updates holiday cache for next 12 months and cleans up old entries.
+        Only called by the scheduler, request handlers read the in-process calendar.
+        All subdivisions are fetched first and then written in one transaction.
         """
         today = date.today()
         first_of_month = today.replace(day=1)
-        
-        current_app.logger.info(f"Starting holiday cache update for {today}")
-        
-        # Delete all holidays from past months
         first_of_last_month = (first_of_month - timedelta(days=1)).replace(day=1)
-        deleted_count = SchoolHoliday.query.filter(SchoolHoliday.end_date < first_of_last_month).delete()
-        current_app.logger.info(f"Deleted {deleted_count} outdated holiday entries")
-        
-        # Check if we need to update current data
-        latest_update = db.session.query(SchoolHoliday.last_update)\
-            .order_by(SchoolHoliday.last_update.desc())\
-            .first()
-        
-        current_app.logger.info(f"Latest update was: {latest_update[0] if latest_update else 'Never'}")
-            
-        if latest_update and latest_update[0] == first_of_month:
+        valid_to = today + timedelta(days=365)
+
+        current_app.logger.info(f"Starting holiday cache update for {today}")
+
+        latest_updates = dict(
+            db.session.query(SchoolHoliday.subdivision, db.func.max(SchoolHoliday.last_update))
+            .filter(SchoolHoliday.subdivision.in_(self.subdivision_codes))
+            .group_by(SchoolHoliday.subdivision)
+            .all()
+        )
+
+        pending = [
+            code for code in self.subdivision_codes
+            if force or latest_updates.get(code) != first_of_month
+        ]
+        if not pending:
             current_app.logger.info("Cache is up to date, skipping update")
             return
-            
-        # Clear existing future holidays
-        future_deleted = SchoolHoliday.query.filter(SchoolHoliday.start_date >= today).delete()
-        current_app.logger.info(f"Deleted {future_deleted} future holiday entries")
-        
-        # Calculate date range for API request
-        start_date = today.strftime('%Y-%m-%d')
-        end_date = (today + timedelta(days=365)).strftime('%Y-%m-%d')
-        
-        # First: Get School Holidays
-        url = f"{self.base_url}/SchoolHolidays"
-        params = {
-            'countryIsoCode': self.country,
-            'validFrom': start_date,
-            'validTo': end_date,
-            'languageIsoCode': self.country,
-            'subdivisionCode': f'{self.country}-{self.subdivision}'
-        }
-        
-        current_app.logger.info(f"Requesting school holidays with params: {params}")
-        
+
+        # Network first, so the transaction below stays short
+        merged = {}
+        for code in pending:
+            school = self.parse_holidays(
+                self.fetch_holidays('school', code, today, valid_to), 'Unbekannte Ferien', today)
+            public = self.parse_holidays(
+                self.fetch_holidays('public', code, today, valid_to), 'Unbekannter Feiertag', today)
+            merged[code] = merge_holidays(school, public)
+            current_app.logger.info(
+                f"{code}: {len(school)} school and {len(public)} public holidays, "
+                f"{len(merged[code])} after merge"
+            )
+
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            holidays = response.json()
-            current_app.logger.info(f"Retrieved {len(holidays)} school holidays")
-            
-            for holiday in holidays:
-                start = datetime.strptime(holiday['startDate'], '%Y-%m-%d').date()
-                end = datetime.strptime(holiday['endDate'], '%Y-%m-%d').date()
-                name = next((n['text'] for n in holiday['name'] if n['language'] == 'DE'), 'Unbekannte Ferien')
-                
-                if end >= today:
-                    new_holiday = SchoolHoliday(
-                        start_date=start,
-                        end_date=end,
-                        name=name,
-                        last_update=first_of_month
-                    )
-                    db.session.add(new_holiday)
-                    current_app.logger.info(f"Added school holiday: {name} ({start} to {end})")
-            
-            # Second: Get Public Holidays
-            url = f"{self.base_url}/PublicHolidays"
-            current_app.logger.info(f"Requesting public holidays with params: {params}")
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            public_holidays = response.json()
-            current_app.logger.info(f"Retrieved {len(public_holidays)} public holidays")
-            
-            for holiday in public_holidays:
-                start = datetime.strptime(holiday['startDate'], '%Y-%m-%d').date()
-                end = datetime.strptime(holiday['endDate'], '%Y-%m-%d').date()
-                name = next((n['text'] for n in holiday['name'] if n['language'] == 'DE'), 'Unbekannter Feiertag')
-                
-                # Check for overlap with existing holidays
-                existing_holiday = SchoolHoliday.query\
-                    .filter(SchoolHoliday.start_date <= end)\
-                    .filter(SchoolHoliday.end_date >= start)\
-                    .first()
-                
-                if not existing_holiday and end >= today:
-                    new_holiday = SchoolHoliday(
-                        start_date=start,
-                        end_date=end,
-                        name=name,
-                        last_update=first_of_month
-                    )
-                    db.session.add(new_holiday)
-                    current_app.logger.info(f"Added public holiday: {name} ({start} to {end})")
-            
+            # Drop outdated entries and replace the whole future window
+            deleted_count = SchoolHoliday.query.filter(
+                SchoolHoliday.subdivision.in_(pending),
+                db.or_(
+                    SchoolHoliday.end_date < first_of_last_month,
+                    SchoolHoliday.end_date >= today
+                )
+            ).delete(synchronize_session=False)
+            current_app.logger.info(f"Deleted {deleted_count} outdated or future holiday entries")
+
+            rows = [
+                {
+                    'start_date': holiday.start_date,
+                    'end_date': holiday.end_date,
+                    'name': holiday.name,
+                    'subdivision': code,
+                    'last_update': first_of_month
+                }
+                for code, holidays in merged.items()
+                for holiday in holidays
+            ]
+            if rows:
+                db.session.execute(insert(SchoolHoliday), rows)
+
             db.session.commit()
-            current_app.logger.info("Successfully committed all holiday updates to database")
-            
+            current_app.logger.info(f"Successfully committed {len(rows)} holiday entries to database")
+
         except Exception as e:
             current_app.logger.error(f"Error updating holiday cache: {str(e)}")
             db.session.rollback()
             raise
 
-  
+        for code in pending:
+            publish_holiday_update(code)
+
     def is_school_holiday(self, date):
         """
-        Check if given date is during school holidays using cached data
+        Check if given date is during school holidays using the in-process calendar
         """
         try:
-            current_app.logger.info(f"Checking holiday status for {date}")
-            self.update_holiday_cache()
-            
-            holiday = SchoolHoliday.query\
-                .filter(SchoolHoliday.start_date <= date)\
-                .filter(SchoolHoliday.end_date >= date)\
-                .first()
-                
+            holiday = find_holiday(date)
             if holiday:
-                current_app.logger.info(f"Found holiday: {holiday.name}")
                 return True, holiday.name
-            
-            current_app.logger.info("No holiday found for this date")
             return False, None
         except Exception as e:
             current_app.logger.error(f"Error in is_school_holiday: {str(e)}")
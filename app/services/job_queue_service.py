@@ -0,0 +1,299 @@
+from .. import redis_client
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = 'jobs'
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_VISIBILITY_TIMEOUT = 300
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 3600
+
+# A job id that is still waiting or running is not queued a second time.
+# Optionally writes a status hash (KEYS[3], ttl ARGV[4], field/value pairs
+# from ARGV[5]) in the same step, only for a job that was actually queued.
+ENQUEUE_SCRIPT = """
+if redis.call('hsetnx', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+    return 0
+end
+redis.call('zadd', KEYS[2], ARGV[3], ARGV[1])
+if KEYS[3] then
+    for i = 5, #ARGV, 2 do
+        redis.call('hset', KEYS[3], ARGV[i], ARGV[i + 1])
+    end
+    redis.call('expire', KEYS[3], ARGV[4])
+end
+return 1
+"""
+
+# Move due jobs to the in-flight set and count the attempt, all in one step
+CLAIM_SCRIPT = """
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local claimed = {}
+for _, id in ipairs(due) do
+    redis.call('zrem', KEYS[1], id)
+    redis.call('zadd', KEYS[2], ARGV[3], id)
+    local attempts = redis.call('hincrby', KEYS[4], id, 1)
+    table.insert(claimed, id)
+    table.insert(claimed, redis.call('hget', KEYS[3], id))
+    table.insert(claimed, attempts)
+end
+return claimed
+"""
+
+# In-flight jobs past their visibility timeout become due again
+REQUEUE_SCRIPT = """
+local expired = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    redis.call('zrem', KEYS[1], id)
+    redis.call('zadd', KEYS[2], ARGV[1], id)
+end
+return #expired
+"""
+
+ACK_SCRIPT = """
+if redis.call('zrem', KEYS[1], ARGV[1]) == 1 then
+    redis.call('hdel', KEYS[2], ARGV[1])
+    redis.call('hdel', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+RETRY_SCRIPT = """
+if redis.call('zrem', KEYS[1], ARGV[1]) == 1 then
+    redis.call('zadd', KEYS[2], ARGV[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class RetryJob(Exception):
+    """Raised by a handler to retry the job after a given delay (seconds)"""
+
+    def __init__(self, message, delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+class QueuedJob:
+    def __init__(self, job_id, data, attempts):
+        self.id = job_id
+        self.type = data['type']
+        self.payload = data['payload']
+        self.max_attempts = data.get('max_attempts', DEFAULT_MAX_ATTEMPTS)
+        self.enqueued_at = data.get('enqueued_at')
+        self.attempts = attempts
+
+
+class DelayedJobQueue:
+    """
+    Delayed job queue on Redis sorted sets.
+
+    <name>:delayed   zset job id -> due time
+    <name>:inflight  zset job id -> visibility deadline of the current claim
+    <name>:data      hash job id -> job json
+    <name>:attempts  hash job id -> claims so far
+    <name>:dead      hash job id -> job json with the last error
+
+    A claimed job that is neither acked nor failed before its visibility
+    timeout is handed out again; after max_attempts it is dead-lettered.
+    Consumers extend the timeout of the jobs they are still running, so it
+    only expires for jobs whose consumer died.
+    """
+
+    def __init__(self, name=DEFAULT_QUEUE, client=None):
+        self.redis = client or redis_client
+        self.delayed_key = f"{name}:delayed"
+        self.inflight_key = f"{name}:inflight"
+        self.data_key = f"{name}:data"
+        self.attempts_key = f"{name}:attempts"
+        self.dead_key = f"{name}:dead"
+
+        self._enqueue = self.redis.register_script(ENQUEUE_SCRIPT)
+        self._claim = self.redis.register_script(CLAIM_SCRIPT)
+        self._requeue = self.redis.register_script(REQUEUE_SCRIPT)
+        self._ack = self.redis.register_script(ACK_SCRIPT)
+        self._retry = self.redis.register_script(RETRY_SCRIPT)
+
+    def enqueue(self, job_type, payload, delay=0, max_attempts=DEFAULT_MAX_ATTEMPTS, job_id=None,
+                status_key=None, status=None, status_ttl=None):
+        """
+        Schedule a job delay seconds from now. A fixed job_id coalesces
+        repeated enqueues while that job is waiting or running; returns None then.
+        status (already encoded field values) is written to the hash status_key
+        together with the job, and only if the job was queued.
+        """
+        job_id = job_id or uuid4().hex
+        data = json.dumps({
+            'type': job_type,
+            'payload': payload,
+            'max_attempts': max_attempts,
+            'enqueued_at': time.time()
+        })
+
+        keys = [self.data_key, self.delayed_key]
+        args = [job_id, data, time.time() + delay]
+        if status_key:
+            keys.append(status_key)
+            args.append(status_ttl or 0)
+            for name, value in (status or {}).items():
+                args.extend((name, value))
+        created = self._enqueue(keys=keys, args=args)
+        return job_id if created else None
+
+    def claim(self, limit=10, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """Atomically take up to limit due jobs"""
+        now = time.time()
+        raw = self._claim(
+            keys=[self.delayed_key, self.inflight_key, self.data_key, self.attempts_key],
+            args=[now, limit, now + visibility_timeout]
+        )
+        jobs = []
+        for index in range(0, len(raw), 3):
+            job_id, data, attempts = raw[index:index + 3]
+            job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+            if data is None:
+                # Data vanished (e.g. dead-lettered meanwhile), nothing to run
+                self.ack(job_id)
+                continue
+            jobs.append(QueuedJob(job_id, json.loads(data), int(attempts)))
+        return jobs
+
+    def extend(self, job_ids, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """Push the visibility deadline of claimed jobs that are still running (no-op for acked ones)"""
+        deadline = time.time() + visibility_timeout
+        self.redis.zadd(self.inflight_key, {job_id: deadline for job_id in job_ids}, xx=True)
+
+    def requeue_expired(self):
+        return self._requeue(keys=[self.inflight_key, self.delayed_key], args=[time.time()])
+
+    def ack(self, job_id):
+        return bool(self._ack(keys=[self.inflight_key, self.data_key, self.attempts_key], args=[job_id]))
+
+    def fail(self, job, error, delay=None):
+        """Retry with exponential backoff, or dead-letter once max_attempts is reached"""
+        if job.attempts >= job.max_attempts:
+            self.dead_letter(job, error)
+            return False
+
+        if delay is None:
+            delay = min(RETRY_BASE_DELAY * 2 ** (job.attempts - 1), RETRY_MAX_DELAY)
+        self._retry(keys=[self.inflight_key, self.delayed_key], args=[job.id, time.time() + delay])
+        return True
+
+    def dead_letter(self, job, error):
+        entry = json.dumps({
+            'type': job.type,
+            'payload': job.payload,
+            'attempts': job.attempts,
+            'error': str(error)[:500],
+            'failed_at': time.time()
+        })
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.inflight_key, job.id)
+        pipe.zrem(self.delayed_key, job.id)
+        pipe.hdel(self.data_key, job.id)
+        pipe.hdel(self.attempts_key, job.id)
+        pipe.hset(self.dead_key, job.id, entry)
+        pipe.execute()
+        logger.error(f"[QUEUE] Dead-lettered {job.type} job {job.id} after {job.attempts} attempts: {error}")
+
+    def dead_letters(self):
+        return {
+            (job_id.decode() if isinstance(job_id, bytes) else job_id): json.loads(entry)
+            for job_id, entry in self.redis.hgetall(self.dead_key).items()
+        }
+
+    def stats(self):
+        pipe = self.redis.pipeline()
+        pipe.zcard(self.delayed_key)
+        pipe.zcard(self.inflight_key)
+        pipe.hlen(self.dead_key)
+        delayed, inflight, dead = pipe.execute()
+        return {'delayed': delayed, 'inflight': inflight, 'dead': dead}
+
+
+class DelayedJobConsumer:
+    """
+    Polls the queue from the scheduler worker's event loop and runs the
+    handlers on a small thread pool. Handlers take the job payload as
+    keyword arguments; raising RetryJob or any other exception fails the job.
+    """
+
+    def __init__(self, queue, handlers, max_workers=4, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        self.queue = queue
+        self.handlers = handlers
+        self.max_workers = max_workers
+        self.visibility_timeout = visibility_timeout
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-queue')
+        self.running = 0
+        self._active = set()
+        self._heartbeat_at = 0.0
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """Requeue timed-out jobs and start as many due jobs as there are free threads"""
+        self.heartbeat()
+        self.queue.requeue_expired()
+
+        with self._lock:
+            free = self.max_workers - self.running
+        if free <= 0:
+            return 0
+
+        jobs = self.queue.claim(limit=free, visibility_timeout=self.visibility_timeout)
+        for job in jobs:
+            if job.attempts > job.max_attempts:
+                self.queue.dead_letter(job, 'Visibility timeout exceeded on every attempt')
+                continue
+            with self._lock:
+                self.running += 1
+                self._active.add(job.id)
+            self.pool.submit(self._run, job)
+        return len(jobs)
+
+    def _run(self, job):
+        try:
+            handler = self.handlers.get(job.type)
+            if handler is None:
+                self.queue.dead_letter(job, f"No handler for job type {job.type}")
+                return
+
+            logger.info(f"[QUEUE] Running {job.type} job {job.id} (attempt {job.attempts}/{job.max_attempts})")
+            handler(**job.payload)
+            self.queue.ack(job.id)
+        except RetryJob as e:
+            logger.warning(f"[QUEUE] {job.type} job {job.id} asked for a retry: {str(e)}")
+            self.queue.fail(job, e, delay=e.delay)
+        except Exception as e:
+            logger.error(f"[QUEUE] {job.type} job {job.id} failed: {str(e)}")
+            self.queue.fail(job, e)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self._active.discard(job.id)
+
+    def heartbeat(self):
+        """
+        Keep the claims of running jobs alive, every third of the visibility
+        timeout: a long broadcast must not be handed out (or dead-lettered)
+        again while it is still being sent.
+        """
+        now = time.monotonic()
+        if now - self._heartbeat_at < self.visibility_timeout / 3:
+            return
+        with self._lock:
+            job_ids = list(self._active)
+        if job_ids:
+            self.queue.extend(job_ids, self.visibility_timeout)
+        self._heartbeat_at = now
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
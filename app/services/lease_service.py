@@ -0,0 +1,140 @@
+from .. import redis_client
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Take the lease only if it is free; the fencing counter is bumped in the same step
+ACQUIRE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+local token = redis.call('incr', KEYS[2])
+redis.call('set', KEYS[1], token, 'PX', ARGV[1])
+return token
+"""
+
+# Extend / delete only while the key still holds our token
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLost(Exception):
+    """The lease expired or was taken over while work was still running"""
+
+
+class Lease:
+    """
+    Redis lease with token-checked release and optional renewal.
+
+    Every successful acquire gets a fencing token from a per-lease counter,
+    strictly increasing across holders. Work that writes somewhere else
+    (e.g. PushNotificationLog) stores the token, so writes of a holder that
+    lost its lease can be told apart from the current holder's.
+
+        with Lease(f"walking_bus_lock_{bus_id}", ttl=300, renew=True) as lease:
+            if lease.acquired:
+                ...
+                lease.check()  # raises LeaseLost
+    """
+
+    def __init__(self, name, ttl=300, renew=False, client=None):
+        self.name = name
+        self.fence_key = f"{name}:fence"
+        self.ttl_ms = int(ttl * 1000)
+        self.auto_renew = renew
+        self.redis = client or redis_client
+        self.token = None
+        self._lost = threading.Event()
+        self._stop = threading.Event()
+        self._renewer = None
+
+        self._acquire = self.redis.register_script(ACQUIRE_SCRIPT)
+        self._renew = self.redis.register_script(RENEW_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_SCRIPT)
+
+    @property
+    def acquired(self):
+        return self.token is not None
+
+    @property
+    def lost(self):
+        return self._lost.is_set()
+
+    def acquire(self):
+        token = int(self._acquire(keys=[self.name, self.fence_key], args=[self.ttl_ms]))
+        if not token:
+            return False
+
+        self.token = token
+        self._lost.clear()
+        if self.auto_renew:
+            self._stop.clear()
+            self._renewer = threading.Thread(
+                target=self._renew_loop, name=f"lease-{self.name}", daemon=True
+            )
+            self._renewer.start()
+        return True
+
+    def renew(self):
+        """Extend the lease by its ttl; False if it is no longer ours"""
+        if not self.acquired:
+            return False
+        if self._renew(keys=[self.name], args=[self.token, self.ttl_ms]):
+            return True
+        self._lost.set()
+        return False
+
+    def _renew_loop(self):
+        # Renew at a third of the ttl, so one missed round still leaves time
+        interval = self.ttl_ms / 3000
+        while not self._stop.wait(interval):
+            try:
+                if not self.renew():
+                    logger.warning(f"[LEASE] Lost lease {self.name} (token {self.token})")
+                    return
+            except Exception as e:
+                logger.error(f"[LEASE] Renewal of {self.name} failed: {str(e)}")
+
+    def check(self):
+        """Raise LeaseLost if the lease is not held anymore"""
+        if not self.acquired or self.lost:
+            raise LeaseLost(f"Lease {self.name} (token {self.token}) is no longer held")
+
+    def newest_token(self):
+        """Latest fencing token handed out for this lease (authoritative, read from Redis)"""
+        value = self.redis.get(self.fence_key)
+        return int(value) if value is not None else None
+
+    def release(self):
+        """Delete the key only if it still holds our token"""
+        if not self.acquired:
+            return False
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join(timeout=1)
+            self._renewer = None
+        released = bool(self._release(keys=[self.name], args=[self.token]))
+        if not released:
+            logger.warning(f"[LEASE] Lease {self.name} (token {self.token}) expired before release")
+        self.token = None
+        return released
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
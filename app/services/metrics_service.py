@@ -0,0 +1,326 @@
+from .. import redis_client
+from functools import wraps
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+VALUES_KEY = 'metrics:values'
+GAUGE_PROCESSES_KEY = 'metrics:gauge_processes'
+GAUGE_KEY = 'metrics:gauges:{process}'
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+# A process that stopped flushing drops out of the gauges after this long
+GAUGE_TTL = max(3 * FLUSH_INTERVAL, 30)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+JOB_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _series(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return {key: str(value) for key, value in labels.items()}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(_series(self.name + '_total', self._labels(labels)), amount)
+
+
+class Gauge(Metric):
+    """Per process value, summed over all live processes on export"""
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self.registry.add_gauge(_series(self.name, self._labels(labels)), amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        for bound in self.buckets:
+            if value <= bound:
+                self.registry.add(_series(self.name + '_bucket', dict(labels, le=_format_value(bound))), 1)
+        self.registry.add(_series(self.name + '_bucket', dict(labels, le='+Inf')), 1)
+        self.registry.add(_series(self.name + '_sum', labels), value)
+        self.registry.add(_series(self.name + '_count', labels), 1)
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class MetricsRegistry:
+    """
+    In-process metrics, flushed to Redis every METRICS_FLUSH_INTERVAL
+    seconds so /metrics can show the sum over all gunicorn workers and the
+    scheduler worker. Counters and histograms are flushed as increments
+    (HINCRBYFLOAT), gauges as absolute values per process.
+    """
+
+    def __init__(self, client=None):
+        self.redis = client
+        self.enabled = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self._reset_process()
+
+    def _reset_process(self):
+        self._pid = os.getpid()
+        self._pending = {}
+        self._gauges = {}
+        self._flusher = None
+
+    @property
+    def client(self):
+        return self.redis or redis_client
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _ensure_process(self):
+        # Forked (gunicorn worker, pool process): start over with an own flusher
+        if self._pid != os.getpid():
+            self._reset_process()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def add(self, series, amount):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._ensure_process()
+            self._pending[series] = self._pending.get(series, 0) + amount
+
+    def add_gauge(self, series, amount):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._ensure_process()
+            self._gauges[series] = self._gauges.get(series, 0) + amount
+
+    @property
+    def process_id(self):
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def flush(self):
+        """Push pending increments and current gauges to Redis"""
+        if not self.enabled or self._pid != os.getpid():
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            gauges = dict(self._gauges)
+
+        pipe = self.client.pipeline()
+        for series, amount in pending.items():
+            pipe.hincrbyfloat(VALUES_KEY, series, amount)
+        if gauges:
+            gauge_key = GAUGE_KEY.format(process=self.process_id)
+            pipe.hset(gauge_key, mapping=gauges)
+            pipe.expire(gauge_key, int(GAUGE_TTL))
+            pipe.zadd(GAUGE_PROCESSES_KEY, {self.process_id: time.time()})
+        try:
+            pipe.execute()
+        except Exception as e:
+            # Keep the increments for the next attempt
+            with self._lock:
+                for series, amount in pending.items():
+                    self._pending[series] = self._pending.get(series, 0) + amount
+            logger.error(f"[METRICS] Flush failed: {str(e)}")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def collect(self):
+        """series -> value over all processes"""
+        values = {
+            series.decode(): float(value)
+            for series, value in self.client.hgetall(VALUES_KEY).items()
+        }
+
+        cutoff = time.time() - GAUGE_TTL
+        self.client.zremrangebyscore(GAUGE_PROCESSES_KEY, '-inf', cutoff)
+        processes = [process.decode() for process in self.client.zrange(GAUGE_PROCESSES_KEY, 0, -1)]
+        pipe = self.client.pipeline()
+        for process in processes:
+            pipe.hgetall(GAUGE_KEY.format(process=process))
+        for gauges in pipe.execute():
+            for series, value in gauges.items():
+                series = series.decode()
+                values[series] = values.get(series, 0) + float(value)
+        return values
+
+    def exposition(self):
+        """Prometheus text format (version 0.0.4)"""
+        self.flush()
+        by_metric = {}
+        for series, value in self.collect().items():
+            name, labels = json.loads(series)
+            by_metric.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for metric in sorted(self.metrics.values(), key=lambda m: m.name):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            if metric.type == 'counter':
+                names = [metric.name + '_total']
+            elif metric.type == 'histogram':
+                names = [metric.name + '_bucket', metric.name + '_sum', metric.name + '_count']
+            else:
+                names = [metric.name]
+            for name in names:
+                for labels, value in sorted(by_metric.get(name, ()), key=self._series_order):
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _series_order(entry):
+        labels, _ = entry
+        other = [(key, value) for key, value in labels if key != 'le']
+        le = next((value for key, value in labels if key == 'le'), None)
+        return other, float('inf') if le == '+Inf' else float(le or 0)
+
+    def reset(self):
+        self.client.delete(VALUES_KEY)
+
+
+metrics = MetricsRegistry()
+
+# HTTP
+http_request_duration = metrics.histogram(
+    'walkingbus_http_request_duration_seconds',
+    'Latency of authenticated API requests',
+    ('endpoint', 'method', 'status')
+)
+auth_checks = metrics.counter(
+    'walkingbus_auth_checks',
+    'Token checks in require_auth by result',
+    ('result',)
+)
+
+# Server-Sent Events and Redis pub/sub
+sse_connections = metrics.gauge(
+    'walkingbus_sse_connections',
+    'Open SSE connections',
+    ('stream', 'walking_bus_id')
+)
+pubsub_lag = metrics.histogram(
+    'walkingbus_pubsub_lag_seconds',
+    'Delay between publishing a Redis message and forwarding it to an SSE client',
+    ('channel',),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+
+# Push notifications
+push_notifications = metrics.counter(
+    'walkingbus_push_notifications',
+    'Push notifications by type and result',
+    ('notification_type', 'result')
+)
+push_send_duration = metrics.histogram(
+    'walkingbus_push_send_duration_seconds',
+    'Duration of a single web push request',
+    ('notification_type',)
+)
+
+# Background work
+weather_update_duration = metrics.histogram(
+    'walkingbus_weather_update_duration_seconds',
+    'Duration of WeatherService.update_weather',
+    ('result',),
+    buckets=JOB_BUCKETS
+)
+scheduler_job_duration = metrics.histogram(
+    'walkingbus_scheduler_job_duration_seconds',
+    'Duration of scheduler and job queue functions',
+    ('job', 'outcome'),
+    buckets=JOB_BUCKETS
+)
+
+
+def timed_job(name):
+    """
+    Record duration and outcome of a scheduler job function. Flushes right
+    away, pool processes may exit before the next periodic flush.
+    """
+    def decorator(func):
+        @wraps(func)
+        def run(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = func(*args, **kwargs)
+                outcome = result.get('outcome', 'success') if isinstance(result, dict) else 'success'
+                return result
+            finally:
+                scheduler_job_duration.observe(time.perf_counter() - started, job=name, outcome=outcome)
+                metrics.flush()
+        return run
+    return decorator
@@ -0,0 +1,118 @@
+from sqlalchemy import Integer, cast, column, func, values
+from ..models import db, Participant, Station
+
+ORDER_MAX_ITEMS = 500
+
+
+class OrderValidationError(ValueError):
+    """Rejected order request; status is the HTTP status the route answers with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class OrderingService:
+    """
+    Reorders stations and moves participants of one walking bus. Every call
+    writes all positions with a single UPDATE ... FROM (VALUES ...), the
+    ownership check is part of the statement's WHERE clause: if not every
+    row matched, the request is rejected and nothing is kept.
+    """
+
+    def __init__(self, walking_bus_id):
+        self.walking_bus_id = walking_bus_id
+
+    def reorder_stations(self, station_ids):
+        """Give the stations positions 0..n-1 in the order of station_ids"""
+        station_ids = self._ids(station_ids)
+        rows = [(station_id, position) for position, station_id in enumerate(station_ids)]
+
+        table = Station.__table__
+        positions = values(
+            column('id', Integer), column('position', Integer), name='new_positions'
+        ).data(rows)
+        result = db.session.execute(
+            table.update()
+            .where(table.c.id == positions.c.id, table.c.walking_bus_id == self.walking_bus_id)
+            .values(position=positions.c.position)
+        )
+        self._check_rowcount(result, rows, 'Station nicht gefunden')
+        return len(rows)
+
+    def move_participants(self, groups):
+        """
+        groups lists containers with the full participant order after a drag:
+
+            [{"station_id": 3, "participant_ids": [12, 7, 9]},
+             {"station_id": null, "participant_ids": [4]}]
+
+        station_id null is the unassigned section. Participants take the
+        station of their container and their index as position.
+        """
+        if not isinstance(groups, list) or not groups:
+            raise OrderValidationError('Keine Stationen angegeben')
+
+        rows, seen, station_ids = [], set(), set()
+        for group in groups:
+            try:
+                station_id = group['station_id']
+                station_id = None if station_id is None else int(station_id)
+                participant_ids = self._ids(group['participant_ids'], allow_empty=True)
+            except (KeyError, TypeError, ValueError):
+                raise OrderValidationError('Ungültige Station')
+            if station_id is not None:
+                station_ids.add(station_id)
+            for position, participant_id in enumerate(participant_ids):
+                if participant_id in seen:
+                    raise OrderValidationError(f'Teilnehmer {participant_id} mehrfach angegeben')
+                seen.add(participant_id)
+                rows.append((participant_id, station_id, position))
+        if len(rows) > ORDER_MAX_ITEMS:
+            raise OrderValidationError(f'Höchstens {ORDER_MAX_ITEMS} Einträge pro Anfrage')
+
+        # Target stations must belong to the bus as well
+        if station_ids:
+            owned = db.session.scalar(
+                db.select(func.count(Station.id)).where(
+                    Station.walking_bus_id == self.walking_bus_id,
+                    Station.id.in_(station_ids)
+                )
+            )
+            if owned != len(station_ids):
+                raise OrderValidationError('Station nicht gefunden', status=404)
+        if not rows:
+            return 0
+
+        table = Participant.__table__
+        moves = values(
+            column('id', Integer), column('station_id', Integer), column('position', Integer),
+            name='moves'
+        ).data(rows)
+        result = db.session.execute(
+            table.update()
+            .where(table.c.id == moves.c.id, table.c.walking_bus_id == self.walking_bus_id)
+            # A column of NULLs only (unassigned section) would be typed as text otherwise
+            .values(station_id=cast(moves.c.station_id, Integer), position=moves.c.position)
+        )
+        self._check_rowcount(result, rows, 'Teilnehmer nicht gefunden')
+        return len(rows)
+
+    def _ids(self, ids, allow_empty=False):
+        if not isinstance(ids, list) or (not ids and not allow_empty):
+            raise OrderValidationError('Liste von IDs erwartet')
+        if len(ids) > ORDER_MAX_ITEMS:
+            raise OrderValidationError(f'Höchstens {ORDER_MAX_ITEMS} Einträge pro Anfrage')
+        try:
+            ids = [int(item) for item in ids]
+        except (TypeError, ValueError):
+            raise OrderValidationError('Ungültige ID')
+        if len(set(ids)) != len(ids):
+            raise OrderValidationError('Doppelte IDs')
+        return ids
+
+    def _check_rowcount(self, result, rows, message):
+        # Unknown ids or rows of another bus: undo the whole statement
+        if result.rowcount != len(rows):
+            db.session.rollback()
+            raise OrderValidationError(message, status=404)
@@ -0,0 +1,347 @@
+from collections import defaultdict
+from datetime import timedelta
+import numpy as np
+from sqlalchemy import Date, DateTime, cast, false, func, literal, literal_column, or_, true, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ..models import db, CalendarStatus, Participant, ParticipationRule
+
+
+def mask_includes(mask, day):
+    """True if the mask has the weekday of the given date set"""
+    return bool(mask >> day.weekday() & 1)
+
+
+class ParticipationService:
+    """
+    Resolves participation from recurrence rules and sparse overrides.
+
+    A participant's regular participation is stored as ParticipationRule rows
+    (weekday mask + validity range). CalendarStatus rows only hold one-off
+    overrides (is_manual_override) and the attendance of a day.
+    """
+
+    def __init__(self, walking_bus_id):
+        self.walking_bus_id = walking_bus_id
+        self._rules = defaultdict(list)
+        self._entries = {}
+
+    def load(self, start_date, end_date=None):
+        """Load all rules and calendar entries of the walking bus for a date range (two queries)"""
+        end_date = end_date or start_date
+        self._rules = defaultdict(list)
+        self._entries = {}
+
+        rules = db.session.query(
+            ParticipationRule.participant_id,
+            ParticipationRule.valid_from,
+            ParticipationRule.valid_until,
+            ParticipationRule.weekday_mask
+        ).filter(
+            ParticipationRule.walking_bus_id == self.walking_bus_id,
+            ParticipationRule.valid_from <= end_date,
+            db.or_(ParticipationRule.valid_until.is_(None), ParticipationRule.valid_until >= start_date)
+        ).order_by(ParticipationRule.valid_from).all()
+
+        for participant_id, valid_from, valid_until, mask in rules:
+            self._rules[participant_id].append((valid_from, valid_until, mask))
+
+        entries = CalendarStatus.query.filter(
+            CalendarStatus.walking_bus_id == self.walking_bus_id,
+            CalendarStatus.date >= start_date,
+            CalendarStatus.date <= end_date
+        ).all()
+        for entry in entries:
+            self._entries[(entry.participant_id, entry.date)] = entry
+
+        return self
+
+    def entry(self, participant_id, day):
+        return self._entries.get((participant_id, day))
+
+    def default_status(self, participant, day):
+        """Participation according to the weekly rule valid on that day"""
+        for valid_from, valid_until, mask in reversed(self._rules.get(participant.id, ())):
+            if valid_from <= day and (valid_until is None or day <= valid_until):
+                return mask_includes(mask, day)
+        # No rule loaded for that day (e.g. before the first rule): current weekday settings
+        return participant.is_active_on(day)
+
+    def status(self, participant, day):
+        """Effective participation: one-off override first, then the weekly rule"""
+        entry = self._entries.get((participant.id, day))
+        if entry is not None and entry.is_manual_override:
+            return entry.status
+        return self.default_status(participant, day)
+
+    def attendance(self, participant_id, day):
+        entry = self._entries.get((participant_id, day))
+        return bool(entry.attendance) if entry is not None else False
+
+    def count_confirmed(self, participants, day):
+        return self.confirmed_counts(participants, [day])[day]
+
+    def confirmed_counts(self, participants, dates):
+        """
+        Confirmed participants per date for all loaded dates at once.
+        Builds a (days x participants) matrix of weekday masks from the rules,
+        derives the defaults with one shift/and and applies the override bitmap.
+        """
+        dates = list(dates)
+        if not dates or not participants:
+            return {day: 0 for day in dates}
+
+        first = min(dates)
+        span = (max(dates) - first).days + 1
+        column = {participant.id: index for index, participant in enumerate(participants)}
+        weekdays = np.array([(first + timedelta(days=k)).weekday() for k in range(span)], dtype=np.uint8)
+
+        # Current weekday settings for days without a rule, rules sorted by valid_from so later ones win
+        masks = np.tile(
+            np.array([participant.weekday_mask for participant in participants], dtype=np.uint8),
+            (span, 1)
+        )
+        for participant_id, rules in self._rules.items():
+            index = column.get(participant_id)
+            if index is None:
+                continue
+            for valid_from, valid_until, mask in rules:
+                start = max((valid_from - first).days, 0)
+                stop = span if valid_until is None else min((valid_until - first).days + 1, span)
+                if start < stop:
+                    masks[start:stop, index] = mask
+
+        attending = ((masks >> weekdays[:, None]) & 1).astype(bool)
+
+        # Override bitmap: which cells are overridden and to which value
+        rows, cols, values = [], [], []
+        for (participant_id, day), entry in self._entries.items():
+            index = column.get(participant_id)
+            offset = (day - first).days
+            if index is not None and entry.is_manual_override and 0 <= offset < span:
+                rows.append(offset)
+                cols.append(index)
+                values.append(bool(entry.status))
+        if rows:
+            attending[rows, cols] = values
+
+        counts = attending.sum(axis=1)
+        return {day: int(counts[(day - first).days]) for day in dates}
+
+    def set_status(self, participant, day, status):
+        """
+        Store a one-off participation for a day. An override that matches the
+        weekly rule is removed again, unless the row still carries attendance.
+        Call load() for the day before, the change is not committed.
+        """
+        entry = self._entries.get((participant.id, day))
+        is_default = status == self.default_status(participant, day)
+
+        if is_default:
+            if entry is not None:
+                if entry.attendance:
+                    entry.status = status
+                    entry.is_manual_override = False
+                else:
+                    db.session.delete(entry)
+                    del self._entries[(participant.id, day)]
+            return None
+
+        if entry is None:
+            entry = CalendarStatus(
+                participant_id=participant.id,
+                date=day,
+                status=status,
+                is_manual_override=True,
+                walking_bus_id=self.walking_bus_id
+            )
+            db.session.add(entry)
+            self._entries[(participant.id, day)] = entry
+        else:
+            entry.status = status
+            entry.is_manual_override = True
+        return entry
+
+    def apply_statuses(self, changes, today=None):
+        """
+        Set-based variant of set_status for many participants and days:
+        changes maps (participant, day) to the new status. Overrides are
+        written with one upsert, overrides back at the weekly rule removed
+        with one DELETE. Call load() for the covered range before; the loaded
+        entries are stale afterwards. Returns the changes that differed from
+        the effective status. The change is not committed.
+        """
+        upserts, deletes, changed, status_today = [], [], [], []
+        for (participant, day), status in changes.items():
+            if self.status(participant, day) == status:
+                continue
+            changed.append((participant.id, day, status))
+            if day == today:
+                status_today.append({'id': participant.id, 'status_today': status})
+
+            entry = self._entries.get((participant.id, day))
+            if status != self.default_status(participant, day):
+                upserts.append({
+                    'walking_bus_id': self.walking_bus_id,
+                    'participant_id': participant.id,
+                    'date': day,
+                    'status': status,
+                    'is_manual_override': True,
+                    'attendance': False
+                })
+            elif entry is not None and entry.attendance:
+                # Row still carries the attendance, only the override goes
+                upserts.append({
+                    'walking_bus_id': self.walking_bus_id,
+                    'participant_id': participant.id,
+                    'date': day,
+                    'status': status,
+                    'is_manual_override': False,
+                    'attendance': True
+                })
+            elif entry is not None:
+                deletes.append((participant.id, day))
+
+        if upserts:
+            stmt = pg_insert(CalendarStatus).values(upserts)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['participant_id', 'date'],
+                set_={
+                    'status': stmt.excluded.status,
+                    'is_manual_override': stmt.excluded.is_manual_override
+                }
+            ))
+        if deletes:
+            db.session.execute(
+                CalendarStatus.__table__.delete().where(
+                    CalendarStatus.walking_bus_id == self.walking_bus_id,
+                    tuple_(CalendarStatus.participant_id, CalendarStatus.date).in_(deletes)
+                )
+            )
+        if status_today:
+            db.session.execute(update(Participant), status_today)
+        return changed
+
+    def apply_attendance(self, changes):
+        """
+        Set the attendance of many (participant_id, day) pairs with one
+        upsert. A new row is only the carrier of the attendance (status True,
+        no override). Returns the changed pairs; not committed.
+        """
+        rows, changed = [], []
+        for (participant_id, day), attendance in changes.items():
+            if self.attendance(participant_id, day) == attendance:
+                continue
+            changed.append((participant_id, day, attendance))
+            rows.append({
+                'walking_bus_id': self.walking_bus_id,
+                'participant_id': participant_id,
+                'date': day,
+                'status': True,
+                'is_manual_override': False,
+                'attendance': attendance
+            })
+
+        if rows:
+            stmt = pg_insert(CalendarStatus).values(rows)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['participant_id', 'date'],
+                set_={'attendance': stmt.excluded.attendance}
+            ))
+        return changed
+
+    def apply_absence(self, participant_ids, start_date, end_date, skip_days=(), today=None):
+        """
+        Mark participants absent on every day of a range with a single
+        INSERT ... SELECT generate_series ... ON CONFLICT statement; days in
+        skip_days (no walking bus) get no row. Unlike set_status, the absence
+        is stored even where the weekly rule already says no, so it outlasts
+        a later change of the weekly plan. Returns the (participant_id, day)
+        pairs whose row changed; not committed.
+        """
+        day = cast(func.generate_series(
+            cast(start_date, DateTime), cast(end_date, DateTime), literal_column("interval '1 day'")
+        ).column_valued('day'), Date)
+
+        rows = db.select(
+            literal(self.walking_bus_id), Participant.id, day, false(), true(), false()
+        ).where(
+            Participant.walking_bus_id == self.walking_bus_id,
+            Participant.id.in_(participant_ids)
+        )
+        if skip_days:
+            rows = rows.where(day.not_in(list(skip_days)))
+
+        stmt = pg_insert(CalendarStatus).from_select(
+            ['walking_bus_id', 'participant_id', 'date', 'status', 'is_manual_override', 'attendance'],
+            rows
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['participant_id', 'date'],
+            set_={'status': stmt.excluded.status, 'is_manual_override': True},
+            # Rows that already hold the absence are left alone and not returned
+            where=or_(CalendarStatus.status.is_(True), CalendarStatus.is_manual_override.isnot(True))
+        ).returning(CalendarStatus.participant_id, CalendarStatus.date)
+        changed = [tuple(row) for row in db.session.execute(stmt)]
+
+        absent_today = [participant_id for participant_id, changed_day in changed if changed_day == today]
+        if absent_today:
+            db.session.execute(
+                update(Participant).where(Participant.id.in_(absent_today)).values(status_today=False)
+            )
+        return changed
+
+    def clear_absences(self, participant_ids, start_date, end_date):
+        """
+        Lift the one-off absences of a range, the weekly rule applies again.
+        Rows carrying attendance only lose the override. Returns the
+        (participant_id, day) pairs; not committed, call load() afterwards.
+        """
+        in_range = (
+            CalendarStatus.walking_bus_id == self.walking_bus_id,
+            CalendarStatus.participant_id.in_(participant_ids),
+            CalendarStatus.date.between(start_date, end_date),
+            CalendarStatus.is_manual_override.is_(True),
+            CalendarStatus.status.is_(False)
+        )
+        table = CalendarStatus.__table__
+        columns = (table.c.participant_id, table.c.date)
+        deleted = db.session.execute(
+            table.delete().where(*in_range, CalendarStatus.attendance.isnot(True)).returning(*columns)
+        )
+        changed = [tuple(row) for row in deleted]
+        kept = db.session.execute(
+            table.update().where(*in_range, CalendarStatus.attendance.is_(True))
+            .values(is_manual_override=False).returning(*columns)
+        )
+        changed.extend(tuple(row) for row in kept)
+        return changed
+
+    def set_weekday_mask(self, participant, mask, effective_from):
+        """
+        Change the weekly participation from effective_from on: closes the open
+        rule and opens a new one, independent of how far the change reaches.
+        The change is not committed.
+        """
+        open_rule = ParticipationRule.query.filter_by(
+            participant_id=participant.id,
+            valid_until=None
+        ).order_by(ParticipationRule.valid_from.desc()).first()
+
+        if open_rule and open_rule.weekday_mask == mask:
+            return open_rule
+
+        if open_rule and open_rule.valid_from >= effective_from:
+            open_rule.weekday_mask = mask
+            return open_rule
+
+        if open_rule:
+            open_rule.valid_until = effective_from - timedelta(days=1)
+
+        rule = ParticipationRule(
+            walking_bus_id=self.walking_bus_id,
+            participant_id=participant.id,
+            weekday_mask=mask,
+            valid_from=effective_from
+        )
+        db.session.add(rule)
+        return rule
@@ -0,0 +1,342 @@
+from flask import current_app
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import insert, literal_column, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ..models import db, PushNotificationLog, PushDeliveryStats
+from .. import get_current_time, get_current_date, get_platform
+import os
+import re
+
+LOG_TABLE = PushNotificationLog.__tablename__
+PARTITION_NAME = re.compile(rf'^{LOG_TABLE}_y(\d{{4}})m(\d{{2}})$')
+DEFAULT_PARTITION = f'{LOG_TABLE}_default'
+DEFAULT_RETENTION_DAYS = 7
+DEFAULT_BATCH_SIZE = 100
+
+# Upper bounds of the latency histogram, the last counter holds everything above
+LATENCY_BUCKETS_MS = (50, 100, 200, 500, 1000, 2000, 5000, 10000)
+ROLLUP_KEY = ('walking_bus_id', 'day', 'notification_type', 'platform', 'status_code')
+ROLLUP_COUNTERS = ('sent', 'succeeded', 'failed', 'paused', 'latency_sum_ms')
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{LOG_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def latency_bucket(latency_ms):
+    return bisect_left(LATENCY_BUCKETS_MS, latency_ms)
+
+
+def histogram_percentile(histogram, quantile):
+    """Upper bound (ms) of the bucket holding the quantile, None if nothing was measured"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = quantile * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return LATENCY_BUCKETS_MS[min(index, len(LATENCY_BUCKETS_MS) - 1)]
+    return LATENCY_BUCKETS_MS[-1]
+
+
+class PushDeliveryRollup:
+    """
+    Accumulates delivery counters per (bus, day, type, platform, status code)
+    and adds them to push_delivery_stats with one upsert.
+    """
+
+    def __init__(self):
+        self.deltas = {}
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def add(self, walking_bus_id, notification_type, client_info=None, status_code=None,
+            succeeded=0, failed=0, paused=0, latency_ms=None, day=None):
+        key = (
+            walking_bus_id,
+            day or get_current_date(),
+            notification_type or 'unknown',
+            get_platform(client_info),
+            status_code or 0
+        )
+        delta = self.deltas.get(key)
+        if delta is None:
+            delta = self.deltas[key] = dict(zip(ROLLUP_KEY, key))
+            delta.update({counter: 0 for counter in ROLLUP_COUNTERS})
+            delta['latency_histogram'] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+        delta['sent'] += succeeded + failed
+        delta['succeeded'] += succeeded
+        delta['failed'] += failed
+        delta['paused'] += paused
+        if latency_ms is not None:
+            delta['latency_sum_ms'] += int(latency_ms)
+            delta['latency_histogram'][latency_bucket(latency_ms)] += 1
+
+    def write(self):
+        """Upsert all deltas; keys are sorted so concurrent writers lock rows in the same order"""
+        if not self.deltas:
+            return 0
+        deltas, self.deltas = self.deltas, {}
+        rows = [deltas[key] for key in sorted(deltas)]
+
+        stmt = pg_insert(PushDeliveryStats)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEY),
+            set_={
+                **{
+                    counter: getattr(PushDeliveryStats, counter) + getattr(stmt.excluded, counter)
+                    for counter in ROLLUP_COUNTERS
+                },
+                # Element-wise sum of both histograms
+                'latency_histogram': literal_column(
+                    "ARRAY(SELECT coalesce(a, 0) + coalesce(b, 0) FROM "
+                    f"unnest({PushDeliveryStats.__tablename__}.latency_histogram, "
+                    "excluded.latency_histogram) AS u(a, b))"
+                )
+            }
+        )
+        db.session.execute(stmt, rows)
+        return len(rows)
+
+
+class PushLogBuffer:
+    """
+    Append-only buffer for push log rows, written as one multi-row INSERT.
+    Rows are plain dicts, nothing is loaded back into the session.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or int(os.getenv('PUSH_LOG_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+        self.rows = []
+        self.rollup = PushDeliveryRollup()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, walking_bus_id, notification_type, notification_data, subscription_id=None,
+            status_code=None, error_message=None, success=False, fencing_token=None):
+        self.rows.append({
+            'walking_bus_id': walking_bus_id,
+            'subscription_id': subscription_id,
+            'timestamp': get_current_time(),
+            'status_code': status_code,
+            'error_message': error_message[:500] if error_message else None,
+            'notification_type': notification_type,
+            'notification_data': notification_data,
+            'success': success,
+            'subscription_deleted_at': None,
+            'fencing_token': fencing_token
+        })
+        return len(self.rows) >= self.batch_size
+
+    def flush(self, commit=True):
+        """Insert all buffered rows in one statement, rollup deltas in the same transaction"""
+        if not self.rows and not self.rollup:
+            return 0
+        rows, self.rows = self.rows, []
+        if rows:
+            db.session.execute(insert(PushNotificationLog), rows)
+        self.rollup.write()
+        if commit:
+            db.session.commit()
+        return len(rows)
+
+
+class PushLogPartitionService:
+    """
+    Maintains the monthly range partitions of push_notification_log.
+    Retention drops whole partitions, so old logs live until the end of the
+    month that contains the retention cutoff. Rows that landed in the
+    default partition (no monthly partition existed yet) are moved into
+    their month once it is created, and deleted row by row once they age out.
+    """
+
+    def __init__(self, retention_days=None, months_ahead=2):
+        self.retention_days = retention_days or int(os.getenv('PUSH_LOG_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+        self.months_ahead = months_ahead
+
+    def is_partitioned(self):
+        if db.engine.dialect.name != 'postgresql':
+            return False
+        return bool(db.session.execute(text(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table"
+        ), {'table': LOG_TABLE}).scalar())
+
+    def list_partitions(self):
+        """Month start of every existing monthly partition (the default partition is skipped)"""
+        names = db.session.execute(text(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = :table"
+        ), {'table': LOG_TABLE}).scalars().all()
+
+        months = []
+        for name in names:
+            match = PARTITION_NAME.match(name)
+            if match:
+                months.append(date(int(match.group(1)), int(match.group(2)), 1))
+        return sorted(months)
+
+    def has_default_partition(self):
+        return bool(db.session.execute(
+            text("SELECT to_regclass(:name) IS NOT NULL"), {'name': DEFAULT_PARTITION}
+        ).scalar())
+
+    def ensure_partitions(self, today=None):
+        """Create partitions for the current month and the next months_ahead months"""
+        today = today or get_current_time().date()
+        existing = set(self.list_partitions())
+        has_default = self.has_default_partition()
+        created = []
+
+        month = month_start(today)
+        for _ in range(self.months_ahead + 1):
+            if month not in existing:
+                self.create_partition(month, has_default)
+                created.append(partition_name(month))
+            month = next_month(month)
+
+        db.session.commit()
+        return created
+
+    def create_partition(self, month, has_default=True):
+        """
+        CREATE TABLE ... PARTITION OF fails while the default partition holds
+        rows of that month. Those rows are moved into a standalone table
+        first, which is then attached as the month's partition.
+        """
+        name = partition_name(month)
+        bounds = {'start': month, 'end': next_month(month)}
+        in_month = '"timestamp" >= :start AND "timestamp" < :end'
+        range_sql = f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+
+        stray = has_default and db.session.execute(
+            text(f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE {in_month})'), bounds
+        ).scalar()
+        if not stray:
+            db.session.execute(text(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{LOG_TABLE}" {range_sql}'))
+            return
+
+        columns = ', '.join(f'"{column.name}"' for column in PushNotificationLog.__table__.columns)
+        db.session.execute(text(f'CREATE TABLE "{name}" (LIKE "{LOG_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+        db.session.execute(text(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE {in_month} RETURNING {columns}) '
+            f'INSERT INTO "{name}" ({columns}) SELECT {columns} FROM moved'
+        ), bounds)
+        # The default partition no longer holds rows of the range, so the attach check passes
+        db.session.execute(text(f'ALTER TABLE "{LOG_TABLE}" ATTACH PARTITION "{name}" {range_sql}'))
+        current_app.logger.info(f"[PUSH][PARTITIONS] Moved rows of {month:%Y-%m} out of {DEFAULT_PARTITION}")
+
+    def drop_expired_partitions(self, today=None):
+        """Drop every partition whose whole month lies before the retention cutoff"""
+        today = today or get_current_time().date()
+        cutoff = today - timedelta(days=self.retention_days)
+        dropped = []
+
+        for month in self.list_partitions():
+            if next_month(month) <= cutoff:
+                db.session.execute(text(f'DROP TABLE IF EXISTS "{partition_name(month)}"'))
+                dropped.append(partition_name(month))
+
+        # The default partition cannot be dropped, its aged rows are deleted instead
+        if self.has_default_partition():
+            db.session.execute(
+                text(f'DELETE FROM "{DEFAULT_PARTITION}" WHERE "timestamp" < :cutoff'), {'cutoff': cutoff}
+            )
+
+        db.session.commit()
+        return dropped
+
+    def run_maintenance(self):
+        """Scheduler entry point: create upcoming partitions, drop expired ones"""
+        if not self.is_partitioned():
+            current_app.logger.warning(f"[PUSH][PARTITIONS] {LOG_TABLE} is not partitioned, skipping")
+            return {'created': [], 'dropped': []}
+
+        created = self.ensure_partitions()
+        dropped = self.drop_expired_partitions()
+        current_app.logger.info(f"[PUSH][PARTITIONS] Created: {created or '-'} | Dropped: {dropped or '-'}")
+        return {'created': created, 'dropped': dropped}
+
+
+class PushDeliveryStatsService:
+    """Delivery health of a walking bus, read from push_delivery_stats only"""
+
+    PERCENTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+    def __init__(self, walking_bus_id):
+        self.walking_bus_id = walking_bus_id
+
+    @classmethod
+    def _empty(cls):
+        return {
+            'sent': 0, 'succeeded': 0, 'failed': 0, 'paused': 0,
+            'latency_sum_ms': 0, 'latency_histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        }
+
+    @classmethod
+    def _finish(cls, bucket):
+        histogram = bucket.pop('latency_histogram')
+        measured = sum(histogram)
+        bucket['success_rate'] = round(bucket['succeeded'] / bucket['sent'], 4) if bucket['sent'] else None
+        bucket['latency_avg_ms'] = round(bucket.pop('latency_sum_ms') / measured) if measured else None
+        for name, quantile in cls.PERCENTILES:
+            bucket[f'latency_{name}_ms'] = histogram_percentile(histogram, quantile)
+        return bucket
+
+    def summary(self, start_date, end_date=None):
+        """Totals plus breakdowns per day, type, platform and status code"""
+        end_date = end_date or get_current_date()
+        rows = PushDeliveryStats.query.filter(
+            PushDeliveryStats.walking_bus_id == self.walking_bus_id,
+            PushDeliveryStats.day >= start_date,
+            PushDeliveryStats.day <= end_date
+        ).all()
+
+        total = self._empty()
+        groups = {
+            'by_day': defaultdict(self._empty),
+            'by_type': defaultdict(self._empty),
+            'by_platform': defaultdict(self._empty),
+            'by_status': defaultdict(self._empty)
+        }
+        for row in rows:
+            dimensions = {
+                'by_day': row.day.isoformat(),
+                'by_type': row.notification_type,
+                'by_platform': row.platform,
+                'by_status': row.status_code
+            }
+            for bucket in [total] + [groups[name][value] for name, value in dimensions.items()]:
+                for counter in ROLLUP_COUNTERS:
+                    bucket[counter] += getattr(row, counter)
+                for index, count in enumerate(row.latency_histogram or ()):
+                    bucket['latency_histogram'][index] += count
+
+        return {
+            'walking_bus_id': self.walking_bus_id,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'latency_buckets_ms': list(LATENCY_BUCKETS_MS),
+            'total': self._finish(total),
+            **{
+                name: [dict(key=key, **self._finish(bucket)) for key, bucket in sorted(buckets.items())]
+                for name, buckets in groups.items()
+            }
+        }
@@ -1,5 +1,6 @@
 from flask import current_app
 import json
+import logging
 import time
 from pywebpush import webpush, WebPushException
 from sqlalchemy.exc import SQLAlchemyError
@@ -8,19 +9,23 @@ from ..models import (
     db,
     PushSubscription,
     Participant,
-    CalendarStatus,
     PushNotificationLog,
     AuthToken,
     WeatherCalculation,
     WalkingBusOverride,
-    DailyNote,
-    SchoolHoliday
+    DailyNote
 )
 from urllib.parse import urlparse
+from .holiday_service import find_holiday
+from .participation_service import ParticipationService
+from .push_log_service import PushLogBuffer
+from .lease_service import LeaseLost
+from .job_queue_service import DelayedJobQueue
+from .metrics_service import push_notifications, push_send_duration
 from .. import get_or_generate_vapid_keys, get_current_date, get_current_time, WEEKDAY_MAPPING
 import os
 import re
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 # Static configuration at module level
 vapid_keys = get_or_generate_vapid_keys()
@@ -38,22 +43,30 @@ def get_vapid_config():
 
 VAPID_CONFIG = get_vapid_config()
 
+# Hot path: per-send lines are DEBUG and rate limited (see logging_setup)
+logger = logging.getLogger('app.push')
+
 
 class PushService:
-    def __init__(self, walking_bus_id):
+    def __init__(self, walking_bus_id, lease=None):
         self.walking_bus_id = walking_bus_id
         self.to_delete = set()
-        
-        # Debug logging for initialization
-        current_app.logger.info(f"[PUSH][INIT] VAPID_CONFIG: {VAPID_CONFIG}")
-        current_app.logger.info(f"[PUSH][INIT] Environment VAPID_EMAIL: {os.getenv('VAPID_EMAIL')}")
-        current_app.logger.info(f"[PUSH][INIT] App config VAPID_EMAIL: {current_app.config.get('VAPID_EMAIL')}")
+        # Lease of the scheduler run; its fencing token is stored with every log row
+        self.lease = lease
+        self.fencing_token = lease.token if lease else None
+        # Rate-limited sends are queued for a later retry (disabled inside the retry job itself)
+        self.retry_rate_limited = True
+        self.last_retry_after = None
+        # Push logs are appended in batches; single sends flush right away
+        self.log_buffer = PushLogBuffer()
+        self.batch_logs = False
         
         self.vapid_private_key = VAPID_CONFIG['private_key']
         self.vapid_claims_sub = VAPID_CONFIG['claims']['sub']
-        
-        # Verify initialization
-        current_app.logger.info(f"[PUSH][INIT] Set claims_sub to: {self.vapid_claims_sub}")
+
+        # Created per request and job, so DEBUG only (and without the private key)
+        logger.debug("[PUSH][INIT] Bus %s, public key %s, claims_sub %s",
+                     walking_bus_id, VAPID_CONFIG['public_key'], self.vapid_claims_sub)
 
     def get_subscriptions(self):
         """Get all subscriptions for current walking bus"""
@@ -63,33 +76,87 @@ class PushService:
         
         active_subscriptions = [s for s in all_subscriptions if s.is_active]
         
-        current_app.logger.info(f"[PUSH][SUBS] Found {len(all_subscriptions)} total subscriptions")
-        current_app.logger.info(f"[PUSH][SUBS] Active: {len(active_subscriptions)} | Paused: {len(all_subscriptions) - len(active_subscriptions)}")
+        logger.debug("[PUSH][SUBS] Found %s total subscriptions | Active: %s | Paused: %s",
+                     len(all_subscriptions), len(active_subscriptions),
+                     len(all_subscriptions) - len(active_subscriptions))
         
         return all_subscriptions
 
+    def log(self, notification_type, notification_data, subscription_id=None,
+            status_code=None, error_message=None, success=False):
+        """Append a push log row; written immediately unless a batch is running"""
+        batch_full = self.log_buffer.add(
+            walking_bus_id=self.walking_bus_id,
+            subscription_id=subscription_id,
+            notification_type=notification_type,
+            notification_data=notification_data,
+            status_code=status_code,
+            error_message=error_message,
+            success=success,
+            fencing_token=self.fencing_token
+        )
+        if batch_full or not self.batch_logs:
+            self.log_buffer.flush()
+
+    def flush_logs(self):
+        return self.log_buffer.flush()
+
+    def check_fence(self):
+        """
+        Stop a run whose lease is gone, or that was overtaken by a run with a
+        newer fencing token. The token counter in Redis is checked, the log
+        rows of a newer run may still sit in its PushLogBuffer.
+        """
+        if self.lease is None:
+            return
+        self.lease.check()
+
+        newest = self.lease.newest_token()
+        if newest is not None and newest > self.fencing_token:
+            raise LeaseLost(f"Fencing token {self.fencing_token} superseded by {newest}")
+
+    def record_delivery(self, subscription, notification_type, status_code,
+                        success=False, paused=False, latency_ms=None, attempted=True):
+        """Count a send attempt (or a pause) in the delivery rollup, written with the next flush"""
+        self.log_buffer.rollup.add(
+            walking_bus_id=self.walking_bus_id,
+            notification_type=notification_type,
+            client_info=subscription.auth_token.client_info if subscription.auth_token else None,
+            status_code=status_code,
+            succeeded=1 if attempted and success else 0,
+            failed=1 if attempted and not success else 0,
+            paused=1 if paused else 0,
+            latency_ms=latency_ms
+        )
+
+        notification_type = notification_type or 'unknown'
+        if attempted:
+            push_notifications.inc(notification_type=notification_type, result='success' if success else 'failed')
+            if latency_ms is not None:
+                push_send_duration.observe(latency_ms / 1000, notification_type=notification_type)
+        if paused:
+            push_notifications.inc(notification_type=notification_type, result='paused')
+
     def send_notification(self, subscription, notification_data, defer_subscription_pause=False):
         """Send single push notification with error handling"""
         vapid_keys = get_or_generate_vapid_keys()
-        # First clean up old logs
-        self.cleanup_old_logs()
 
         if not subscription.is_active:
             return False, "Subscription is paused", None
 
         try:
             # Log attempt
-            current_app.logger.info(f"[PUSH][ATTEMPT] Sending to endpoint: {subscription.endpoint}")
-            current_app.logger.info(f"[PUSH][DATA] Notification data prepared: {notification_data}")
-            current_app.logger.info(f"[PUSH][SEND] Using claims_sub: {self.vapid_claims_sub}")
-            
+            logger.debug("[PUSH][ATTEMPT] Sending to endpoint: %s", subscription.endpoint)
+            logger.debug("[PUSH][DATA] Notification data prepared: %s", notification_data)
+
             vapid_claims = {
                 "sub": self.vapid_claims_sub,
                 "exp": int(time.time()) + 12 * 3600,
                 "aud": self._get_endpoint_origin(subscription.endpoint)
             }
-            current_app.logger.info(f"[PUSH][CONFIG] VAPID claims configured: {vapid_claims}")
+            logger.debug("[PUSH][CONFIG] VAPID claims configured: %s", vapid_claims)
 
+            started = time.monotonic()
             webpush(
                 subscription_info={
                     "endpoint": subscription.endpoint,
@@ -111,27 +178,29 @@ class PushService:
             }
             enhanced_notification_data['attempted_send'] = True
 
-            # Rest of the method remains the same until log creation
-            log_entry = PushNotificationLog(
-                walking_bus_id=self.walking_bus_id,
+            notification_type = notification_data.get('data', {}).get('type')
+            self.record_delivery(
+                subscription, notification_type, 201,
+                success=True, latency_ms=(time.monotonic() - started) * 1000
+            )
+            self.log(
                 subscription_id=subscription.id,
                 status_code=201,
-                notification_type=enhanced_notification_data.get('data', {}).get('type'),
+                notification_type=notification_type,
                 notification_data=enhanced_notification_data,
                 success=True
             )
-            db.session.add(log_entry)
-            db.session.commit()
             
-            current_app.logger.info(f"[PUSH][SUCCESS] Sent notification to endpoint: {subscription.endpoint}")
+            logger.debug("[PUSH][SUCCESS] Sent notification to endpoint: %s", subscription.endpoint)
             return True, None, None
 
         except WebPushException as e:
+            latency_ms = (time.monotonic() - started) * 1000
             error_str = str(e)
             status_match = re.search(r'(\d{3})\s+', error_str)
             status_code = int(status_match.group(1)) if status_match else None
             
-            current_app.logger.error(f"[PUSH][ERROR] Full error details: {error_str}")
+            logger.error("[PUSH][ERROR] Full error details: %s", error_str)
             
             # Log the error with enhanced data
             enhanced_notification_data = notification_data.copy()
@@ -140,27 +209,36 @@ class PushService:
                 'client_info': subscription.auth_token.client_info
             }
             
+            # Count the failure (and an immediate pause) before the log row flushes
+            notification_type = notification_data.get('data', {}).get('type')
+            self.record_delivery(
+                subscription, notification_type, status_code,
+                paused=not defer_subscription_pause and status_code not in (429, 413),
+                latency_ms=latency_ms
+            )
+
             # Create error log entry
-            log_entry = PushNotificationLog(
-                walking_bus_id=self.walking_bus_id,
+            self.log(
                 subscription_id=subscription.id,
                 status_code=status_code,
                 error_message=error_str,
-                notification_type=enhanced_notification_data.get('data', {}).get('type'),
+                notification_type=notification_type,
                 notification_data=enhanced_notification_data,
                 success=False
             )
-            db.session.add(log_entry)
-            db.session.commit()
 
             # Only pause subscription immediately for rate limits and oversized payloads
             # For fatal errors, return error info to caller for later processing
             if status_code == 429:
                 retry_after = e.response.headers.get('Retry-After', '60')
-                current_app.logger.warning(f"[PUSH][RATE_LIMIT] Rate limit hit. Retry after {retry_after} seconds")
+                logger.warning("[PUSH][RATE_LIMIT] Rate limit hit. Retry after %s seconds", retry_after)
+                # Retry-After may also be an HTTP date, fall back to a minute then
+                self.last_retry_after = int(retry_after) if retry_after.isdigit() else 60
+                if self.retry_rate_limited:
+                    self.queue_retry(subscription, notification_data, self.last_retry_after)
                 return False, str(e), None
             elif status_code == 413:
-                current_app.logger.error(f"[PUSH][ERROR] Payload too large ({len(json.dumps(notification_data))} bytes)")
+                logger.error("[PUSH][ERROR] Payload too large (%s bytes)", len(json.dumps(notification_data)))
                 return False, str(e), None
             
             # For other errors, return error info for deferred handling
@@ -170,7 +248,7 @@ class PushService:
                 subscription.pause_reason = error_str
                 subscription.last_error_code = status_code
                 db.session.commit()
-                current_app.logger.info(f"[PUSH][PAUSE] Subscription {subscription.id} paused - Status: {status_code}")
+                logger.info("[PUSH][PAUSE] Subscription %s paused - Status: %s", subscription.id, status_code)
                 return False, str(e), None
             else:
                 # Return error info for deferred handling
@@ -180,27 +258,32 @@ class PushService:
                     'should_pause': status_code not in (429, 413)
                 }
 
-    def cleanup_old_logs(self):
-        """Delete push notification logs older than 7 days"""
-        cutoff_date = datetime.now() - timedelta(days=7)
-        
-        deleted_count = PushNotificationLog.query.filter(
-            PushNotificationLog.walking_bus_id == self.walking_bus_id,
-            PushNotificationLog.timestamp < cutoff_date
-        ).delete(synchronize_session=False)
-        
-        db.session.commit()
-        current_app.logger.info(f"[PUSH][CLEANUP] Deleted {deleted_count} old notification logs")
-        return deleted_count
+    def queue_retry(self, subscription, notification_data, delay):
+        """Hand a rate-limited notification to the scheduler worker's delayed job queue"""
+        try:
+            DelayedJobQueue().enqueue('push_retry', {
+                'walking_bus_id': self.walking_bus_id,
+                'subscription_id': subscription.id,
+                'notification_data': notification_data
+            }, delay=delay)
+        except Exception as e:
+            current_app.logger.error(f"[PUSH][RETRY] Could not queue retry for subscription {subscription.id}: {str(e)}")
 
     def prepare_schedule_notifications(self):
         """Prepare and send individual schedule notifications for each participant"""
         target_date = get_current_date()
         weekday = WEEKDAY_MAPPING[target_date.weekday()]
         subscriptions = self.get_subscriptions()
+        participation = ParticipationService(self.walking_bus_id).load(target_date)
         results = []
+        self.batch_logs = True
+        self.check_fence()
 
         for subscription in subscriptions:
+            # Abort before the next send once the lease is gone (LeaseLost)
+            if self.lease is not None:
+                self.lease.check()
+
             participants = Participant.query.filter(
                 Participant.id.in_(subscription.participant_ids),
                 Participant.walking_bus_id == self.walking_bus_id
@@ -210,38 +293,24 @@ class PushService:
             subscription_error_info = None
 
             for participant in participants:
-                normally_attends = getattr(participant, weekday, True)
+                normally_attends = participation.default_status(participant, target_date)
                 
-                # Create base log entry for each check
-                log_entry = PushNotificationLog(
-                    walking_bus_id=self.walking_bus_id,
-                    subscription_id=subscription.id,
-                    notification_type='schedule_reminder',
-                    success=True,
-                    status_code=200,
-                    notification_data={
-                        'participant_id': participant.id,
-                        'participant_name': participant.name,
-                        'attempted_send': False,
-                        'weekday': weekday,
-                        'normally_attends': normally_attends
-                    }
-                )
+                # Base log data for each check
+                log_data = {
+                    'participant_id': participant.id,
+                    'participant_name': participant.name,
+                    'attempted_send': False,
+                    'weekday': weekday,
+                    'normally_attends': normally_attends
+                }
 
                 if not normally_attends:
-                    log_entry.notification_data['reason'] = f"Keine Teilnahme am {weekday}"
-                    db.session.add(log_entry)
-                    db.session.commit()
+                    log_data['reason'] = f"Keine Teilnahme am {weekday}"
+                    self.log_check(subscription, log_data)
                     continue
 
-                # Get calendar status
-                calendar_entry = CalendarStatus.query.filter_by(
-                    participant_id=participant.id,
-                    date=target_date,
-                    walking_bus_id=self.walking_bus_id
-                ).first()
-                
-                is_attending = calendar_entry.status if calendar_entry else normally_attends
+                # One-off override for today, otherwise the weekly rule
+                is_attending = participation.status(participant, target_date)
                 
                 # Get additional info
                 weather_info = WeatherCalculation.query.filter_by(
@@ -260,17 +329,13 @@ class PushService:
                 ).first()
 
                 # Check for school holidays/vacation (no push notifications during vacation)
-                holiday = SchoolHoliday.query\
-                    .filter(SchoolHoliday.start_date <= target_date)\
-                    .filter(SchoolHoliday.end_date >= target_date)\
-                    .first()
+                holiday = find_holiday(target_date)
                 
                 if holiday:
                     # Skip push notifications during vacation/holidays
-                    log_entry.notification_data['reason'] = f"Keine Push-Benachrichtigung während {holiday.name}"
-                    log_entry.notification_data['holiday_name'] = holiday.name
-                    db.session.add(log_entry)
-                    db.session.commit()
+                    log_data['reason'] = f"Keine Push-Benachrichtigung während {holiday.name}"
+                    log_data['holiday_name'] = holiday.name
+                    self.log_check(subscription, log_data)
                     continue
 
                 # Build message
@@ -328,17 +393,9 @@ class PushService:
                 }
 
                 # Mark as attempted before sending
-                log_entry.notification_data['attempted_send'] = True
-                log_entry.notification_data['message'] = status_message
-                db.session.add(log_entry)
-                db.session.commit()
-
-                current_app.logger.info(f"""
-                    [PUSH][DEBUG] Created log entry:
-                    - Participant: {participant.id}
-                    - Attempted: {log_entry.notification_data.get('attempted_send')}
-                    - Data: {log_entry.notification_data}
-                """)
+                log_data['attempted_send'] = True
+                log_data['message'] = status_message
+                self.log_check(subscription, log_data)
                 
                 # Send notification with deferred pause handling
                 success, error, error_info = self.send_notification(subscription, notification_data, defer_subscription_pause=True)
@@ -361,9 +418,15 @@ class PushService:
                 subscription.paused_at = get_current_time()
                 subscription.pause_reason = subscription_error_info['error_str']
                 subscription.last_error_code = subscription_error_info['status_code']
+                self.record_delivery(subscription, 'schedule_reminder', subscription_error_info['status_code'],
+                                     paused=True, attempted=False)
                 db.session.commit()
                 current_app.logger.info(f"[PUSH][PAUSE] Subscription {subscription.id} paused after processing all participants - Status: {subscription_error_info['status_code']}")
 
+        # Remaining logs in one insert, before subscriptions may get deleted below
+        self.batch_logs = False
+        self.flush_logs()
+
         cleanup_result = self.cleanup_expired_subscriptions()
         
         return {
@@ -372,6 +435,42 @@ class PushService:
         }
 
 
+    def log_check(self, subscription, log_data):
+        """Log the outcome of a schedule check for one participant"""
+        self.log(
+            subscription_id=subscription.id,
+            notification_type='schedule_reminder',
+            notification_data=log_data,
+            status_code=200,
+            success=True
+        )
+
+    def send_broadcast(self, notification_data, target_bus_id=None, on_progress=None):
+        """Send one notification to all subscriptions; on_progress(done, total) after each send"""
+        subscriptions = self.get_subscriptions()
+        if target_bus_id:
+            subscriptions = [s for s in subscriptions if s.walking_bus_id == target_bus_id]
+
+        results = []
+        # Logs of all sends go out as batched inserts
+        self.batch_logs = True
+        for index, subscription in enumerate(subscriptions, 1):
+            success, error, _ = self.send_notification(subscription, notification_data)
+            results.append({
+                'endpoint': subscription.endpoint,
+                'success': success,
+                'error': error
+            })
+            if on_progress:
+                on_progress(index, len(subscriptions))
+        self.batch_logs = False
+        self.flush_logs()
+
+        return {
+            'results': results,
+            'cleanup': self.cleanup_expired_subscriptions()
+        }
+
     def cleanup_expired_subscriptions(self):
         try:
             current_time = get_current_time()
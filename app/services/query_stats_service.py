@@ -0,0 +1,243 @@
+from .. import redis_client
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+import json
+import logging
+import os
+import re
+import time
+
+ENDPOINTS_KEY = 'sql_stats:endpoints'
+ENDPOINT_KEY = 'sql_stats:endpoint:{endpoint}'
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+SHAPE_LENGTH = 300
+
+logger = logging.getLogger('app.sql')
+
+# Every active collector (request and/or collect_queries) sees each statement
+_collectors = ContextVar('query_collectors', default=())
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?|:\w+|\$\d+")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_VALUE_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """Statement without values: parameters and literals become ?, IN lists collapse to one"""
+    shape = _PLACEHOLDER.sub('?', statement)
+    shape = _LITERAL.sub('?', shape)
+    shape = _VALUE_LIST.sub('?', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryStats:
+    """Statements and DB time collected for one request or block"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold=DEFAULT_N_PLUS_ONE_THRESHOLD):
+        """Statement shapes issued at least threshold times (likely N+1), most frequent first"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class QueryLimitExceeded(AssertionError):
+    pass
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    collectors = _collectors.get()
+    if collectors:
+        duration = time.perf_counter() - started
+        for stats in collectors:
+            stats.add(statement, duration)
+
+
+def install_listeners(engine):
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _push(stats):
+    return _collectors.set(_collectors.get() + (stats,))
+
+
+@contextmanager
+def collect_queries(engine=None):
+    """Collect the statements executed inside the block (also those of test client requests)"""
+    from ..models import db
+
+    install_listeners(engine or db.engine)
+    stats = QueryStats()
+    token = _push(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """
+    Fail if the block issues more than limit statements:
+
+        with app.app_context(), assert_max_queries(10):
+            client.get('/api/stations', headers=headers)
+    """
+    with collect_queries(engine) as stats:
+        yield stats
+    if stats.count > limit:
+        shapes = '\n'.join(f'  {count}x {shape[:SHAPE_LENGTH]}' for shape, count in stats.shapes.most_common(5))
+        raise QueryLimitExceeded(f'{stats.count} queries, at most {limit} allowed:\n{shapes}')
+
+
+class QueryStatsService:
+    """
+    Per-endpoint SQL totals in Redis, shared by all workers, for the
+    debug page. Only written while SQL_INSTRUMENTATION is on.
+    """
+
+    def __init__(self, client=None):
+        self.redis = client or redis_client
+
+    def record(self, endpoint, stats, n_plus_one):
+        key = ENDPOINT_KEY.format(endpoint=endpoint)
+        pipe = self.redis.pipeline()
+        pipe.sadd(ENDPOINTS_KEY, endpoint)
+        pipe.hincrby(key, 'requests', 1)
+        pipe.hincrby(key, 'queries', stats.count)
+        pipe.hincrbyfloat(key, 'db_ms', stats.duration * 1000)
+        if n_plus_one:
+            pipe.hincrby(key, 'n_plus_one', 1)
+            pipe.hset(key, 'n_plus_one_shape', f'{n_plus_one[0][1]}x {n_plus_one[0][0][:SHAPE_LENGTH]}')
+        pipe.execute()
+
+        # Not atomic with the counters above, a lost maximum is harmless
+        if stats.count > int(self.redis.hget(key, 'max_queries') or 0):
+            self.redis.hset(key, 'max_queries', stats.count)
+
+    def endpoints(self):
+        names = sorted(name.decode() for name in self.redis.smembers(ENDPOINTS_KEY))
+        pipe = self.redis.pipeline()
+        for name in names:
+            pipe.hgetall(ENDPOINT_KEY.format(endpoint=name))
+
+        endpoints = []
+        for name, raw in zip(names, pipe.execute()):
+            if not raw:
+                continue
+            values = {k.decode(): v.decode() for k, v in raw.items()}
+            requests = int(values.get('requests', 0)) or 1
+            endpoints.append({
+                'endpoint': name,
+                'requests': requests,
+                'avg_queries': round(int(values.get('queries', 0)) / requests, 1),
+                'max_queries': int(values.get('max_queries', 0)),
+                'avg_db_ms': round(float(values.get('db_ms', 0)) / requests, 2),
+                'n_plus_one': int(values.get('n_plus_one', 0)),
+                'n_plus_one_shape': values.get('n_plus_one_shape')
+            })
+        return endpoints
+
+    def worst(self, order='avg_queries', limit=50):
+        return sorted(self.endpoints(), key=lambda e: e[order], reverse=True)[:limit]
+
+    def reset(self):
+        names = [name.decode() for name in self.redis.smembers(ENDPOINTS_KEY)]
+        self.redis.delete(ENDPOINTS_KEY, *[ENDPOINT_KEY.format(endpoint=name) for name in names])
+        return len(names)
+
+
+class QueryInstrumentation:
+    """
+    Request-scoped SQL instrumentation, switched on with SQL_INSTRUMENTATION=true.
+    Adds a Server-Timing header (db time, statement count, app time), logs
+    one [SQL] line per request and flags statement shapes repeated at least
+    SQL_N_PLUS_ONE_THRESHOLD times as N+1.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from ..models import db
+
+        self.enabled = os.getenv('SQL_INSTRUMENTATION', 'false').lower() == 'true'
+        self.threshold = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD))
+        app.config['SQL_INSTRUMENTATION'] = self.enabled
+        if not self.enabled:
+            return
+
+        with app.app_context():
+            install_listeners(db.engine)
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.stop)
+
+    def start(self):
+        g.query_stats = QueryStats()
+        g.query_stats_token = _push(g.query_stats)
+        g.request_started = time.perf_counter()
+
+    def finish(self, response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+        if request.endpoint == 'static' or response.mimetype == 'text/event-stream':
+            return response
+
+        total_ms = (time.perf_counter() - g.request_started) * 1000
+        db_ms = stats.duration * 1000
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={db_ms:.2f};desc="{stats.count} queries", app;dur={total_ms - db_ms:.2f}'
+        )
+
+        n_plus_one = stats.repeated(self.threshold)
+        entry = {
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': stats.count,
+            'db_ms': round(db_ms, 2),
+            'total_ms': round(total_ms, 2)
+        }
+        if n_plus_one:
+            entry['n_plus_one'] = [{'count': count, 'shape': shape[:SHAPE_LENGTH]} for shape, count in n_plus_one]
+            logger.warning("[SQL] %s", json.dumps(entry))
+        else:
+            logger.info("[SQL] %s", json.dumps(entry))
+
+        try:
+            QueryStatsService().record(request.endpoint or 'unknown', stats, n_plus_one)
+        except Exception as e:
+            logger.error("[SQL] Could not record query stats: %s", e)
+        return response
+
+    def stop(self, exc=None):
+        token = g.pop('query_stats_token', None)
+        if token is not None:
+            try:
+                _collectors.reset(token)
+            except ValueError:
+                # Teardown in a different context (e.g. streamed response), nothing to restore
+                pass
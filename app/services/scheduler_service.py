@@ -0,0 +1,206 @@
+from .. import redis_client, WEEKDAY_MAPPING
+from ..models import db, WalkingBusSchedule, SchedulerJob
+from apscheduler.jobstores.base import JobLookupError
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import json
+import logging
+
+logger = logging.getLogger('scheduler')
+
+RUN_KEY = 'scheduler:bus_run:{bus_id}'
+HISTORY_KEY = 'scheduler:bus_runs'
+HISTORY_LENGTH = 500
+
+REMINDER_JOB_PREFIX = 'notify_bus_'
+REMINDER_JOB_TYPE = 'walking_bus_notification'
+REMINDER_LEAD_TIME = timedelta(minutes=55)
+
+# Everything a reminder job is derived from; equal specs mean an unchanged job
+ReminderJob = namedtuple('ReminderJob', ['job_id', 'bus_id', 'day', 'hour', 'minute'])
+
+
+def reminder_job_id(bus_id, day):
+    return f'{REMINDER_JOB_PREFIX}{bus_id}_{day}'
+
+
+class SchedulerMetricsService:
+    """
+    Per-bus run metrics of the scheduler worker, kept in Redis so the web
+    workers can show them. Duration is the run time inside the pool worker,
+    lag the delay between the scheduled fire time and the actual start.
+    """
+
+    def __init__(self, client=None):
+        self.redis = client or redis_client
+
+    def record_run(self, bus_id, scheduled_at, started_at, duration, outcome):
+        """Store one finished run (timestamps as epoch seconds)"""
+        run = {
+            'bus_id': bus_id,
+            'scheduled_at': scheduled_at,
+            'started_at': started_at,
+            'lag': round(max(started_at - scheduled_at, 0.0), 3),
+            'duration': round(duration, 3),
+            'outcome': outcome
+        }
+        pipe = self.redis.pipeline()
+        pipe.hset(RUN_KEY.format(bus_id=bus_id), mapping={k: json.dumps(v) for k, v in run.items()})
+        pipe.lpush(HISTORY_KEY, json.dumps(run))
+        pipe.ltrim(HISTORY_KEY, 0, HISTORY_LENGTH - 1)
+        pipe.execute()
+        return run
+
+    def last_runs(self, bus_ids):
+        """Last run per bus id, buses without a recorded run are left out"""
+        bus_ids = list(bus_ids)
+        pipe = self.redis.pipeline()
+        for bus_id in bus_ids:
+            pipe.hgetall(RUN_KEY.format(bus_id=bus_id))
+
+        runs = {}
+        for bus_id, raw in zip(bus_ids, pipe.execute()):
+            if raw:
+                runs[bus_id] = {k.decode(): json.loads(v) for k, v in raw.items()}
+        return runs
+
+    def recent_runs(self, limit=100):
+        return [json.loads(raw) for raw in self.redis.lrange(HISTORY_KEY, 0, limit - 1)]
+
+
+class ReminderJobReconciler:
+    """
+    Keeps the in-memory reminder jobs of the scheduler in line with
+    WalkingBusSchedule. The desired job set is derived from the schedules
+    in one query and diffed against the jobs already registered; only
+    added, changed and removed jobs touch the scheduler and the
+    SchedulerJob read model.
+    """
+
+    def __init__(self, scheduler, job_func):
+        self.scheduler = scheduler
+        self.job_func = job_func
+        self.jobs = {}  # job_id -> ReminderJob, as registered in the scheduler
+
+    @staticmethod
+    def desired_jobs(bus_ids=None):
+        """Reminder jobs of all (or the given) buses, from a single schedule query"""
+        query = WalkingBusSchedule.query
+        if bus_ids is not None:
+            query = query.filter(WalkingBusSchedule.walking_bus_id.in_(bus_ids))
+
+        desired = {}
+        for schedule in query.all():
+            for index, day in WEEKDAY_MAPPING.items():
+                if not schedule.has_weekday(index):
+                    continue
+                start_time, _ = schedule.times_for(index)
+                if not start_time:
+                    continue
+                notification_time = (datetime.combine(datetime.today(), start_time) - REMINDER_LEAD_TIME).time()
+                job_id = reminder_job_id(schedule.walking_bus_id, day)
+                desired[job_id] = ReminderJob(
+                    job_id, schedule.walking_bus_id, day,
+                    notification_time.hour, notification_time.minute
+                )
+        return desired
+
+    def reconcile(self, bus_ids=None):
+        """Apply the difference between desired and registered jobs; returns the change counts"""
+        desired = self.desired_jobs(bus_ids)
+        current = {
+            job_id: spec for job_id, spec in self.jobs.items()
+            if bus_ids is None or spec.bus_id in bus_ids
+        }
+
+        removed = [job_id for job_id in current if job_id not in desired]
+        changed = [spec for job_id, spec in desired.items() if current.get(job_id) != spec]
+
+        for job_id in removed:
+            try:
+                self.scheduler.remove_job(job_id)
+            except JobLookupError:
+                pass
+            del self.jobs[job_id]
+
+        for spec in changed:
+            self.scheduler.add_job(
+                self.job_func,
+                'cron',
+                day_of_week=spec.day[:3],
+                hour=spec.hour,
+                minute=spec.minute,
+                args=[spec.bus_id],
+                id=spec.job_id,
+                replace_existing=True
+            )
+            self.jobs[spec.job_id] = spec
+
+        self.sync_read_model(bus_ids)
+        logger.info(
+            f"[SCHEDULER][RECONCILE] Buses: {'all' if bus_ids is None else sorted(bus_ids)} | "
+            f"Desired: {len(desired)} | Added/changed: {len(changed)} | Removed: {len(removed)}"
+        )
+        return {'desired': len(desired), 'changed': len(changed), 'removed': len(removed)}
+
+    def sync_read_model(self, bus_ids=None):
+        """Bring SchedulerJob rows in line with the registered jobs: one read, one delete, one upsert"""
+        rows = {
+            job_id: next_run_time
+            for job_id, next_run_time in db.session.query(
+                SchedulerJob.job_id, SchedulerJob.next_run_time
+            ).filter(
+                SchedulerJob.job_type == REMINDER_JOB_TYPE,
+                *([SchedulerJob.walking_bus_id.in_(bus_ids)] if bus_ids is not None else [])
+            )
+        }
+
+        registered = {}
+        for job_id, spec in self.jobs.items():
+            if bus_ids is not None and spec.bus_id not in bus_ids:
+                continue
+            job = self.scheduler.get_job(job_id)
+            registered[job_id] = (spec, self._naive(getattr(job, 'next_run_time', None)))
+
+        stale = [job_id for job_id in rows if job_id not in registered]
+        upserts = [
+            {
+                'walking_bus_id': spec.bus_id,
+                'job_id': job_id,
+                'job_type': REMINDER_JOB_TYPE,
+                'next_run_time': next_run_time
+            }
+            for job_id, (spec, next_run_time) in registered.items()
+            if job_id not in rows or rows[job_id] != next_run_time
+        ]
+
+        if stale:
+            SchedulerJob.query.filter(SchedulerJob.job_id.in_(stale)).delete(synchronize_session=False)
+        if upserts:
+            stmt = pg_insert(SchedulerJob)
+            db.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=['job_id'],
+                    set_={'next_run_time': stmt.excluded.next_run_time}
+                ),
+                upserts
+            )
+        db.session.commit()
+        return {'deleted': len(stale), 'upserted': len(upserts)}
+
+    def update_next_run(self, job_id):
+        """Advance the read model after a run (single UPDATE)"""
+        job = self.scheduler.get_job(job_id)
+        if job is None or job_id not in self.jobs:
+            return
+        SchedulerJob.query.filter_by(job_id=job_id).update(
+            {SchedulerJob.next_run_time: self._naive(getattr(job, 'next_run_time', None))},
+            synchronize_session=False
+        )
+        db.session.commit()
+
+    @staticmethod
+    def _naive(value):
+        # scheduler_jobs.next_run_time is a naive column in local time
+        return value.replace(tzinfo=None) if value is not None else None
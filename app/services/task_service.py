@@ -0,0 +1,110 @@
+from .. import redis_client
+from .job_queue_service import DelayedJobQueue
+from functools import wraps
+from uuid import uuid4
+import json
+import time
+
+TASK_QUEUE = 'tasks'
+TASK_KEY = 'task:{task_id}'
+TASK_CHANNEL = 'task_updates:{task_id}'
+TASK_TTL = 24 * 3600
+FINAL_STATES = ('succeeded', 'failed')
+
+
+class TaskService:
+    """
+    Background tasks for heavy admin actions, executed by the scheduler
+    worker. The status of a task lives in a Redis hash (task:<id>); every
+    change is also published on task_updates:<id> for the SSE endpoint.
+    """
+
+    def __init__(self, client=None):
+        self.redis = client or redis_client
+        self.queue = DelayedJobQueue(TASK_QUEUE, client=self.redis)
+
+    @staticmethod
+    def channel(task_id):
+        return TASK_CHANNEL.format(task_id=task_id)
+
+    def submit(self, task_type, payload, walking_bus_id=None, task_id=None):
+        """
+        Queue a task and return its id. A fixed task_id coalesces with a
+        task of that id whose job is still queued or running (including
+        the moment between its final status and the ack).
+        """
+        task_id = task_id or uuid4().hex
+        now = time.time()
+        # Status and job in one script: the worker never finds a job without
+        # a status, and a coalesced submit leaves the running task alone
+        status = dict(type=task_type, walking_bus_id=walking_bus_id, status='queued',
+                      progress=0, total=None, message=None, result=None, error=None,
+                      created_at=now, updated_at=now)
+        queued = self.queue.enqueue(
+            task_type, dict(payload, task_id=task_id), max_attempts=1, job_id=task_id,
+            status_key=TASK_KEY.format(task_id=task_id),
+            status={name: json.dumps(value) for name, value in status.items()},
+            status_ttl=TASK_TTL
+        )
+        if queued:
+            self.redis.publish(self.channel(task_id), json.dumps(dict(self.get(task_id) or {}, id=task_id)))
+        return task_id
+
+    def update(self, task_id, **fields):
+        fields['updated_at'] = time.time()
+        key = TASK_KEY.format(task_id=task_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+        pipe.expire(key, TASK_TTL)
+        pipe.execute()
+        self.redis.publish(self.channel(task_id), json.dumps(dict(self.get(task_id) or {}, id=task_id)))
+
+    def get(self, task_id):
+        raw = self.redis.hgetall(TASK_KEY.format(task_id=task_id))
+        if not raw:
+            return None
+        return {name.decode(): json.loads(value) for name, value in raw.items()}
+
+
+class TaskProgress:
+    """Handed to task handlers to report progress"""
+
+    def __init__(self, task_id, service=None):
+        self.task_id = task_id
+        self.service = service or TaskService()
+
+    def start(self):
+        self.service.update(self.task_id, status='running', started_at=time.time())
+
+    def report(self, done, total=None, message=None):
+        fields = {'progress': done}
+        if total is not None:
+            fields['total'] = total
+        if message is not None:
+            fields['message'] = message
+        self.service.update(self.task_id, **fields)
+
+    def succeed(self, result=None):
+        self.service.update(self.task_id, status='succeeded', result=result, finished_at=time.time())
+
+    def fail(self, error):
+        self.service.update(self.task_id, status='failed', error=str(error)[:500], finished_at=time.time())
+
+
+def task_handler(func):
+    """
+    Turn func(progress, **payload) into a job queue handler that keeps the
+    task status up to date; the return value becomes the task result.
+    """
+    @wraps(func)
+    def run(task_id, **payload):
+        progress = TaskProgress(task_id)
+        progress.start()
+        try:
+            result = func(progress, **payload)
+        except Exception as e:
+            progress.fail(e)
+            raise
+        progress.succeed(result)
+        return result
+    return run
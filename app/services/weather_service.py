@@ -1,11 +1,15 @@
 from .. import WEEKDAY_MAPPING, get_current_time, get_current_date, TIMEZONE, redis_client
-from ..models import db, Weather, WeatherCalculation, WalkingBus, WalkingBusSchedule
+from ..models import db, WeatherSeries, WeatherCalculation, WalkingBus, WalkingBusSchedule
+from .lease_service import Lease
+from .metrics_service import weather_update_duration
 from datetime import datetime, timedelta, time, timezone
 from flask import current_app as app
 from sqlalchemy.dialects.postgresql import insert as pg_insert
+import numpy as np
 import requests
 import os
 import json
+from time import perf_counter
 
 
 WEATHER_ICON_MAP = {
@@ -126,15 +130,137 @@ WEATHER_ICON_MAP = {
 }
 
 
+class ForecastSeries:
+    """Decoded view of WeatherSeries rows as NumPy arrays, sorted by timestamp"""
+
+    def __init__(self, forecast_type, timestamps, precipitation, pop, icons, fetched_at=None):
+        self.forecast_type = forecast_type
+        self.timestamps = timestamps          # int64 epoch seconds
+        self.precipitation = precipitation    # float32, mm/h (minutely) or mm (hourly/daily)
+        self.pop = pop                        # float32
+        self.icons = icons                    # object array, None for minutely data
+        self.fetched_at = fetched_at
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def empty(cls, forecast_type):
+        return cls(
+            forecast_type,
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=object)
+        )
+
+    @staticmethod
+    def decode_timestamps(start_time, step_seconds, count):
+        """Expand start/step into epoch seconds; whole-day steps follow local wall time (DST)"""
+        if step_seconds % 86400 == 0:
+            start_local = start_time.astimezone(TIMEZONE)
+            return np.array([
+                int((start_local + timedelta(seconds=step_seconds * i)).timestamp())
+                for i in range(count)
+            ], dtype=np.int64)
+        return int(start_time.timestamp()) + np.arange(count, dtype=np.int64) * step_seconds
+
+    @classmethod
+    def from_row(cls, row):
+        count = len(row.pop)
+        timestamps = cls.decode_timestamps(row.start_time, row.step_seconds, count)
+        precipitation = np.asarray(row.precipitation, dtype=np.float32)
+        pop = np.asarray(row.pop, dtype=np.float32)
+        icons = np.empty(count, dtype=object)
+        if row.weather_icons:
+            icons[:] = row.weather_icons
+
+        # NaN marks slots the API did not deliver
+        valid = ~np.isnan(precipitation)
+        return cls(row.forecast_type, timestamps[valid], precipitation[valid],
+                   pop[valid], icons[valid], row.fetched_at)
+
+    @classmethod
+    def merge(cls, forecast_type, series_list):
+        """Combine series ordered oldest fetch first; newer fetches win on equal timestamps"""
+        if not series_list:
+            return cls.empty(forecast_type)
+
+        timestamps = np.concatenate([s.timestamps for s in series_list])
+        precipitation = np.concatenate([s.precipitation for s in series_list])
+        pop = np.concatenate([s.pop for s in series_list])
+        icons = np.concatenate([s.icons for s in series_list])
+
+        # np.unique keeps the first occurrence, so search the reversed arrays
+        _, last_index = np.unique(timestamps[::-1], return_index=True)
+        keep = len(timestamps) - 1 - last_index
+        return cls(forecast_type, timestamps[keep], precipitation[keep], pop[keep],
+                   icons[keep], series_list[-1].fetched_at)
+
+    def window(self, start, end):
+        """Slice of all entries with start <= timestamp <= end"""
+        low = np.searchsorted(self.timestamps, int(start.timestamp()), side='left')
+        high = np.searchsorted(self.timestamps, int(end.timestamp()), side='right')
+        return slice(low, high)
+
+    def index_at(self, moment):
+        """Index of the entry exactly at moment, or None"""
+        index = self.window(moment, moment)
+        return index.start if index.stop > index.start else None
+
+    def datetime_at(self, index):
+        return datetime.fromtimestamp(int(self.timestamps[index]), tz=TIMEZONE)
+
+    def records(self):
+        """Row-like dicts for the debug and database views"""
+        return [{
+            'type': self.forecast_type,
+            'timestamp': self.datetime_at(i),
+            'precipitation': as_float(self.precipitation[i]),
+            'pop': as_float(self.pop[i]),
+            'weather_icon': self.icons[i]
+        } for i in range(len(self))]
+
+
+def as_float(value):
+    """float32 -> Python float without the binary noise (e.g. 0.23000000417)"""
+    return round(float(value), 4)
+
+
 class WeatherService:
     RATE_LIMIT_KEY = "weather_api_last_call"
     RATE_LIMIT_SECONDS = 120
+    UPDATE_LEASE_KEY = "weather_update_lock"
+    UPDATE_LEASE_TTL = 120
+    FORECAST_STEPS = {
+        'minutely': 60,
+        'hourly': 3600,
+        'daily': 86400
+    }
 
     def __init__(self):
         self.api_key = os.environ.get('OPENWEATHER_API_KEY')
         self.lat = os.environ.get('WEATHER_LAT')
         self.lon = os.environ.get('WEATHER_LON')
         self.base_url = "https://api.openweathermap.org/data/3.0/onecall"
+        self._forecasts = {}
+
+    @property
+    def location(self):
+        return f"{self.lat},{self.lon}"
+
+    def get_forecast(self, forecast_type):
+        """Decoded forecast for the configured location, loaded once per service instance"""
+        if forecast_type not in self._forecasts:
+            rows = WeatherSeries.query.filter_by(
+                location=self.location,
+                forecast_type=forecast_type
+            ).order_by(WeatherSeries.fetched_at).all()
+            self._forecasts[forecast_type] = ForecastSeries.merge(
+                forecast_type,
+                [ForecastSeries.from_row(row) for row in rows]
+            )
+        return self._forecasts[forecast_type]
 
     def can_fetch_weather(self):
         """Check if enough time has passed since last API call"""
@@ -184,7 +310,8 @@ class WeatherService:
         redis_client.publish('status_updates', json.dumps({
             "type": "weather_update",
             "timestamp": get_current_time().isoformat(),
-            "status": "success"
+            "status": "success",
+            "published_at": get_current_time().timestamp()
         }))
 
     def fetch_weather_data(self):
@@ -215,7 +342,7 @@ class WeatherService:
     def verify_weather_data_available(self, retries=3, delay=0.5):
         """Verify weather data is available in database with retry mechanism"""
         for attempt in range(retries):
-            count = Weather.query.count()
+            count = WeatherSeries.query.count()
             print(f"[WEATHER][VERIFY] Attempt {attempt + 1}: Found {count} records")
             if count > 0:
                 return True
@@ -223,6 +350,25 @@ class WeatherService:
         return False
 
     def update_weather(self):
+        """Fetch and store weather data; only one update runs at a time (scheduler or manual)"""
+        started = perf_counter()
+        with Lease(self.UPDATE_LEASE_KEY, ttl=self.UPDATE_LEASE_TTL, renew=True) as lease:
+            if not lease.acquired:
+                print("[WEATHER][UPDATE] Update already running elsewhere, skipping")
+                weather_update_duration.observe(perf_counter() - started, result='skipped')
+                return {"success": False, "message": "Weather update already in progress"}
+
+            result = {"success": False}
+            try:
+                result = self._update_weather()
+                return result
+            finally:
+                weather_update_duration.observe(
+                    perf_counter() - started,
+                    result='success' if result.get('success') else 'failed'
+                )
+
+    def _update_weather(self):
         """Main function to fetch and store weather data"""
         print("[WEATHER][UPDATE] Starting weather update process")
         
@@ -244,27 +390,26 @@ class WeatherService:
             if not data:
                 return {"success": False, "message": "No data received from weather API"}
 
-            # Process weather data
-            records_to_save = []
+            # Process weather data into (dt, precipitation, pop, icon) entries per forecast type
+            fetched_at = get_current_time()
+            series_to_save = []
             print(f"[WEATHER][UPDATE] Processing new weather data")
             
             # Process minutely data
             if 'minutely' in data:
-                for minute in data['minutely']:
-                    local_timestamp = datetime.fromtimestamp(minute['dt'], tz=TIMEZONE)
-                    weather = Weather(
-                        timestamp=local_timestamp,
-                        forecast_type='minutely',
-                        precipitation=minute['precipitation'],
-                        pop=1.0 if minute['precipitation'] > 0 else 0.0
-                    )
-                    records_to_save.append(weather)
+                entries = [(
+                    minute['dt'],
+                    minute['precipitation'],
+                    1.0 if minute['precipitation'] > 0 else 0.0,
+                    None
+                ) for minute in data['minutely']]
+                series_to_save.append(self._build_series('minutely', fetched_at, entries))
                 print(f"[WEATHER][UPDATE] Processed {len(data['minutely'])} minutely records")
 
             # Process hourly data
             if 'hourly' in data:
+                entries = []
                 for hour in data['hourly']:
-                    local_timestamp = datetime.fromtimestamp(hour['dt'], tz=TIMEZONE)
                     weather_code = str(hour['weather'][0]['id'])
                     is_night = hour['weather'][0]['icon'].endswith('n')
                     time_of_day = "night" if is_night else "day"
@@ -279,20 +424,14 @@ class WeatherService:
                     total_precipitation = rain + snow
                     pop = 0.0 if total_precipitation == 0 else hour['pop']
 
-                    weather = Weather(
-                        timestamp=local_timestamp,
-                        forecast_type='hourly',
-                        total_precipitation=total_precipitation,
-                        pop=pop,
-                        weather_icon=icon_name
-                    )
-                    records_to_save.append(weather)
+                    entries.append((hour['dt'], total_precipitation, pop, icon_name))
+                series_to_save.append(self._build_series('hourly', fetched_at, entries))
                 print(f"[WEATHER][UPDATE] Processed {len(data['hourly'])} hourly records")
 
             # Process daily data
             if 'daily' in data:
+                entries = []
                 for day in data['daily']:
-                    local_timestamp = datetime.fromtimestamp(day['dt'], tz=TIMEZONE)
                     weather_code = str(day['weather'][0]['id'])
                     icon_name = WEATHER_ICON_MAP['day'].get(weather_code, "clear-day")
 
@@ -301,22 +440,17 @@ class WeatherService:
                     total_precipitation = rain + snow
                     pop = 0.0 if total_precipitation == 0 else day['pop']
 
-                    weather = Weather(
-                        timestamp=local_timestamp,
-                        forecast_type='daily',
-                        total_precipitation=total_precipitation,
-                        pop=pop,
-                        weather_icon=icon_name
-                    )
-                    records_to_save.append(weather)
+                    entries.append((day['dt'], total_precipitation, pop, icon_name))
+                series_to_save.append(self._build_series('daily', fetched_at, entries))
                 print(f"[WEATHER][UPDATE] Processed {len(data['daily'])} daily records")
 
-            # Save weather records
-            if records_to_save:
-                print(f"[WEATHER][UPDATE] Merging {len(records_to_save)} total records")
-                for record in records_to_save:
-                    db.session.merge(record)
+            # Save one row per forecast type
+            series_to_save = [series for series in series_to_save if series is not None]
+            if series_to_save:
+                print(f"[WEATHER][UPDATE] Saving {len(series_to_save)} forecast series")
+                db.session.add_all(series_to_save)
                 db.session.commit()
+                self._forecasts.clear()
                 
                 # Verify database state
                 if self.verify_weather_data_available():
@@ -332,6 +466,40 @@ class WeatherService:
             db.session.rollback()
             return {"success": False, "message": f"Error during update: {str(e)}"}
 
+    def _build_series(self, forecast_type, fetched_at, entries):
+        """Pack (dt, precipitation, pop, icon) entries into a single WeatherSeries row"""
+        if not entries:
+            return None
+
+        step_seconds = self.FORECAST_STEPS[forecast_type]
+        start_dt = entries[0][0]
+        if step_seconds % 86400 == 0:
+            # Daily entries sit at local noon, so UTC spacing varies with DST
+            slots = list(range(len(entries)))
+        else:
+            slots = [(dt - start_dt) // step_seconds for dt, _, _, _ in entries]
+
+        length = slots[-1] + 1
+        precipitation = np.full(length, np.nan, dtype=np.float32)
+        pop = np.full(length, np.nan, dtype=np.float32)
+        icons = [None] * length
+        for slot, (_, slot_precipitation, slot_pop, icon) in zip(slots, entries):
+            precipitation[slot] = slot_precipitation
+            pop[slot] = slot_pop
+            icons[slot] = icon
+
+        return WeatherSeries(
+            location=self.location,
+            fetched_at=fetched_at,
+            forecast_type=forecast_type,
+            start_time=datetime.fromtimestamp(start_dt, tz=TIMEZONE),
+            end_time=datetime.fromtimestamp(entries[-1][0], tz=TIMEZONE),
+            step_seconds=step_seconds,
+            precipitation=precipitation.tolist(),
+            pop=pop.tolist(),
+            weather_icons=icons if forecast_type != 'minutely' else None
+        )
+
     def update_weather_calculations(self):
         """Process and update weather calculations for all walking buses"""
         print(f"[WEATHER][TIME] TIMEZONE setting: {TIMEZONE}")
@@ -353,13 +521,12 @@ class WeatherService:
                 print(f"[WEATHER][TIME] Start time: {schedule.monday_start} ({type(schedule.monday_start)})")
                 print(f"[WEATHER][TIME] End time: {schedule.monday_end} ({type(schedule.monday_end)})")
                 
-                weather_data = Weather.query.filter(
-                    Weather.timestamp >= datetime.now(TIMEZONE).astimezone(timezone.utc)
-                ).order_by(Weather.timestamp).limit(5).all()
+                minutely = self.get_forecast('minutely')
+                upcoming = np.searchsorted(minutely.timestamps, int(get_current_time().timestamp()))
                 
-                print("[WEATHER][TIME] Next 5 weather records:")
-                for record in weather_data:
-                    print(f"[WEATHER][TIME] - {record.timestamp} ({record.forecast_type})")
+                print("[WEATHER][TIME] Next 5 minutely records:")
+                for index in range(upcoming, min(upcoming + 5, len(minutely))):
+                    print(f"[WEATHER][TIME] - {minutely.datetime_at(index)} (minutely)")
 
 
                 current_date = get_current_date()
@@ -416,22 +583,16 @@ class WeatherService:
 
     def _verify_database_state(self):
         """Helper method for database state verification"""
-        current_records = Weather.query.all()
-        verification = {
-            'minutely': [r for r in current_records if r.forecast_type == 'minutely'],
-            'hourly': [r for r in current_records if r.forecast_type == 'hourly'],
-            'daily': [r for r in current_records if r.forecast_type == 'daily']
-        }
-
         print("[WEATHER] Database verification results:")
-        for forecast_type, records in verification.items():
-            print(f"[WEATHER] {forecast_type.capitalize()} records: {len(records)}")
-            if records:
-                latest = records[-1]
-                print(f"[WEATHER] Latest {forecast_type} record: {latest.timestamp}")
-                print(f"[WEATHER] Sample icon: {latest.weather_icon}")
-
-        total_saved = sum(len(records) for records in verification.values())
+        total_saved = 0
+        for forecast_type in self.FORECAST_STEPS:
+            forecast = self.get_forecast(forecast_type)
+            total_saved += len(forecast)
+            print(f"[WEATHER] {forecast_type.capitalize()} records: {len(forecast)}")
+            if len(forecast):
+                print(f"[WEATHER] Latest {forecast_type} record: {forecast.datetime_at(-1)}")
+                print(f"[WEATHER] Sample icon: {forecast.icons[-1]}")
+
         print(f"[WEATHER] Final database record count: {total_saved}")
 
     def _verify_calculations_state(self):
@@ -455,126 +616,13 @@ class WeatherService:
             print(f"[WEATHER CALC] Latest calculation: {latest.date} for bus {latest.walking_bus_id}")
             print(f"[WEATHER CALC] Calculation type: {latest.calculation_type}")
 
-    def process_minutely(self, minutely_data):
-        records = []
-        print(f"[WEATHER][MINUTELY] Processing {len(minutely_data)} records")
-        
-        updated = 0
-        created = 0
-        for minute in minutely_data:
-            local_timestamp = datetime.fromtimestamp(minute['dt'])
-            
-            # Suche existierenden Eintrag
-            existing = Weather.query.filter(
-                Weather.timestamp == local_timestamp,
-                Weather.forecast_type == 'minutely'
-            ).first()
-            
-            if existing:
-                # Update existierenden Eintrag
-                existing.precipitation = minute['precipitation']
-                existing.pop = 1.0 if minute['precipitation'] > 0 else 0.0
-                updated += 1
-            else:
-                # Erstelle neuen Eintrag
-                weather = Weather(
-                    timestamp=local_timestamp,
-                    forecast_type='minutely',
-                    precipitation=minute['precipitation'],
-                    pop=1.0 if minute['precipitation'] > 0 else 0.0
-                )
-                records.append(weather)
-                created += 1
-
-        print(f"[WEATHER][MINUTELY] Completed: {created} created, {updated} updated")
-        return records
-
-    def process_hourly(self, hourly_data):
-        records = []
-        app.logger.info(f"[WEATHER][HOURLY] Processing {len(hourly_data)} records")
-        
-        skipped = 0
-        for hour in hourly_data:
-            local_timestamp = datetime.fromtimestamp(hour['dt'])
-            
-            existing = Weather.query.filter(
-                Weather.timestamp == local_timestamp,
-                Weather.forecast_type == 'hourly'
-            ).first()
-            
-            if existing:
-                skipped += 1
-                continue
-
-            weather_code = str(hour['weather'][0]['id'])
-            is_night = hour['weather'][0]['icon'].endswith('n')
-            time_of_day = "night" if is_night else "day"
-            
-            icon_name = WEATHER_ICON_MAP[time_of_day].get(
-                weather_code,
-                "clear-night" if is_night else "clear-day"
-            )
-
-            rain = hour.get('rain', {}).get('1h', 0)
-            snow = hour.get('snow', {}).get('1h', 0)
-            total_precipitation = rain + snow
-            pop = 0.0 if total_precipitation == 0 else hour['pop']
-
-            weather = Weather(
-                timestamp=local_timestamp,
-                forecast_type='hourly',
-                total_precipitation=total_precipitation,
-                pop=pop,
-                weather_icon=icon_name
-            )
-            records.append(weather)
-
-        app.logger.info(f"[WEATHER][HOURLY] Completed: {len(records)} created, {skipped} skipped")
-        return records
-
-    def process_daily(self, daily_data):
-        records = []
-        app.logger.info(f"[WEATHER][DAILY] Processing {len(daily_data)} records")
-        
-        skipped = 0
-        for day in daily_data:
-            local_timestamp = datetime.fromtimestamp(day['dt'])
-            
-            existing = Weather.query.filter(
-                Weather.timestamp == local_timestamp,
-                Weather.forecast_type == 'daily'
-            ).first()
-            
-            if existing:
-                skipped += 1
-                continue
-            
-            weather_code = str(day['weather'][0]['id'])
-            icon_name = WEATHER_ICON_MAP['day'].get(weather_code, "clear-day")
-
-            rain = day.get('rain', 0)
-            snow = day.get('snow', 0)
-            total_precipitation = rain + snow
-            pop = 0.0 if total_precipitation == 0 else day['pop']
-
-            weather = Weather(
-                timestamp=local_timestamp,
-                forecast_type='daily',
-                total_precipitation=total_precipitation,
-                pop=pop,
-                weather_icon=icon_name
-            )
-            records.append(weather)
-
-        app.logger.info(f"[WEATHER][DAILY] Completed: {len(records)} created, {skipped} skipped")
-        return records
-
     def cleanup_old_records(self):
-        """Remove weather records older than 1 hour"""
+        """Remove forecast series whose last entry is older than 12 hours"""
         cutoff_time = get_current_time() - timedelta(hours=12)
-        deleted_count = Weather.query.filter(Weather.timestamp < cutoff_time).delete()
+        deleted_count = WeatherSeries.query.filter(WeatherSeries.end_time < cutoff_time).delete()
         db.session.commit()
-        app.logger.info(f"[WEATHER][CLEANUP] Removed {deleted_count} weather records older than {cutoff_time}")
+        self._forecasts.clear()
+        app.logger.info(f"[WEATHER][CLEANUP] Removed {deleted_count} weather series ending before {cutoff_time}")
 
     def cleanup_old_calculations(self):
         """Remove outdated weather calculations"""
@@ -585,82 +633,83 @@ class WeatherService:
         db.session.commit()
         print(f"[WEATHER][CLEANUP] Removed {deleted_count} calculations older than {cutoff_date}")
 
+    def _daily_result(self, date, include_details, extra_details=None, timestamp_format='%Y-%m-%d %H:%M'):
+        """1/24 of the daily forecast for date, or None if no daily entry exists"""
+        daily = self.get_forecast('daily')
+        window = daily.window(
+            datetime.combine(date, time(0, 0), tzinfo=TIMEZONE),
+            datetime.combine(date, time(23, 59, 59), tzinfo=TIMEZONE)
+        )
+        if window.stop <= window.start:
+            return None
+
+        index = window.start
+        total_precipitation = as_float(daily.precipitation[index])
+        pop = as_float(daily.pop[index])
+        result = {
+            'icon': daily.icons[index],
+            'pop': pop,
+            'precipitation': round(total_precipitation / 24, 2),
+            'created_at': get_current_time().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+        if include_details:
+            return {
+                'available': True,
+                'date': date.strftime('%Y-%m-%d'),
+                **(extra_details or {}),
+                'calculation_details': {
+                    'coverage_type': 'daily',
+                    'data_type': 'daily',
+                    'daily_used': {
+                        'timestamp': daily.datetime_at(index).strftime(timestamp_format),
+                        'total_precipitation': total_precipitation,
+                        'pop': pop
+                    }
+                },
+                'result': result
+            }
+        return result
+
     def get_weather_for_timeframe(self, date, schedule, include_details=False):
         """Calculate weather data for a specific timeframe with daily fallback"""
         weekday = WEEKDAY_MAPPING[date.weekday()]
         logger = app.logger
         logger.info(f"[WEATHER][TIMEFRAME] Processing {date.strftime('%Y-%m-%d')} ({weekday})")
         
-        is_active = getattr(schedule, weekday, False)
-        if not is_active:
+        if not schedule.is_active_on(date):
             logger.info(f"[WEATHER][TIMEFRAME] Schedule inactive, using daily data")
-            daily_timestamp = datetime.combine(date, time(12, 0), tzinfo=TIMEZONE)
-            daily_record = Weather.query.filter(
-                Weather.timestamp == daily_timestamp,
-                Weather.forecast_type == 'daily'
-            ).first()
-            
-            if daily_record:
+            result = self._daily_result(date, include_details, timestamp_format='%Y-%m-%d')
+            if result:
                 logger.info("[WEATHER][TIMEFRAME] Found daily record for inactive day")
-                # Calculate 1/24 of daily precipitation
-                adjusted_precipitation = daily_record.total_precipitation / 24
-                result = {
-                    'icon': daily_record.weather_icon,
-                    'pop': daily_record.pop,
-                    'precipitation': round(adjusted_precipitation, 2),
-                    'created_at': get_current_time().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                
-                if include_details:
-                    return {
-                        'available': True,
-                        'date': date.strftime('%Y-%m-%d'),
-                        'calculation_details': {
-                            'coverage_type': 'daily',
-                            'data_type': 'daily',
-                            'daily_used': {
-                                'timestamp': daily_record.timestamp.strftime('%Y-%m-%d'),
-                                'total_precipitation': daily_record.total_precipitation,
-                                'pop': daily_record.pop
-                            }
-                        },
-                        'result': result
-                    }
-                return result
-                
-            return None
+            return result
 
-        start_time = getattr(schedule, f"{weekday}_start")
-        end_time = getattr(schedule, f"{weekday}_end")
+        start_time, end_time = schedule.times_for(date.weekday())
         start_datetime = datetime.combine(date, start_time, tzinfo=TIMEZONE)
         end_datetime = datetime.combine(date, end_time, tzinfo=TIMEZONE)
         duration_minutes = int((end_datetime - start_datetime).total_seconds() / 60)
+        time_details = {
+            'startTime': start_time.strftime('%H:%M'),
+            'endTime': end_time.strftime('%H:%M')
+        }
 
         logger.info(f"[WEATHER][TIMEFRAME] Time window: {start_datetime.strftime('%H:%M')} - {end_datetime.strftime('%H:%M')}")
 
-        # Convert local time to UTC for database query
-        start_datetime_utc = start_datetime.astimezone(timezone.utc)
-        end_datetime_utc = end_datetime.astimezone(timezone.utc)
-        
-        minutely_records = Weather.query.filter(
-            Weather.timestamp.between(start_datetime_utc, end_datetime_utc),
-            Weather.forecast_type == 'minutely'
-        ).order_by(Weather.timestamp).all()
+        minutely = self.get_forecast('minutely')
+        hourly = self.get_forecast('hourly')
+        minutely_window = minutely.window(start_datetime, end_datetime)
+        minutely_count = minutely_window.stop - minutely_window.start
 
-        if len(minutely_records) >= duration_minutes:
-            logger.info(f"[WEATHER][TIMEFRAME] Using minutely data ({len(minutely_records)}/{duration_minutes} records)")
+        if minutely_count >= duration_minutes:
+            logger.info(f"[WEATHER][TIMEFRAME] Using minutely data ({minutely_count}/{duration_minutes} records)")
             
-            hourly_start = start_datetime.replace(minute=0)
-            hourly_record = Weather.query.filter(
-                Weather.timestamp == hourly_start,
-                Weather.forecast_type == 'hourly'
-            ).first()
+            precipitation = minutely.precipitation[minutely_window].astype(np.float64)
+            hourly_index = hourly.index_at(start_datetime.replace(minute=0))
             
-            total_precipitation = sum(record.precipitation / 60 for record in minutely_records)
             result = {
-                'icon': hourly_record.weather_icon if hourly_record else None,
-                'pop': max((record.pop for record in minutely_records), default=0),
-                'precipitation': round(total_precipitation, 2),
+                'icon': hourly.icons[hourly_index] if hourly_index is not None else None,
+                'pop': as_float(minutely.pop[minutely_window].max(initial=0)),
+                'precipitation': round(float((precipitation / 60).sum()), 2),
                 'created_at': get_current_time().strftime('%Y-%m-%d %H:%M:%S')
             }
             
@@ -668,16 +717,15 @@ class WeatherService:
                 return {
                     'available': True,
                     'date': date.strftime('%Y-%m-%d'),
-                    'startTime': start_time.strftime('%H:%M'),
-                    'endTime': end_time.strftime('%H:%M'),
+                    **time_details,
                     'calculation_details': {
                         'coverage_type': 'minutely',
                         'data_type': 'minutely',
                         'minutely_used': [{
-                            'timestamp': record.timestamp.replace(tzinfo=timezone.utc).astimezone(TIMEZONE).strftime('%H:%M'),
-                            'precipitation': record.precipitation,
-                            'contribution': record.precipitation / 60
-                        } for record in minutely_records[:duration_minutes]]
+                            'timestamp': minutely.datetime_at(index).strftime('%H:%M'),
+                            'precipitation': as_float(minutely.precipitation[index]),
+                            'contribution': float(minutely.precipitation[index]) / 60
+                        } for index in range(minutely_window.start, minutely_window.start + duration_minutes)]
                     },
                     'result': result
                 }
@@ -685,52 +733,36 @@ class WeatherService:
         else:
             logger.info("[WEATHER][TIMEFRAME] Insufficient minutely data, trying hourly")
 
-        # Convert local time to UTC for hourly query
-        hourly_start_utc = start_datetime.replace(minute=0).astimezone(timezone.utc)
-        hourly_end_utc = (end_datetime.replace(minute=0) + timedelta(hours=1)).astimezone(timezone.utc)
-        
-        hourly_records = Weather.query.filter(
-            Weather.timestamp.between(hourly_start_utc, hourly_end_utc),
-            Weather.forecast_type == 'hourly'
-        ).order_by(Weather.timestamp).all()
-
-        if hourly_records:
-            logger.info(f"[WEATHER][TIMEFRAME] Using hourly data ({len(hourly_records)} records)")
-            max_pop = 0
-            total_precipitation = 0
-            hourly_details = []
-            
-            for record in hourly_records:
-                hour_start = record.timestamp
-                if hour_start.tzinfo is None:
-                    hour_start = hour_start.replace(tzinfo=TIMEZONE)
-                hour_end = hour_start + timedelta(hours=1)
-                
-                if hour_end > start_datetime and hour_start < end_datetime:
-                    overlap_start = max(start_datetime, hour_start)
-                    overlap_end = min(end_datetime, hour_end)
-                    
-                    if overlap_end > overlap_start:
-                        overlap_minutes = int((overlap_end - overlap_start).total_seconds() / 60)
-                        
-                        contribution = 0
-                        if record.total_precipitation:
-                            contribution = record.total_precipitation * (overlap_minutes / 60)
-                            total_precipitation += contribution
-                        
-                        if record.pop > max_pop:
-                            max_pop = record.pop
-                        
-                        hourly_details.append({
-                            'timestamp': record.timestamp.strftime('%H:%M'),
-                            'total_precipitation': record.total_precipitation,
-                            'overlap_minutes': overlap_minutes,
-                            'contribution': contribution,
-                            'pop': record.pop
-                        })
+        hourly_window = hourly.window(
+            start_datetime.replace(minute=0),
+            end_datetime.replace(minute=0) + timedelta(hours=1)
+        )
+
+        if hourly_window.stop > hourly_window.start:
+            logger.info(f"[WEATHER][TIMEFRAME] Using hourly data ({hourly_window.stop - hourly_window.start} records)")
+
+            # Overlap of each forecast hour with the schedule window, in minutes
+            window_start = int(start_datetime.timestamp())
+            window_end = int(end_datetime.timestamp())
+            hour_starts = hourly.timestamps[hourly_window]
+            overlap_minutes = (
+                np.minimum(window_end, hour_starts + 3600) - np.maximum(window_start, hour_starts)
+            ) // 60
+            overlapping = overlap_minutes > 0
+            contributions = hourly.precipitation[hourly_window].astype(np.float64) * (overlap_minutes / 60)
+
+            max_pop = as_float(hourly.pop[hourly_window][overlapping].max(initial=0))
+            total_precipitation = float(contributions[overlapping].sum())
+            hourly_details = [{
+                'timestamp': hourly.datetime_at(hourly_window.start + offset).strftime('%H:%M'),
+                'total_precipitation': as_float(hourly.precipitation[hourly_window.start + offset]),
+                'overlap_minutes': int(overlap_minutes[offset]),
+                'contribution': float(contributions[offset]),
+                'pop': as_float(hourly.pop[hourly_window.start + offset])
+            } for offset in np.flatnonzero(overlapping)]
 
             result = {
-                'icon': hourly_records[0].weather_icon,
+                'icon': hourly.icons[hourly_window.start],
                 'pop': max_pop,
                 'precipitation': round(total_precipitation, 2),
                 'created_at': get_current_time().strftime('%Y-%m-%d %H:%M:%S')
@@ -740,8 +772,7 @@ class WeatherService:
                 return {
                     'available': True,
                     'date': date.strftime('%Y-%m-%d'),
-                    'startTime': start_time.strftime('%H:%M'),
-                    'endTime': end_time.strftime('%H:%M'),
+                    **time_details,
                     'calculation_details': {
                         'coverage_type': 'hourly',
                         'hourly_used': hourly_details,
@@ -752,43 +783,9 @@ class WeatherService:
             return result
 
         logger.info("[WEATHER][TIMEFRAME] No hourly data, falling back to daily")
-        # Search for daily record for the given date (regardless of exact time)
-        date_start = datetime.combine(date, time(0, 0), tzinfo=TIMEZONE)
-        date_end = datetime.combine(date, time(23, 59, 59), tzinfo=TIMEZONE)
-        
-        daily_record = Weather.query.filter(
-            Weather.timestamp.between(date_start, date_end),
-            Weather.forecast_type == 'daily'
-        ).first()
-
-        if daily_record:
+        result = self._daily_result(date, include_details, extra_details=time_details)
+        if result:
             logger.info("[WEATHER][TIMEFRAME] Using daily data as fallback")
-            # Calculate 1/24 of daily precipitation
-            adjusted_precipitation = daily_record.total_precipitation / 24
-            result = {
-                'icon': daily_record.weather_icon,
-                'pop': daily_record.pop,
-                'precipitation': round(adjusted_precipitation, 2),
-                'created_at': get_current_time().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            
-            if include_details:
-                return {
-                    'available': True,
-                    'date': date.strftime('%Y-%m-%d'),
-                    'startTime': start_time.strftime('%H:%M'),
-                    'endTime': end_time.strftime('%H:%M'),
-                    'calculation_details': {
-                        'coverage_type': 'daily',
-                        'data_type': 'daily',
-                        'daily_used': {
-                            'timestamp': daily_record.timestamp.strftime('%Y-%m-%d %H:%M'),
-                            'total_precipitation': daily_record.total_precipitation,
-                            'pop': daily_record.pop
-                        }
-                    },
-                    'result': result
-                }
             return result
 
         logger.warning(f"[WEATHER][TIMEFRAME] No weather data available for {date.strftime('%Y-%m-%d')}")
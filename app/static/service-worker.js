@@ -1,6 +1,13 @@
 const STATIC_CACHE = 'walking-bus-static-v1';
 
-const CACHE_VERSION = 'v35'; // Increment this when you update your service worker
+const CACHE_VERSION = 'v38'; // Increment this when you update your service worker
+
+// Offline outbox for participation changes from notification actions
+const OUTBOX_DB = 'walking-bus-outbox';
+const OUTBOX_STORE = 'participation';
+const OUTBOX_SYNC_TAG = 'participation-outbox';
+// Mutations per replay request to /api/batch (the server accepts up to 500 operations)
+const OUTBOX_BATCH_SIZE = 100;
 
 const URLS_TO_CACHE = [
     '/static/icons/icon-192x192.png',
@@ -31,7 +38,9 @@ self.addEventListener('activate', (event) => {
         Promise.all([
             self.clients.claim(),
             self.registration.navigationPreload?.enable(),
-            checkAndRestoreSubscription()
+            checkAndRestoreSubscription(),
+            // Browsers without Background Sync: retry whenever the worker starts
+            flushOutbox().then(showReplayResult).catch(() => {})
         ])
     );
 });
@@ -88,6 +97,15 @@ self.addEventListener('periodicsync', (event) => {
 });
 
 
+// Background Sync: fired once the device is online again
+self.addEventListener('sync', (event) => {
+    if (event.tag === OUTBOX_SYNC_TAG) {
+        console.log('[SW][OUTBOX] Background sync triggered');
+        event.waitUntil(flushOutbox().then(showReplayResult));
+    }
+});
+
+
 // Push message handler
 self.addEventListener('push', (event) => {
     console.log('[PUSH][START] Received push event', event);
@@ -118,9 +136,13 @@ self.addEventListener('push', (event) => {
     console.log('[PUSH][OPTIONS] Notification options:', options);
 
     event.waitUntil(
-        self.registration.showNotification(payload.title, options)
-            .then(() => console.log('[PUSH][SUCCESS] Notification shown successfully'))
-            .catch(error => console.error('[PUSH][ERROR] Failed to show notification:', error))
+        Promise.all([
+            self.registration.showNotification(payload.title, options)
+                .then(() => console.log('[PUSH][SUCCESS] Notification shown successfully'))
+                .catch(error => console.error('[PUSH][ERROR] Failed to show notification:', error)),
+            // A push means we are online: replay what is still queued
+            flushOutbox().then(showReplayResult).catch(() => {})
+        ])
     );
 });
 
@@ -130,7 +152,7 @@ self.addEventListener('notificationclick', (event) => {
     
     // Handle only toggle_status action
     if (event.action === 'toggle_status') {
-        handleStatusToggle(data);
+        event.waitUntil(handleStatusToggle(data));
     } else if (!event.action) {
         // Only open/focus app when main notification is clicked (no action)
         event.waitUntil(
@@ -153,56 +175,225 @@ async function handleStatusToggle(data) {
     const { participantId, date, participantName, currentStatus: originalStatus } = data;
     const intendedStatus = !originalStatus;
     
+    // Queue first: the change survives a failing connection and repeated toggles coalesce
+    const mutation = await enqueueMutation({
+        participant_id: participantId,
+        date: date,
+        status: intendedStatus,
+        participant_name: participantName
+    });
+
+    let results;
     try {
-        // Get current status first
-        const currentStatusResponse = await fetchWithAuth(`/api/participation/${participantId}/status?date=${date}`);
-        const { status: actualCurrentStatus } = await currentStatusResponse.json();
-        
-        // Only update if current status doesn't match intended status
-        if (actualCurrentStatus !== intendedStatus) {
-            const response = await fetchWithAuth(`/api/participation/${participantId}`, {
-                method: 'PATCH',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
+        results = await flushOutbox();
+    } catch (error) {
+        console.log('[SW][OUTBOX] Offline, change stays queued:', error.message);
+        if (!await registerOutboxSync()) {
+            // No Background Sync: the outbox is flushed on the next worker start or push
+            console.log('[SW][OUTBOX] Background Sync not available');
+        }
+        showStatusNotification(
+            'Änderung gespeichert 📶',
+            `${participantName} wird ${intendedStatus ? 'angemeldet' : 'abgemeldet'}, sobald wieder eine Verbindung besteht.`,
+            `status-change-${participantId}-${date}`
+        );
+        return;
+    }
+
+    const result = results.find(r => r.id === mutation.id);
+    if (result && result.result === 'rejected') {
+        showStatusNotification(
+            'Fehler ⚠️',
+            `Status für ${participantName} konnte nicht geändert werden ⚠️ Bitte Änderung in der App durchführen.`,
+            `status-change-error-${participantId}-${Date.now()}`
+        );
+        return;
+    }
+
+    // Always show the current/intended status
+    showStatusNotification(
+        'Status geändert',
+        `${participantName} ist jetzt: ${intendedStatus ? 'Angemeldet ✅' : 'Abgemeldet ❌'}`,
+        `status-change-${participantId}-${Date.now()}`
+    );
+}
+
+
+function showStatusNotification(title, body, tag) {
+    return self.registration.showNotification(title, {
+        body: body,
+        icon: '/static/icons/icon-192x192.png',
+        badge: '/static/icons/bus-simple-solid.png',
+        tag: tag,
+        requireInteraction: false,
+        renotify: true
+    });
+}
+
+
+function openOutbox() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(OUTBOX_DB, 1);
+        request.onupgradeneeded = () => {
+            // One entry per participant and day ("12:2025-03-14"), later toggles overwrite it
+            request.result.createObjectStore(OUTBOX_STORE, { keyPath: 'key' });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+
+async function outboxTransaction(mode, operation) {
+    const db = await openOutbox();
+    try {
+        return await new Promise((resolve, reject) => {
+            const tx = db.transaction(OUTBOX_STORE, mode);
+            const request = operation(tx.objectStore(OUTBOX_STORE));
+            tx.oncomplete = () => resolve(request?.result);
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    } finally {
+        db.close();
+    }
+}
+
+
+async function enqueueMutation(change) {
+    const mutation = {
+        ...change,
+        key: `${change.participant_id}:${change.date}`,
+        // New id per intent: the server treats a known id as already applied
+        id: self.crypto.randomUUID(),
+        queued_at: Date.now()
+    };
+    await outboxTransaction('readwrite', store => store.put(mutation));
+    console.log('[SW][OUTBOX] Queued mutation', mutation.key, mutation.status);
+    return mutation;
+}
+
+
+async function registerOutboxSync() {
+    if (!('sync' in self.registration)) return false;
+    try {
+        await self.registration.sync.register(OUTBOX_SYNC_TAG);
+        return true;
+    } catch (error) {
+        console.log('[SW][OUTBOX] Could not register sync:', error);
+        return false;
+    }
+}
+
+
+// Sends the queued mutations in chunks; throws if the server could not be reached
+// or failed itself, the mutations not answered yet stay queued then
+async function flushOutbox() {
+    const mutations = await outboxTransaction('readonly', store => store.getAll());
+    if (!mutations || mutations.length === 0) return [];
+
+    const results = [];
+    for (let start = 0; start < mutations.length; start += OUTBOX_BATCH_SIZE) {
+        const chunk = mutations.slice(start, start + OUTBOX_BATCH_SIZE);
+        const chunkResults = await sendOutboxChunk(chunk);
+        await dropAnswered(chunk, chunkResults);
+        results.push(...chunkResults);
+    }
+
+    console.log('[SW][OUTBOX] Replayed mutations:', results);
+    return results.map(result => ({
+        ...result,
+        participant_name: mutations.find(m => m.id === result.id)?.participant_name
+    }));
+}
+
+
+// Sends one chunk as participation operations. A batch refused because of single
+// operations is sent again without them, those are answered as 'rejected'.
+async function sendOutboxChunk(chunk) {
+    const results = [];
+    let pending = chunk;
+    while (pending.length > 0) {
+        let response;
+        try {
+            response = await fetchWithAuth('/api/batch', {
+                method: 'POST',
                 body: JSON.stringify({
-                    date: date,
-                    status: intendedStatus
+                    operations: pending.map(({ id, participant_id, date, status }) => ({
+                        type: 'participation', id, participant_id, date, status
+                    }))
                 })
             });
+        } catch (error) {
+            // Network error: retry later. Expired login: a replay will never succeed
+            if (error.status !== 401) throw error;
+            response = { ok: false, status: 401 };
+        }
+
+        // Server errors and rate limits are temporary
+        if (response.status >= 500 || response.status === 408 || response.status === 429) {
+            throw new Error(`[SW][OUTBOX] Batch failed with status ${response.status}`);
+        }
+        if (response.ok) {
+            const { duplicates = [] } = await response.json();
+            results.push(...pending.map(mutation =>
+                outboxResult(mutation, duplicates.includes(mutation.id) ? 'duplicate' : 'applied')
+            ));
+            break;
+        }
 
-            if (response.ok) {
-                await fetchWithAuth('/api/trigger-update', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({ date: date })
-                });
-            } else {
-                throw new Error('Status update failed');
-            }
+        const body = response.status === 400 ? await response.json().catch(() => ({})) : {};
+        const invalid = new Set((body.errors || []).map(e => e.index).filter(index => index !== null));
+        console.log('[SW][OUTBOX] Batch rejected with status', response.status, body.errors);
+        if (invalid.size === 0) {
+            results.push(...pending.map(mutation => outboxResult(mutation, 'rejected')));
+            break;
         }
+        results.push(...pending.filter((_, index) => invalid.has(index)).map(mutation => outboxResult(mutation, 'rejected')));
+        pending = pending.filter((_, index) => !invalid.has(index));
+    }
+    return results;
+}
 
-        // Always show the current/intended status
-        self.registration.showNotification('Status geändert', {
-            body: `${participantName} ist jetzt: ${intendedStatus ? 'Angemeldet ✅' : 'Abgemeldet ❌'}`,
-            icon: '/static/icons/icon-192x192.png',
-            badge: '/static/icons/bus-simple-solid.png',
-            tag: `status-change-${participantId}-${Date.now()}`,
-            requireInteraction: false,
-            renotify: true
-        });
-        
-    } catch (error) {
-        self.registration.showNotification('Fehler ⚠️', {
-            body: `Status für ${participantName} konnte nicht geändert werden ⚠️ Bitte Änderung in der App durchführen.`,
-            icon: '/static/icons/icon-192x192.png',
-            badge: '/static/icons/bus-simple-solid.png',
-            tag: `status-change-error-${participantId}-${Date.now()}`,
-            requireInteraction: false,
-            renotify: true
+
+function outboxResult({ id, participant_id, date, status }, result) {
+    return { id, participant_id, date, status, result };
+}
+
+
+// Drop answered mutations, unless a newer toggle replaced the entry in the meantime
+async function dropAnswered(mutations, results) {
+    const answered = new Set(results.map(r => r.id));
+    await outboxTransaction('readwrite', store => {
+        mutations.forEach(mutation => {
+            if (!answered.has(mutation.id)) return;
+            const request = store.get(mutation.key);
+            request.onsuccess = () => {
+                if (request.result && request.result.id === mutation.id) {
+                    store.delete(mutation.key);
+                }
+            };
         });
+    });
+}
+
+
+function showReplayResult(results) {
+    if (!results || results.length === 0) return;
+    const applied = results.filter(r => r.result === 'applied' || r.result === 'duplicate');
+    const rejected = results.filter(r => r.result === 'rejected');
+
+    if (applied.length > 0) {
+        const names = applied.map(r => `${r.participant_name} ${r.status ? '✅' : '❌'}`).join(', ');
+        showStatusNotification('Status geändert', `Nachgetragen: ${names}`, `status-replay-${Date.now()}`);
+    }
+    if (rejected.length > 0) {
+        const names = rejected.map(r => r.participant_name).join(', ');
+        showStatusNotification(
+            'Fehler ⚠️',
+            `Status für ${names} konnte nicht geändert werden ⚠️ Bitte Änderung in der App durchführen.`,
+            `status-replay-error-${Date.now()}`
+        );
     }
 }
 
@@ -230,7 +421,9 @@ async function fetchWithAuth(url, options = {}) {
                 status: 401
             });
         });
-        throw new Error('[SW][FETCH] Authentication failed');
+        const error = new Error('[SW][FETCH] Authentication failed');
+        error.status = 401;
+        throw error;
     }
 
     return response;
@@ -0,0 +1,129 @@
+"""
+Concurrent request throughput of one gevent worker, with and without
+cooperative psycopg2 and the tuned connection pool.
+
+Every simulated request checks out a session, runs a query that takes
+--query-ms on the server (pg_sleep) and releases the session again, just
+like a request handler. A probe greenlet measures how long the hub is
+blocked meanwhile.
+
+    DATABASE_URL=postgresql://... python benchmarks/gevent_db.py --concurrency 200 --requests 2000
+
+Each mode runs in its own process, since the wait callback is global.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_mode(mode, concurrency, requests, query_ms):
+    from gevent import monkey
+    monkey.patch_all()
+
+    import gevent
+    import time
+    from gevent.pool import Pool
+
+    sys.path.insert(0, ROOT)
+    from app import create_app, db, enable_gevent_psycopg2
+    from sqlalchemy import text
+
+    if mode == 'cooperative':
+        enable_gevent_psycopg2()
+    else:
+        # Behaviour before: SQLAlchemy defaults (pool of 5 + 10 overflow, no pre-ping)
+        os.environ.update(DB_POOL_SIZE='5', DB_MAX_OVERFLOW='10', DB_POOL_PRE_PING='false')
+
+    app = create_app()
+    engine_options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+
+    latencies = []
+    stalls = []
+    errors = 0
+    running = True
+
+    def request():
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                db.session.execute(text('SELECT pg_sleep(:s)'), {'s': query_ms / 1000})
+                db.session.remove()
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    def probe():
+        # A cooperative hub wakes this up every 10ms
+        while running:
+            before = time.perf_counter()
+            gevent.sleep(0.01)
+            stalls.append(time.perf_counter() - before - 0.01)
+
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+
+    probe_greenlet = gevent.spawn(probe)
+    pool = Pool(concurrency)
+    started = time.perf_counter()
+    for _ in range(requests):
+        pool.spawn(request)
+    pool.join()
+    elapsed = time.perf_counter() - started
+    running = False
+    probe_greenlet.join()
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'engine_options': engine_options,
+        'requests': requests,
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(requests / elapsed, 1),
+        'latency_p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+        'latency_p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+        'max_hub_stall_ms': round(max(stalls, default=0) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=200, help='Concurrent greenlets (cf. worker_connections)')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--query-ms', type=int, default=50, help='Server-side duration of each query')
+    parser.add_argument('--mode', choices=['blocking', 'cooperative'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.concurrency, args.requests, args.query_ms)))
+        return
+
+    results = []
+    for mode in ('blocking', 'cooperative'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode,
+             '--concurrency', str(args.concurrency),
+             '--requests', str(args.requests),
+             '--query-ms', str(args.query_ms)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'Modus':<12} {'Req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'Hub-Stall ms':>13} {'Fehler':>7}")
+    for result in results:
+        print(
+            f"{result['mode']:<12} {result['requests_per_second']:>8} {result['latency_p50_ms']:>8} "
+            f"{result['latency_p95_ms']:>8} {result['max_hub_stall_ms']:>13} {result['errors']:>7}"
+        )
+    for result in results:
+        print(f"{result['mode']}: engine options {result['engine_options']}")
+
+
+if __name__ == '__main__':
+    main()
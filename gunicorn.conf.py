@@ -1,6 +1,10 @@
 from gevent import monkey
 monkey.patch_all()
 
+# Cooperative psycopg2, inherited by every forked worker
+from app import enable_gevent_psycopg2
+enable_gevent_psycopg2()
+
 # Gunicorn configuration
 worker_class = 'gevent'
 workers = 4
@@ -11,6 +15,13 @@ keepalive = 5
 worker_connections = 1000
 timeout = 300
 
+# The app is preloaded in the master: every worker opens its own DB connections
+def post_fork(server, worker):
+    from app import db
+    flask_app = server.app.wsgi()
+    with flask_app.app_context():
+        db.engine.dispose(close=False)
+
 # Logging configuration
 loglevel = "warning" # info oder warning
 accesslog = "-"
@@ -0,0 +1,39 @@
+"""One calendar_status row per participant and day
+
+Revision ID: 3c9e71d2a5b8
+Revises: efcf694dd477
+Create Date: 2026-10-19 12:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e71d2a5b8'
+down_revision = 'efcf694dd477'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Concurrent toggles could create duplicates; keep the newest row of each day
+    op.execute("""
+        DELETE FROM calendar_status
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY participant_id, date ORDER BY id DESC
+                ) AS duplicate
+                FROM calendar_status
+            ) ranked
+            WHERE duplicate > 1
+        )
+    """)
+
+    with op.batch_alter_table('calendar_status', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_calendar_status_participant_date', ['participant_id', 'date'])
+
+
+def downgrade():
+    with op.batch_alter_table('calendar_status', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_calendar_status_participant_date', type_='unique')
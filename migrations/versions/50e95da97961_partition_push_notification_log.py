@@ -0,0 +1,109 @@
+"""Range-partition push_notification_log by month
+
+Revision ID: 50e95da97961
+Revises: bb0e38e7415b
+Create Date: 2025-07-21 08:45:27.104392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import date
+
+# revision identifiers, used by Alembic.
+revision = '50e95da97961'
+down_revision = 'bb0e38e7415b'
+branch_labels = None
+depends_on = None
+
+TABLE = 'push_notification_log'
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    op.rename_table(TABLE, f'{TABLE}_old')
+    op.execute(f'ALTER INDEX IF EXISTS ix_{TABLE}_timestamp_id RENAME TO ix_{TABLE}_old_timestamp_id')
+    op.execute(f'ALTER INDEX IF EXISTS ix_{TABLE}_bus_timestamp RENAME TO ix_{TABLE}_old_bus_timestamp')
+    op.execute(f'ALTER SEQUENCE IF EXISTS {TABLE}_id_seq RENAME TO {TABLE}_old_id_seq')
+
+    op.create_table(TABLE,
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('walking_bus_id', sa.Integer(), nullable=False),
+    sa.Column('subscription_id', sa.Integer(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('error_message', sa.String(length=500), nullable=True),
+    sa.Column('notification_type', sa.String(length=50), nullable=True),
+    sa.Column('notification_data', sa.JSON(), nullable=True),
+    sa.Column('success', sa.Boolean(), nullable=True),
+    sa.Column('subscription_deleted_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['subscription_id'], ['push_subscription.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['walking_bus_id'], ['walking_bus.id'], ),
+    sa.PrimaryKeyConstraint('id', 'timestamp'),
+    postgresql_partition_by='RANGE (timestamp)'
+    )
+    op.create_index('ix_push_notification_log_timestamp_id', TABLE, ['timestamp', 'id'], unique=False)
+    op.create_index('ix_push_notification_log_bus_timestamp', TABLE, ['walking_bus_id', 'timestamp'], unique=False)
+
+    # Monthly partitions from the oldest kept row up to two months ahead, plus a safety net
+    oldest = conn.execute(sa.text(f'SELECT MIN("timestamp") FROM {TABLE}_old')).scalar()
+    today = date.today()
+    month = date(oldest.year, oldest.month, 1) if oldest else date(today.year, today.month, 1)
+    last = next_month(next_month(date(today.year, today.month, 1)))
+    while month <= last:
+        op.execute(
+            f'CREATE TABLE {TABLE}_y{month.year:04d}m{month.month:02d} PARTITION OF {TABLE} '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+        )
+        month = next_month(month)
+    op.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+    op.execute(f"""
+        INSERT INTO {TABLE} (id, walking_bus_id, subscription_id, "timestamp", status_code, error_message,
+                             notification_type, notification_data, success, subscription_deleted_at)
+        SELECT id, walking_bus_id, subscription_id, COALESCE("timestamp", NOW()), status_code, error_message,
+               notification_type, notification_data, success, subscription_deleted_at
+        FROM {TABLE}_old
+    """)
+    op.execute(f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)")
+    op.drop_table(f'{TABLE}_old')
+
+
+def downgrade():
+    op.rename_table(TABLE, f'{TABLE}_partitioned')
+    op.execute(f'ALTER INDEX IF EXISTS ix_{TABLE}_timestamp_id RENAME TO ix_{TABLE}_partitioned_timestamp_id')
+    op.execute(f'ALTER INDEX IF EXISTS ix_{TABLE}_bus_timestamp RENAME TO ix_{TABLE}_partitioned_bus_timestamp')
+    op.execute(f'ALTER SEQUENCE IF EXISTS {TABLE}_id_seq RENAME TO {TABLE}_partitioned_id_seq')
+
+    op.create_table(TABLE,
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('walking_bus_id', sa.Integer(), nullable=False),
+    sa.Column('subscription_id', sa.Integer(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('error_message', sa.String(length=500), nullable=True),
+    sa.Column('notification_type', sa.String(length=50), nullable=True),
+    sa.Column('notification_data', sa.JSON(), nullable=True),
+    sa.Column('success', sa.Boolean(), nullable=True),
+    sa.Column('subscription_deleted_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['subscription_id'], ['push_subscription.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['walking_bus_id'], ['walking_bus.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_push_notification_log_timestamp_id', TABLE, ['timestamp', 'id'], unique=False)
+    op.create_index('ix_push_notification_log_bus_timestamp', TABLE, ['walking_bus_id', 'timestamp'], unique=False)
+
+    # Explicit columns: the partitioned table may have a different column order
+    op.execute(f"""
+        INSERT INTO {TABLE} (id, walking_bus_id, subscription_id, "timestamp", status_code, error_message,
+                             notification_type, notification_data, success, subscription_deleted_at)
+        SELECT id, walking_bus_id, subscription_id, "timestamp", status_code, error_message,
+               notification_type, notification_data, success, subscription_deleted_at
+        FROM {TABLE}_partitioned
+    """)
+    op.execute(f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)")
+    op.drop_table(f'{TABLE}_partitioned')
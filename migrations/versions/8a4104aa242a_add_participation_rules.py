@@ -0,0 +1,121 @@
+"""Add participation rules, keep only real overrides in calendar_status
+
+Revision ID: 8a4104aa242a
+Revises: f2bf06fe9975
+Create Date: 2025-07-16 10:04:51.662310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8a4104aa242a'
+down_revision = 'f2bf06fe9975'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('participation_rule',
+    sa.Column('walking_bus_id', sa.Integer(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('participant_id', sa.Integer(), nullable=False),
+    sa.Column('weekday_mask', sa.SmallInteger(), nullable=False),
+    sa.Column('valid_from', sa.Date(), nullable=False),
+    sa.Column('valid_until', sa.Date(), nullable=True),
+    sa.ForeignKeyConstraint(['participant_id'], ['participant.id'], ),
+    sa.ForeignKeyConstraint(['walking_bus_id'], ['walking_bus.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('participation_rule', schema=None) as batch_op:
+        batch_op.create_index('ix_participation_rule_bus', ['walking_bus_id'], unique=False)
+        batch_op.create_index('ix_participation_rule_participant_from', ['participant_id', 'valid_from'], unique=False)
+
+    with op.batch_alter_table('calendar_status', schema=None) as batch_op:
+        batch_op.create_index('ix_calendar_status_bus_date', ['walking_bus_id', 'date'], unique=False)
+
+    # One open rule per participant from the current weekday settings
+    op.execute("""
+        INSERT INTO participation_rule (walking_bus_id, participant_id, weekday_mask, valid_from, valid_until)
+        SELECT walking_bus_id, id,
+               (CASE WHEN COALESCE(monday, TRUE) THEN 1 ELSE 0 END)
+             | (CASE WHEN COALESCE(tuesday, TRUE) THEN 2 ELSE 0 END)
+             | (CASE WHEN COALESCE(wednesday, TRUE) THEN 4 ELSE 0 END)
+             | (CASE WHEN COALESCE(thursday, TRUE) THEN 8 ELSE 0 END)
+             | (CASE WHEN COALESCE(friday, TRUE) THEN 16 ELSE 0 END)
+             | (CASE WHEN COALESCE(saturday, TRUE) THEN 32 ELSE 0 END)
+             | (CASE WHEN COALESCE(sunday, TRUE) THEN 64 ELSE 0 END),
+               CURRENT_DATE, NULL
+        FROM participant
+    """)
+
+    # Closed rule for the history, so past days do not follow later weekday changes
+    op.execute("""
+        INSERT INTO participation_rule (walking_bus_id, participant_id, weekday_mask, valid_from, valid_until)
+        SELECT participant.walking_bus_id, participant.id,
+               (CASE WHEN COALESCE(participant.monday, TRUE) THEN 1 ELSE 0 END)
+             | (CASE WHEN COALESCE(participant.tuesday, TRUE) THEN 2 ELSE 0 END)
+             | (CASE WHEN COALESCE(participant.wednesday, TRUE) THEN 4 ELSE 0 END)
+             | (CASE WHEN COALESCE(participant.thursday, TRUE) THEN 8 ELSE 0 END)
+             | (CASE WHEN COALESCE(participant.friday, TRUE) THEN 16 ELSE 0 END)
+             | (CASE WHEN COALESCE(participant.saturday, TRUE) THEN 32 ELSE 0 END)
+             | (CASE WHEN COALESCE(participant.sunday, TRUE) THEN 64 ELSE 0 END),
+               history.first_day, CURRENT_DATE - 1
+        FROM participant
+        JOIN (
+            SELECT participant_id, MIN(date) AS first_day
+            FROM calendar_status
+            WHERE date < CURRENT_DATE
+            GROUP BY participant_id
+        ) history ON history.participant_id = participant.id
+    """)
+
+    # Past days that deviated from that rule keep their status as override
+    op.execute("""
+        UPDATE calendar_status
+        SET is_manual_override = TRUE
+        FROM participation_rule rule
+        WHERE rule.participant_id = calendar_status.participant_id
+          AND rule.valid_until = CURRENT_DATE - 1
+          AND calendar_status.date < CURRENT_DATE
+          AND calendar_status.is_manual_override IS NOT TRUE
+          AND calendar_status.status IS DISTINCT FROM
+              ((rule.weekday_mask >> (EXTRACT(ISODOW FROM calendar_status.date)::int - 1)) & 1 = 1)
+    """)
+
+    # Materialized defaults are covered by the rules now, only overrides and attendance stay
+    op.execute("""
+        DELETE FROM calendar_status
+        WHERE is_manual_override IS NOT TRUE AND attendance IS NOT TRUE
+    """)
+
+
+def downgrade():
+    # Materialize the defaults again from the rules: every day a rule covers, up to four
+    # weeks ahead for open rules (the calendar window). The history rule of the upgrade
+    # brings back the past rows, deviating past days are still there as overrides.
+    op.execute("""
+        INSERT INTO calendar_status (walking_bus_id, participant_id, date, status, is_manual_override, attendance)
+        SELECT rule.walking_bus_id, rule.participant_id, day::date,
+               (rule.weekday_mask >> (EXTRACT(ISODOW FROM day)::int - 1)) & 1 = 1,
+               FALSE, FALSE
+        FROM participation_rule rule
+        CROSS JOIN LATERAL generate_series(
+            rule.valid_from::timestamp,
+            COALESCE(rule.valid_until, CURRENT_DATE + 27)::timestamp,
+            interval '1 day'
+        ) AS day
+        WHERE NOT EXISTS (
+            SELECT 1 FROM calendar_status existing
+            WHERE existing.participant_id = rule.participant_id AND existing.date = day::date
+        )
+    """)
+
+    with op.batch_alter_table('calendar_status', schema=None) as batch_op:
+        batch_op.drop_index('ix_calendar_status_bus_date')
+
+    with op.batch_alter_table('participation_rule', schema=None) as batch_op:
+        batch_op.drop_index('ix_participation_rule_participant_from')
+        batch_op.drop_index('ix_participation_rule_bus')
+
+    op.drop_table('participation_rule')
@@ -0,0 +1,41 @@
+"""Add push_delivery_stats rollup
+
+Revision ID: ad9be01493d7
+Revises: 50e95da97961
+Create Date: 2025-07-22 10:12:04.581937
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'ad9be01493d7'
+down_revision = '50e95da97961'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Starts empty: the raw logs only cover the retention window anyway
+    op.create_table('push_delivery_stats',
+    sa.Column('walking_bus_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('notification_type', sa.String(length=50), nullable=False),
+    sa.Column('platform', sa.String(length=20), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=False),
+    sa.Column('sent', sa.Integer(), nullable=False),
+    sa.Column('succeeded', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('paused', sa.Integer(), nullable=False),
+    sa.Column('latency_sum_ms', sa.BigInteger(), nullable=False),
+    sa.Column('latency_histogram', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.ForeignKeyConstraint(['walking_bus_id'], ['walking_bus.id'], ),
+    sa.PrimaryKeyConstraint('walking_bus_id', 'day', 'notification_type', 'platform', 'status_code')
+    )
+    op.create_index('ix_push_delivery_stats_day', 'push_delivery_stats', ['day'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_push_delivery_stats_day', table_name='push_delivery_stats')
+    op.drop_table('push_delivery_stats')
@@ -0,0 +1,26 @@
+"""Index push_notification_log for keyset pagination and per-bus aggregates
+
+Revision ID: bb0e38e7415b
+Revises: f6cbba19ad50
+Create Date: 2025-07-18 14:37:02.915844
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'bb0e38e7415b'
+down_revision = 'f6cbba19ad50'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('push_notification_log', schema=None) as batch_op:
+        batch_op.create_index('ix_push_notification_log_timestamp_id', ['timestamp', 'id'], unique=False)
+        batch_op.create_index('ix_push_notification_log_bus_timestamp', ['walking_bus_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('push_notification_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_push_notification_log_bus_timestamp')
+        batch_op.drop_index('ix_push_notification_log_timestamp_id')
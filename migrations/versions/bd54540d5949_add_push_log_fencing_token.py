@@ -0,0 +1,24 @@
+"""Add fencing_token to push_notification_log
+
+Revision ID: bd54540d5949
+Revises: ad9be01493d7
+Create Date: 2025-07-23 14:27:51.309846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'bd54540d5949'
+down_revision = 'ad9be01493d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Added on the partitioned parent, Postgres propagates it to all partitions
+    op.add_column('push_notification_log', sa.Column('fencing_token', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('push_notification_log', 'fencing_token')
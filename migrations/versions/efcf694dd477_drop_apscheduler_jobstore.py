@@ -0,0 +1,29 @@
+"""Drop the APScheduler job store table, reminder jobs are derived in memory
+
+Revision ID: efcf694dd477
+Revises: bd54540d5949
+Create Date: 2025-07-24 09:05:38.772190
+
+"""
+from alembic import op
+from sqlalchemy.engine.reflection import Inspector
+
+# revision identifiers, used by Alembic.
+revision = 'efcf694dd477'
+down_revision = 'bd54540d5949'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Created at runtime by SQLAlchemyJobStore, so it may not exist
+    connection = op.get_bind()
+    inspector = Inspector.from_engine(connection)
+
+    if 'apscheduler_jobs' in inspector.get_table_names():
+        op.drop_table('apscheduler_jobs')
+
+
+def downgrade():
+    # SQLAlchemyJobStore recreates its table on startup
+    pass
@@ -0,0 +1,31 @@
+"""Add subdivision to school_holidays
+
+Revision ID: f2bf06fe9975
+Revises: f596ad6c09ad
+Create Date: 2025-07-15 08:12:05.301877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f2bf06fe9975'
+down_revision = 'f596ad6c09ad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fixed default for existing rows; the holiday refresh on scheduler start
+    # refetches the configured subdivisions (validated in holiday_service)
+    with op.batch_alter_table('school_holidays', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('subdivision', sa.String(length=10), nullable=False,
+                                      server_default='DE-NW'))
+        batch_op.alter_column('subdivision', server_default=None)
+        batch_op.create_index('ix_school_holidays_subdivision_start', ['subdivision', 'start_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('school_holidays', schema=None) as batch_op:
+        batch_op.drop_index('ix_school_holidays_subdivision_start')
+        batch_op.drop_column('subdivision')
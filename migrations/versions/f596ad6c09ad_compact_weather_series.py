@@ -0,0 +1,52 @@
+"""Replace weather rows with compact weather_series arrays
+
+Revision ID: f596ad6c09ad
+Revises: 1020c31b169b
+Create Date: 2025-07-14 09:31:42.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'f596ad6c09ad'
+down_revision = '1020c31b169b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('weather_series',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('location', sa.String(length=50), nullable=False),
+    sa.Column('fetched_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('forecast_type', sa.String(length=10), nullable=False),
+    sa.Column('start_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('end_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('step_seconds', sa.Integer(), nullable=False),
+    sa.Column('precipitation', postgresql.ARRAY(postgresql.REAL()), nullable=False),
+    sa.Column('pop', postgresql.ARRAY(postgresql.REAL()), nullable=False),
+    sa.Column('weather_icons', postgresql.ARRAY(sa.String(length=50)), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('location', 'forecast_type', 'fetched_at', name='uq_weather_series_fetch')
+    )
+    op.create_index('ix_weather_series_end_time', 'weather_series', ['end_time'], unique=False)
+
+    # Forecast rows are refetched on the next update, nothing worth converting
+    op.drop_table('weather')
+
+
+def downgrade():
+    op.create_table('weather',
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('forecast_type', sa.String(length=10), nullable=False),
+    sa.Column('precipitation', sa.Float(), nullable=True),
+    sa.Column('total_precipitation', sa.Float(), nullable=True),
+    sa.Column('pop', sa.Float(), nullable=True),
+    sa.Column('weather_icon', sa.String(length=50), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('timestamp', 'forecast_type')
+    )
+    op.drop_index('ix_weather_series_end_time', table_name='weather_series')
+    op.drop_table('weather_series')
@@ -0,0 +1,55 @@
+"""Replace weekday boolean columns with 7-bit weekday masks
+
+Revision ID: f6cbba19ad50
+Revises: 8a4104aa242a
+Create Date: 2025-07-17 09:22:13.480561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f6cbba19ad50'
+down_revision = '8a4104aa242a'
+branch_labels = None
+depends_on = None
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def mask_expression(default):
+    return ' | '.join(
+        f"(CASE WHEN COALESCE({day}, {default}) THEN {1 << index} ELSE 0 END)"
+        for index, day in enumerate(WEEKDAYS)
+    )
+
+
+def upgrade():
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('weekday_mask', sa.SmallInteger(), nullable=True))
+    op.execute(f"UPDATE participant SET weekday_mask = {mask_expression('TRUE')}")
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.alter_column('weekday_mask', existing_type=sa.SmallInteger(), nullable=False)
+        for day in WEEKDAYS:
+            batch_op.drop_column(day)
+
+    with op.batch_alter_table('walking_bus_schedule', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('weekday_mask', sa.SmallInteger(), nullable=True))
+    op.execute(f"UPDATE walking_bus_schedule SET weekday_mask = {mask_expression('FALSE')}")
+    with op.batch_alter_table('walking_bus_schedule', schema=None) as batch_op:
+        batch_op.alter_column('weekday_mask', existing_type=sa.SmallInteger(), nullable=False)
+        for day in WEEKDAYS:
+            batch_op.drop_column(day)
+
+
+def downgrade():
+    for table in ('participant', 'walking_bus_schedule'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for day in WEEKDAYS:
+                batch_op.add_column(sa.Column(day, sa.Boolean(), nullable=True))
+        op.execute(
+            f"UPDATE {table} SET "
+            + ', '.join(f"{day} = (weekday_mask & {1 << index}) <> 0" for index, day in enumerate(WEEKDAYS))
+        )
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('weekday_mask')